@@ -13,6 +13,11 @@ import glob
 import subprocess
 import asyncio
 import shutil
+import uuid
+import inspect
+from collections import namedtuple
+from functools import partial
+from concurrent.futures import Future
 from flask import Flask, request, jsonify, send_from_directory
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit
@@ -22,6 +27,9 @@ try:
 except ImportError:
     print("Instance warm-up: edge-tts not found yet")
 
+from utils.config import get_setting
+from utils.seeds import resolve_seeds
+
 # Import custom services
 try:
     from services.cache_service import get_cache_service
@@ -29,6 +37,24 @@ try:
     from services.liveportrait_service import get_liveportrait_service
     from services.subtitle_service import get_subtitle_service
     from services.style_service import get_style_service
+    from services.worker_pool import get_worker_pool, Stage, GPU_LANE, CPU_LANE
+    from services.job_store import get_job_store
+    from services.vram_manager import get_vram_manager
+    from services.prefetcher import ModelPrefetcher
+    from services.batcher import MicroBatcher
+    from services.embedding_cache import get_embedding_cache
+    from services.model_loader import build_lightning_pipeline, PhaseTimer, SDXL_BASE
+    from services.model_snapshot import load_snapshot, save_snapshot, snapshot_name
+    from services.preview_service import get_latent_previewer
+    from services.image_output import get_image_output_service, encode_image, decode_image, decode_base64, OutputSpec
+    from services.cascade import SDXL_BUCKETS, plan_cascade
+    from services.memory_planner import plan_execution, max_batch_size, apply_plan as apply_memory_plan
+    from services.latent_store import get_latent_store, LatentStore, LatentEntry
+    from services.lora_service import get_lora_manager, normalize_adapters
+    from services.inpaint import mask_bbox, crop_region, feather_mask, paste_region
+    from services.controlnet import get_control_map_cache
+    from services.cpu_backend import resolve_backend, get_cpu_model_host, prepare_pipeline as prepare_cpu_pipeline
+    from services.generation_spec import GenerationSpec, model_fingerprint
     from middleware.rate_limiter import get_rate_limiter, rate_limit
     from middleware.auth import require_auth, generate_token
     from utils.logger import logger
@@ -54,6 +80,28 @@ socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
 def serve_files(filename):
     return send_from_directory('data', filename)
 
+@app.route('/files/images/<name>')
+def serve_image_file(name):
+    """Content-addressed images: the name is the hash of the bytes, so they never change."""
+    response = send_from_directory(os.path.abspath(get_image_output_service().files_dir), name, max_age=31536000)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+def image_response(spec, rendered, **fields):
+    """Builds the negotiated response: raw image body, JSON with a /files URL or legacy base64 JSON."""
+    if spec.mode == 'binary':
+        response = app.response_class(rendered.data, mimetype=rendered.mimetype)
+        for name, value in fields.items():
+            response.headers[f"X-{name.replace('_', '-').title()}"] = str(value)
+        return response
+    if spec.mode == 'url':
+        return jsonify({"status": "success", "url": rendered.url, "format": rendered.format, **fields})
+    return jsonify({"status": "success", "image": rendered.data_uri(), **fields})
+
+def render_image(spec, **kwargs):
+    """Encodes on the CPU lane so request threads don't hold the GIL on PNG/WebP compression."""
+    return get_worker_pool().submit(CPU_LANE, get_image_output_service().render, spec, **kwargs).result()
+
 @app.route('/', methods=['GET'])
 def health_check():
     """Health check endpoint for frontend connection verification."""
@@ -123,24 +171,25 @@ def verify_file_integrity(file_path, min_size_mb=100):
         return False
     return True
 
-# Job Queue
+# Job Queue (state lives in the persistent SQLite job store)
 job_queue = queue.Queue()
-jobs_status = {}
+job_store = get_job_store()
 
-# VRAM Manager (T4 Optimization)
-loaded_models = {}
+def update_job(job_id, status, **fields):
+    """Persists a job update and pushes it to clients."""
+    job_store.update(job_id, status, **fields)
+    socketio.emit('job_update', {"job_id": job_id, "status": status, **fields})
 
-def offload_models(except_model=None):
-    """Offloads all models to CPU to free up VRAM for the next task."""
-    import torch
-    global loaded_models
-    for name, model in loaded_models.items():
-        if name != except_model and model is not None:
-            print(f"[*] Offloading {name} to CPU...")
-            try:
-                model.to("cpu")
-            except: pass
-    torch.cuda.empty_cache()
+# Execution backend: 'cuda', 'cpu' (no GPU, e.g. when the Colab quota runs out) or None
+EXECUTION_DEVICE = resolve_backend(get_setting("execution.backend", "auto"))
+CPU_DTYPE = get_setting("execution.cpu.dtype", "bf16")
+
+# VRAM Manager (T4 Optimization): keeps every model that fits the budget resident, evicts LRU.
+# On the CPU backend a RAM-resident host with the same interface replaces it.
+vram_manager = get_cpu_model_host() if EXECUTION_DEVICE == 'cpu' else get_vram_manager()
+vram_manager.start_idle_sweeper()
+loaded_models = vram_manager.entries
+get_worker_pool().scheduler.set_residency_check(vram_manager.is_resident)
 
 # Global Models
 pipe_image = None
@@ -149,44 +198,66 @@ whisper_model = None
 # Models Directory
 MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
 
+# MODEL SELECTION: Check for Juggernaut XL (Fooocus) first for Super Quality
+FOOOCUS_CKPT = "/content/Fooocus/models/checkpoints/juggernautXL_v8Rundiffusion.safetensors"
+LIGHTNING_CKPT = os.path.join(MODELS_DIR, "unet", "sdxl_lightning_4step_unet.safetensors")
+
+def resolve_sdxl_checkpoint():
+    """Returns (checkpoint_path, is_lightning) without loading anything."""
+    # On CPU the 4-step Lightning UNet is the default: Juggernaut's 30 steps would take minutes
+    cpu_lightning = EXECUTION_DEVICE == 'cpu' and get_setting("execution.cpu.lightning", True)
+    if os.path.exists(FOOOCUS_CKPT) and not cpu_lightning:
+        return FOOOCUS_CKPT, False
+    return LIGHTNING_CKPT, True
+
+_sdxl_fingerprint = None
+
+def sdxl_fingerprint():
+    """Fingerprint of the checkpoint and numeric backend behind generated images (part of the cache key)."""
+    global _sdxl_fingerprint
+    if _sdxl_fingerprint is None:
+        checkpoint, _ = resolve_sdxl_checkpoint()
+        _sdxl_fingerprint = model_fingerprint(checkpoint, EXECUTION_DEVICE,
+                                              CPU_DTYPE if EXECUTION_DEVICE == 'cpu' else 'fp16')
+    return _sdxl_fingerprint
+
 def load_sdxl_model():
-    global pipe_image, loaded_models
+    """Builds the SDXL pipeline on CPU and registers it with the VRAM manager (runs once)."""
+    global pipe_image, _sdxl_fingerprint
     import torch
-    from safetensors.torch import load_file
     
     if pipe_image is None:
-        try:
-            from diffusers import DiffusionPipeline, UNet2DConditionModel, EulerAncestralDiscreteScheduler
-        except ImportError:
-            from diffusers import StableDiffusionXLPipeline as DiffusionPipeline, UNet2DConditionModel, EulerAncestralDiscreteScheduler
-        
-        base = "stabilityai/stable-diffusion-xl-base-1.0"
-        
-        # MODEL SELECTION: Check for Juggernaut XL (Fooocus) first for Super Quality
-        fooocus_ckpt = "/content/Fooocus/models/checkpoints/juggernautXL_v8Rundiffusion.safetensors"
-        lightning_ckpt = os.path.join(MODELS_DIR, "unet", "sdxl_lightning_4step_unet.safetensors")
+        lightning_ckpt = LIGHTNING_CKPT
+        target_ckpt, is_lightning = resolve_sdxl_checkpoint()
         
-        target_ckpt = None
-        is_lightning = True
-        
-        if os.path.exists(fooocus_ckpt):
+        if not is_lightning:
             print(f"[*] Found Juggernaut XL (Fooocus) - Activating SUPER QUALITY Mode")
-            target_ckpt = fooocus_ckpt
-            is_lightning = False
         else:
             print(f"[*] Using SDXL Lightning (Fast Mode)")
-            target_ckpt = lightning_ckpt
-            is_lightning = True
 
         diffusers_cache = os.path.join(MODELS_DIR, "diffusers")
         
         print(f"[*] Loading SDXL Model from: {target_ckpt}")
         
-        # Load Pipeline
-        # Note: For Juggernaut (full checkpoint), it is often easier to load as a single file 
-        # but to keep it consistent with our lazy loader:
+        if is_lightning and not verify_file_integrity(target_ckpt, min_size_mb=400):
+            # Re-download lightning if missing/corrupt
+            from huggingface_hub import hf_hub_download
+            target_ckpt = hf_hub_download("ByteDance/SDXL-Lightning", "sdxl_lightning_4step_unet.safetensors", 
+                                        local_dir=os.path.dirname(lightning_ckpt), local_dir_use_symlinks=False)
+
+        # Pre-fused snapshot: one mmap pass instead of resolving the base repo and patching the UNet
+        use_snapshot = get_setting("models.sdxl.snapshot", True)
+        sources = {'checkpoint': target_ckpt}
+        if is_lightning:
+            sources['base'] = SDXL_BASE
+        snapshot_dir = os.path.join(MODELS_DIR, "snapshots", snapshot_name(target_ckpt))
+        timer = PhaseTimer()
+        if use_snapshot:
+            pipe_image = load_snapshot(snapshot_dir, sources, device='cpu', timer=timer)
         
-        if not is_lightning:
+        if pipe_image is not None:
+            print(f"[*] Loaded pipeline snapshot from {snapshot_dir}")
+        elif not is_lightning:
             # Full XL Checkpoint Loading
             from diffusers import StableDiffusionXLPipeline
             pipe_image = StableDiffusionXLPipeline.from_single_file(
@@ -197,95 +268,157 @@ def load_sdxl_model():
                 cache_dir=diffusers_cache
             )
         else:
-            # Lightning UNet Loading (Optimized for RAM)
-            unet_config = UNet2DConditionModel.load_config(base, subfolder="unet", cache_dir=diffusers_cache)
-            unet = UNet2DConditionModel.from_config(unet_config, torch_dtype=torch.float16)
-            
-            if not verify_file_integrity(target_ckpt, min_size_mb=400):
-                # Re-download lightning if missing/corrupt
-                from huggingface_hub import hf_hub_download
-                target_ckpt = hf_hub_download("ByteDance/SDXL-Lightning", "sdxl_lightning_4step_unet.safetensors", 
-                                            local_dir=os.path.dirname(lightning_ckpt), local_dir_use_symlinks=False)
-            
-            state_dict = load_file(target_ckpt, device="cpu")
-            unet.load_state_dict(state_dict, strict=True)
-            del state_dict
-            
-            pipe_image = DiffusionPipeline.from_pretrained(
-                base, 
-                unet=unet, 
-                torch_dtype=torch.float16, 
-                variant="fp16",
-                use_safetensors=True,
-                cache_dir=diffusers_cache
-            )
-            
-            pipe_image.scheduler = EulerAncestralDiscreteScheduler.from_config(
-                pipe_image.scheduler.config, 
-                timestep_spacing="trailing"
+            # Lightning UNet: meta-device init + mmap streaming of the weights
+            pipe_image = build_lightning_pipeline(
+                target_ckpt,
+                diffusers_cache,
+                fast=get_setting("models.sdxl.fast_cold_start", True),
+                # Always CPU: acquire() moves it to the GPU inside the VRAM budget
+                device='cpu',
+                timer=timer
             )
+        print(f"[*] SDXL cold start:\n{timer.report()}")
+
+        # Written before register(): once registered the pipeline can be leased, moved or have a LoRA fused,
+        # and the snapshot stores the fp16 weights from before the CPU cast/quantization
+        if use_snapshot and not os.path.exists(snapshot_dir):
+            save_snapshot(pipe_image, snapshot_dir, sources)
+        if EXECUTION_DEVICE == 'cpu':
+            prepare_cpu_pipeline(pipe_image, CPU_DTYPE)
+            print(f"[*] SDXL prepared for CPU inference ({CPU_DTYPE})")
 
         # Set metadata for external use
         pipe_image.is_lightning = is_lightning
+        pipe_image.style_negatives_cached = False
+        get_embedding_cache().set_namespace(target_ckpt)
         
-        print(f"[*] Moving pipeline to GPU...")
-        pipe_image.to("cuda")
-        
-        # xFormers Optimization
-        try:
-            pipe_image.enable_xformers_memory_efficient_attention()
-            print("[*] xFormers memory efficient attention enabled")
-        except Exception as e:
-            print(f"[!] xFormers not available: {e}")
+        # xFormers Optimization (CUDA only; CPU uses PyTorch SDPA)
+        pipe_image.xformers_enabled = False
+        if EXECUTION_DEVICE == 'cuda':
+            try:
+                pipe_image.enable_xformers_memory_efficient_attention()
+                pipe_image.xformers_enabled = True
+                print("[*] xFormers memory efficient attention enabled")
+            except Exception as e:
+                print(f"[!] xFormers not available: {e}")
 
-        loaded_models['sdxl'] = pipe_image
+        vram_manager.register('sdxl', pipe_image)
+        # The checkpoint may have just been (re)downloaded
+        _sdxl_fingerprint = None
         print("[✓] SDXL Lightning loaded successfully")
     
-    offload_models(except_model='sdxl')
-    pipe_image.to("cuda")
     return pipe_image
 
+def load_whisper_model():
+    global whisper_model
+    from faster_whisper import WhisperModel
+
+    if whisper_model is None:
+        print("[*] Loading Whisper model to RAM...")
+        whisper_path = os.path.join(MODELS_DIR, "checkpoints")
+        whisper_model = WhisperModel("base", device="cpu", compute_type="float16", download_root=whisper_path)
+        vram_manager.register('whisper', whisper_model, mover=lambda device: whisper_model.model.to(device))
+    return whisper_model
+
+def load_face_swap_model():
+    from services.face_swap_service import get_face_swap_service
+    service = get_face_swap_service()
+    if EXECUTION_DEVICE == 'cpu':
+        service.use_cpu(int8=CPU_DTYPE == 'int8')
+    # ONNX sessions cannot be moved: offloading releases them, loading re-creates them
+    vram_manager.register('faceswap', service,
+                          mover=lambda device: service.cleanup() if device == 'cpu' else service.initialize())
+    return service
+
+def load_esrgan_model():
+    import torch
+    service = get_esrgan_service()
+    service.load_model()
+    if not service.model_loaded:
+        raise Exception("Real-ESRGAN no disponible")
+
+    def move(device):
+        # RealESRGANer sends its inputs to `.device`, so it has to follow the network
+        service.model.model.to(device)
+        service.model.device = torch.device(device)
+    vram_manager.register('esrgan', service, mover=move)
+    return service
+
+# ControlNet type -> diffusers repo (a folder models/controlnet/<type> takes precedence)
+CONTROLNET_MODELS = get_setting("controlnet.models", {
+    "canny": "diffusers/controlnet-canny-sdxl-1.0",
+    "depth": "diffusers/controlnet-depth-sdxl-1.0",
+    "pose": "thibaud/controlnet-openpose-sdxl-1.0"
+})
+
+def load_controlnet_model(kind):
+    import torch
+    from diffusers import ControlNetModel
+    local_dir = os.path.join(MODELS_DIR, "controlnet", kind)
+    source = local_dir if os.path.isdir(local_dir) else CONTROLNET_MODELS[kind]
+    print(f"[*] Loading ControlNet '{kind}' from {source}...")
+    controlnet = ControlNetModel.from_pretrained(
+        source, torch_dtype=torch.float16, cache_dir=os.path.join(MODELS_DIR, "controlnet"))
+    controlnet.eval()
+    if EXECUTION_DEVICE == 'cpu':
+        from services.cpu_backend import torch_dtype
+        controlnet.to(dtype=torch_dtype(CPU_DTYPE))
+    vram_manager.register(f'controlnet_{kind}', controlnet)
+    return controlnet
+
+# Models are built lazily on their first lease: `with vram_manager.acquire(name) as model:`
+vram_manager.register_loader('sdxl', load_sdxl_model)
+vram_manager.register_loader('whisper', load_whisper_model)
+vram_manager.register_loader('faceswap', load_face_swap_model)
+vram_manager.register_loader('esrgan', load_esrgan_model)
+for _kind in CONTROLNET_MODELS:
+    vram_manager.register_loader(f'controlnet_{_kind}', partial(load_controlnet_model, _kind))
+
+# Look-ahead prefetch: overlap the next job's host-to-device copy with the current job
+model_prefetcher = ModelPrefetcher(vram_manager, get_worker_pool().scheduler,
+                                   lookahead=get_setting("vram.prefetch_lookahead", 2))
+if get_setting("vram.prefetch", True):
+    model_prefetcher.start()
+
 # Background Worker Utilities
+def transcribe_audio(audio_path):
+    """Transcribes audio with faster-whisper on the GPU. Returns a list of (start, end, text)."""
+    with vram_manager.acquire('whisper') as model:
+        print("[*] Transcribing audio...")
+        segments, info = model.transcribe(audio_path, beam_size=5)
+        # Segments are a lazy generator: consume them inside the lease so the model stays pinned
+        return [(segment.start, segment.end, segment.text) for segment in segments]
+
+def burn_subtitles(video_path, segments):
+    """Burns subtitle segments into the video with moviepy (CPU bound)."""
+    from moviepy.editor import VideoFileClip, TextClip, CompositeVideoClip
+
+    video = VideoFileClip(video_path)
+    clips = [video]
+
+    print("[*] Creating subtitle clips...")
+    for start, end, text in segments:
+        txt_clip = TextClip(
+            text, 
+            fontsize=40, 
+            color='white', 
+            font='Arial-Bold',
+            stroke_color='black',
+            stroke_width=1,
+            method='caption',
+            size=(video.w * 0.8, None)
+        ).set_start(start).set_end(end).set_position(('center', video.h * 0.8))
+        clips.append(txt_clip)
+
+    result = CompositeVideoClip(clips)
+    output_path = video_path.replace(".mp4", "_subtitled.mp4")
+    result.write_videofile(output_path, codec="libx264", audio_codec="aac")
+    return output_path
+
 def transcribe_and_subtitle(video_path, audio_path):
     """Real implementation using faster-whisper and moviepy."""
-    global whisper_model, loaded_models
     try:
-        from faster_whisper import WhisperModel
-        from moviepy.editor import VideoFileClip, TextClip, CompositeVideoClip
-        
-        if whisper_model is None:
-            print("[*] Loading Whisper model to RAM...")
-            whisper_path = os.path.join(MODELS_DIR, "checkpoints")
-            whisper_model = WhisperModel("base", device="cpu", compute_type="float16", download_root=whisper_path)
-            loaded_models['whisper'] = whisper_model
-
-        offload_models(except_model='whisper')
-        whisper_model.model.to("cuda") 
-        
-        print("[*] Transcribing audio...")
-        segments, info = whisper_model.transcribe(audio_path, beam_size=5)
-        
-        video = VideoFileClip(video_path)
-        clips = [video]
-        
-        print("[*] Creating subtitle clips...")
-        for segment in segments:
-            txt_clip = TextClip(
-                segment.text, 
-                fontsize=40, 
-                color='white', 
-                font='Arial-Bold',
-                stroke_color='black',
-                stroke_width=1,
-                method='caption',
-                size=(video.w * 0.8, None)
-            ).set_start(segment.start).set_end(segment.end).set_position(('center', video.h * 0.8))
-            clips.append(txt_clip)
-            
-        result = CompositeVideoClip(clips)
-        output_path = video_path.replace(".mp4", "_subtitled.mp4")
-        result.write_videofile(output_path, codec="libx264", audio_codec="aac")
-        return output_path
+        return burn_subtitles(video_path, transcribe_audio(audio_path))
     except Exception as e:
         print(f"[!] Subtitling failed: {str(e)}")
         return video_path
@@ -306,77 +439,188 @@ def run_tts_sync(text, out_file, voice="es-MX-DaliaNeural"):
         print(f"TTS Failed: {e}")
         return False
 
+# Video Job Stages (each one runs on the lane that matches its workload)
+def stage_tts(ctx):
+    data = ctx['data']
+    voice_id = data.get('voice_id', 'es-CO-SalomeNeural')
+    update_job(ctx['job_id'], "processing", progress=15, message=f"Generando voz ({voice_id})...")
+    ctx['audio_path'] = os.path.join(ctx['work_dir'], "audio.mp3")
+
+    script = data.get('script')
+    if script:
+        if not run_tts_sync(script, ctx['audio_path'], voice=voice_id):
+            raise Exception("TTS Generation Failed")
+
+def stage_encode_video(ctx):
+    update_job(ctx['job_id'], "processing", progress=30, message="Animando rostro...")
+
+    avatar_id = ctx['data'].get('avatar_id')
+    avatar_path = os.path.join(DATA_DIR, "avatars", avatar_id) if avatar_id else None
+    if not avatar_path or not os.path.exists(avatar_path):
+        avatar_path = os.path.join(DATA_DIR, "avatars", "default.jpg")
+
+    video_path = os.path.join(ctx['work_dir'], "result.mp4")
+
+    # Fallback: Create simple video
+    subprocess.run(
+        f"ffmpeg -loop 1 -i {avatar_path} -i {ctx['audio_path']} -c:v libx264 -tune stillimage -c:a aac -b:a 192k -pix_fmt yuv420p -shortest {video_path}",
+        shell=True,
+        check=True
+    )
+    ctx['video_path'] = video_path
+
+def stage_transcribe(ctx):
+    update_job(ctx['job_id'], "processing", progress=70, message="Transcribiendo audio...")
+    try:
+        ctx['segments'] = transcribe_audio(ctx['audio_path'])
+    except Exception as e:
+        print(f"[!] Transcription failed: {str(e)}")
+        ctx['segments'] = None
+
+def stage_burn_subtitles(ctx):
+    if not ctx.get('segments'):
+        return
+    update_job(ctx['job_id'], "processing", progress=80, message="Sincronizando subtítulos...")
+    try:
+        ctx['video_path'] = burn_subtitles(ctx['video_path'], ctx['segments'])
+    except Exception as e:
+        print(f"[!] Subtitling failed: {str(e)}")
+
+def stage_finalize_video(ctx):
+    predictable_path = os.path.join(ctx['work_dir'], "final_result.mp4")
+    if ctx['video_path'] != predictable_path:
+        shutil.copy2(ctx['video_path'], predictable_path)
+    ctx['url'] = f"{BASE_URL}/files/jobs/{ctx['job_id']}/final_result.mp4"
+
+def build_video_stages(job):
+    stages = [
+        Stage('tts', CPU_LANE, stage_tts),
+        Stage('encode', CPU_LANE, stage_encode_video),
+    ]
+    if job['data'].get('generate_subtitles'):
+        stages += [
+            Stage('transcribe', GPU_LANE, stage_transcribe, model='whisper'),
+            Stage('subtitles', CPU_LANE, stage_burn_subtitles),
+        ]
+    stages.append(Stage('finalize', CPU_LANE, stage_finalize_video))
+    return stages
+
+# Cascade Image Job Stages: draft at a small bucket, deliver it, then upscale + low-strength refine
+def _cascade_key(data, size, steps, strength=None):
+    adapters = tuple((name, weight) for name, weight in data.get('loras', []))
+    return SDXLBatchKey(size[0], size[1], steps, data['guidance'], data['is_lightning'], strength, adapters)
+
+def _cascade_item(data, **fields):
+    return {"prompt": data['prompt'], "negative_prompt": data['negative_prompt'], "seed": data['seed'],
+            "sid": data.get('sid'), **fields}
+
+def stage_cascade_draft(ctx):
+    data, plan = ctx['data'], ctx['data']['plan']
+    update_job(ctx['job_id'], "processing", progress=10, message="Generando borrador...")
+    key = _cascade_key(data, plan['draft_size'], plan['draft_steps'])
+    ctx['image'] = list(run_sdxl_batch(key, [_cascade_item(data, generation_id=data['draft_generation_id'])]))[0]
+
+def stage_cascade_deliver(ctx):
+    rendered = get_image_output_service().render(CASCADE_OUTPUT, image=ctx['image'])
+    ctx['url'] = f"{BASE_URL}{rendered.url}"
+    ctx['generation_id'] = ctx['data']['draft_generation_id']
+    update_job(ctx['job_id'], "processing", progress=40, message="Borrador listo",
+               draft_url=ctx['url'], draft_generation_id=ctx['generation_id'])
+
+def stage_cascade_finalize(ctx):
+    rendered = get_image_output_service().render(CASCADE_OUTPUT, image=ctx['image'])
+    ctx['url'] = f"{BASE_URL}{rendered.url}"
+    ctx['generation_id'] = ctx['data']['generation_id']
+
+def stage_cascade_upscale(ctx):
+    import cv2
+    import numpy as np
+    update_job(ctx['job_id'], "processing", progress=55, message="Escalando con Real-ESRGAN...")
+    with vram_manager.acquire('esrgan') as service:
+        upscaled = service.upscale_image(cv2.cvtColor(np.array(ctx['image']), cv2.COLOR_RGB2BGR),
+                                         outscale=ctx['data']['plan']['upscale'])
+    ctx['upscaled'] = upscaled
+
+def stage_cascade_resize(ctx):
+    import cv2
+    from PIL import Image
+    width, height = ctx['data']['plan']['final_size']
+    upscaled = ctx.pop('upscaled')
+    if upscaled.shape[1] != width or upscaled.shape[0] != height:
+        upscaled = cv2.resize(upscaled, (width, height), interpolation=cv2.INTER_AREA)
+    ctx['image'] = Image.fromarray(cv2.cvtColor(upscaled, cv2.COLOR_BGR2RGB))
+
+def stage_cascade_refine(ctx):
+    data, plan = ctx['data'], ctx['data']['plan']
+    update_job(ctx['job_id'], "processing", progress=70, message="Refinando detalles...")
+    key = _cascade_key(data, plan['final_size'], data['steps'], plan['refine_strength'])
+    ctx['image'] = list(run_sdxl_batch(key, [_cascade_item(
+        data, init_image=ctx['image'], generation_id=data['generation_id'])]))[0]
+
+def build_cascade_stages(job):
+    stages = [
+        Stage('draft', GPU_LANE, stage_cascade_draft, model='sdxl'),
+        Stage('deliver_draft', CPU_LANE, stage_cascade_deliver),
+    ]
+    if job['data'].get('refine', True):
+        stages += [
+            Stage('upscale', GPU_LANE, stage_cascade_upscale, model='esrgan'),
+            Stage('resize', CPU_LANE, stage_cascade_resize),
+            Stage('refine', GPU_LANE, stage_cascade_refine, model='sdxl'),
+            Stage('finalize', CPU_LANE, stage_cascade_finalize),
+        ]
+    return stages
+
+JOB_STAGE_BUILDERS = {
+    'video': build_video_stages,
+    'image_cascade': build_cascade_stages,
+}
+
+def _on_job_done(job_id, future):
+    error = future.exception()
+    if error is None:
+        result = future.result()
+        extra = {"generation_id": result['generation_id']} if result.get('generation_id') else {}
+        update_job(job_id, "completed", progress=100, url=result.get('url'), **extra)
+    else:
+        print(f"[!] Job {job_id} Failed: {str(error)}")
+        update_job(job_id, "failed", error=str(error))
+    job_queue.task_done()
+
 def background_worker():
+    """Dispatches queued jobs to the worker pool; stages then hop between GPU and CPU lanes."""
+    pool = get_worker_pool()
     while True:
         job = job_queue.get()
         if job is None: break
         
         job_id = job['id']
-        jobs_status[job_id]['status'] = 'processing'
-        socketio.emit('job_update', {"job_id": job_id, "status": "processing", "progress": 5})
-        
-        try:
-            print(f"[*] Processing Job {job_id}: {job['type']}")
-            work_dir = os.path.join(DATA_DIR, "jobs", job_id)
-            os.makedirs(work_dir, exist_ok=True)
-            
-            if job['type'] == 'video':
-                data = job['data']
-                avatar_id = data.get('avatar_id')
-                script = data.get('script')
-                voice_id = data.get('voice_id', 'es-CO-SalomeNeural')
-                
-                # 1. TTS Generation
-                socketio.emit('job_update', {"job_id": job_id, "status": "processing", "progress": 15, "message": f"Generando voz ({voice_id})..."})
-                audio_path = os.path.join(work_dir, "audio.mp3")
-                
-                if script:
-                    if not run_tts_sync(script, audio_path, voice=voice_id):
-                        raise Exception("TTS Generation Failed")
-                
-                # 2. Animation
-                socketio.emit('job_update', {"job_id": job_id, "status": "processing", "progress": 30, "message": "Animando rostro..."})
-                
-                avatar_path = os.path.join(DATA_DIR, "avatars", avatar_id) if avatar_id else None
-                if not avatar_path or not os.path.exists(avatar_path):
-                    avatar_path = os.path.join(DATA_DIR, "avatars", "default.jpg")
-                
-                video_path = os.path.join(work_dir, "result.mp4")
-                
-                # Fallback: Create simple video
-                subprocess.run(
-                    f"ffmpeg -loop 1 -i {avatar_path} -i {audio_path} -c:v libx264 -tune stillimage -c:a aac -b:a 192k -pix_fmt yuv420p -shortest {video_path}",
-                    shell=True,
-                    check=True
-                )
+        update_job(job_id, "processing", progress=5)
+        print(f"[*] Processing Job {job_id}: {job['type']}")
 
-                # 3. Subtitles
-                if data.get('generate_subtitles'):
-                    socketio.emit('job_update', {"job_id": job_id, "status": "processing", "progress": 80, "message": "Sincronizando subtítulos..."})
-                    final_path = transcribe_and_subtitle(video_path, audio_path)
-                    video_path = final_path
+        builder = JOB_STAGE_BUILDERS.get(job['type'])
+        if builder is None:
+            failed = Future()
+            failed.set_exception(Exception(f"Unknown job type: {job['type']}"))
+            _on_job_done(job_id, failed)
+            continue
 
-                predictable_path = os.path.join(work_dir, "final_result.mp4")
-                if video_path != predictable_path:
-                    shutil.copy2(video_path, predictable_path)
-                
-                public_path = f"{BASE_URL}/files/jobs/{job_id}/final_result.mp4"
-                jobs_status[job_id]['url'] = public_path
-                jobs_status[job_id]['status'] = 'completed'
-                socketio.emit('job_update', {"job_id": job_id, "status": "completed", "progress": 100, "url": public_path})
+        work_dir = os.path.join(DATA_DIR, "jobs", job_id)
+        os.makedirs(work_dir, exist_ok=True)
+        context = {"job_id": job_id, "data": job['data'], "work_dir": work_dir}
 
-        except Exception as e:
-            print(f"[!] Job {job_id} Failed: {str(e)}")
-            jobs_status[job_id]['status'] = 'failed'
-            jobs_status[job_id]['error'] = str(e)
-            socketio.emit('job_update', {"job_id": job_id, "status": "failed", "error": str(e)})
-        
-        job_queue.task_done()
+        future = pool.run_stages(builder(job), context)
+        future.add_done_callback(lambda f, job_id=job_id: _on_job_done(job_id, f))
 
-# Start Worker Thread
+# Start Dispatcher Thread
 worker_thread = threading.Thread(target=background_worker, daemon=True)
 worker_thread.start()
 
+# Re-queue jobs that were queued or interrupted by the last restart
+for pending_job in job_store.recover():
+    job_queue.put(pending_job)
+job_store.start_sweeper()
+
 @app.route('/api/assets', methods=['GET', 'POST'])
 def manage_assets():
     global assets_db
@@ -389,7 +633,7 @@ def manage_assets():
 
 @app.route('/api/jobs/<job_id>', methods=['GET'])
 def get_job_status(job_id):
-    job = jobs_status.get(job_id)
+    job = job_store.get(job_id)
     if not job:
         return jsonify({"status": "error", "message": "Job not found"}), 404
     return jsonify(job)
@@ -399,14 +643,9 @@ def get_job_status(job_id):
 def render_video():
     try:
         data = request.json
-        job_id = f"vid_{int(time.time())}"
-        
-        jobs_status[job_id] = {
-            "id": job_id,
-            "status": "queued",
-            "type": "video",
-            "created_at": time.time()
-        }
+        owner = (getattr(request, 'user', None) or {}).get('sub')
+        job = job_store.create("video", data, owner=owner, prefix="vid")
+        job_id = job['id']
         
         job_queue.put({"id": job_id, "type": "video", "data": data})
         
@@ -453,8 +692,7 @@ def magic_prompt():
 @require_auth
 def face_swap():
     """Intercambia rostros entre dos imágenes usando InsightFace."""
-    import torch
-    if not torch.cuda.is_available():
+    if EXECUTION_DEVICE is None:
         return jsonify({"status": "error", "message": "GPU no disponible en el servidor"}), 503
     
     try:
@@ -468,19 +706,20 @@ def face_swap():
                 "message": "Se requieren source_image y target_image en base64"
             }), 400
         
-        from services.face_swap_service import get_face_swap_service
-        
-        offload_models(except_model='faceswap')
+        try:
+            spec = get_image_output_service().negotiate({**request.args.to_dict(), **data}, request.accept_mimetypes)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
         
-        service = get_face_swap_service()
-        result_image = service.process_base64(source_image, target_image)
+        def run_face_swap():
+            with vram_manager.acquire('faceswap') as service:
+                return service.swap_from_base64(source_image, target_image)
         
-        loaded_models['faceswap'] = service
+        result_bgr = get_worker_pool().submit(GPU_LANE, run_face_swap, model='faceswap').result()
+        from PIL import Image
+        result_image = Image.fromarray(result_bgr[:, :, ::-1].copy())
         
-        return jsonify({
-            "status": "success", 
-            "image": result_image
-        })
+        return image_response(spec, render_image(spec, image=result_image))
         
     except Exception as e:
         print(f"[!] Face Swap Error: {e}")
@@ -489,13 +728,353 @@ def face_swap():
             "message": str(e)
         }), 500
 
+# Image Generation Micro-Batching
+SDXL_BATCH_MEGAPIXELS = get_setting("batching.max_batch_megapixels")
+SDXL_MAX_BATCH = get_setting("batching.max_batch_size", 4)
+
+# Requests only share a batch when every field matches; strength is None for text-to-image,
+# adapters is the canonical LoRA set ((name, weight), ...) fused for the whole batch and
+# control is (ControlNet type, conditioning scale) or None; each item brings its own control map
+SDXLBatchKey = namedtuple('SDXLBatchKey',
+                          ['width', 'height', 'steps', 'guidance', 'is_lightning', 'strength', 'adapters', 'control'],
+                          defaults=[None, (), None])
+
+def has_efficient_attention(pipe=None):
+    """xFormers or PyTorch SDPA (the diffusers default on torch 2) keep attention memory linear."""
+    import torch.nn.functional as F
+    return getattr(pipe, 'xformers_enabled', False) or hasattr(F, 'scaled_dot_product_attention')
+
+def activation_budget():
+    """VRAM left for SDXL activations: budget minus resident models, capped by what the allocator can give."""
+    free = vram_manager.activation_bytes('sdxl')
+    import torch
+    if EXECUTION_DEVICE == 'cuda' and vram_manager.is_resident('sdxl'):
+        free_now, _ = torch.cuda.mem_get_info()
+        free = min(free, free_now + torch.cuda.memory_reserved() - torch.cuda.memory_allocated())
+    return free
+
+def sdxl_batch_limit(key):
+    """Largest batch whose estimated activation peak fits the free VRAM (slicing/tiling allowed)."""
+    limit = SDXL_MAX_BATCH
+    if SDXL_BATCH_MEGAPIXELS:
+        # Optional manual cap: pixels per image, doubled by classifier-free guidance
+        pixels = key.width * key.height * (2 if key.guidance > 1 else 1)
+        limit = min(limit, int(SDXL_BATCH_MEGAPIXELS * 1e6 // pixels))
+    return max_batch_size(key.width, key.height, activation_budget(), limit,
+                          cfg=key.guidance > 1, efficient_attention=has_efficient_attention(), vae_batch=1)
+
+PREVIEWS_ENABLED = get_setting("previews.enabled", True)
+
+def deliver_preview(sid, index, step, rgb):
+    """Compresses a preview on the CPU lane and sends it as a binary frame to one client."""
+    def send():
+        frame = get_latent_previewer().encode(rgb)
+        socketio.emit('generation_preview', {"step": step, "index": index, "image": frame}, to=sid)
+    get_worker_pool().submit(CPU_LANE, send)
+
+def decode_sdxl_latents(pipe, latents):
+    """Yields one PIL image per latent, mirroring the pipeline's own VAE decode (fp32 upcast, watermark)."""
+    import torch
+    vae = pipe.vae
+    needs_upcasting = vae.dtype == torch.float16 and vae.config.force_upcast
+    if needs_upcasting:
+        pipe.upcast_vae()
+    try:
+        for latent in latents:
+            latent = latent.unsqueeze(0).to(next(iter(vae.post_quant_conv.parameters())).dtype)
+            with torch.no_grad():
+                image = vae.decode(latent / vae.config.scaling_factor, return_dict=False)[0]
+            if getattr(pipe, 'watermark', None) is not None:
+                image = pipe.watermark.apply_watermark(image)
+            yield pipe.image_processor.postprocess(image, output_type="pil")[0]
+    finally:
+        if needs_upcasting:
+            vae.to(dtype=torch.float16)
+
+def _derived_pipeline(pipe, attr, pipeline_class, **modules):
+    """View of another SDXL task over the loaded components: same modules, no duplicated weights.
+    Extra modules (e.g. a ControlNet) are added; the view is rebuilt if one of them was replaced."""
+    derived = getattr(pipe, attr, None)
+    if derived is None or any(getattr(derived, name, None) is not module for name, module in modules.items()):
+        accepted = inspect.signature(pipeline_class.__init__).parameters
+        components = {name: module for name, module in pipe.components.items() if name in accepted}
+        # The scheduler keeps per-run state, so it gets its own (weightless) instance
+        components['scheduler'] = pipe.scheduler.__class__.from_config(pipe.scheduler.config)
+        options = {'force_zeros_for_empty_prompt': pipe.config.force_zeros_for_empty_prompt}
+        if 'requires_aesthetics_score' in accepted:
+            options['requires_aesthetics_score'] = False
+        derived = pipeline_class(**components, **modules, **options)
+        setattr(pipe, attr, derived)
+    return derived
+
+def get_img2img_pipeline(pipe):
+    from diffusers import StableDiffusionXLImg2ImgPipeline
+    return _derived_pipeline(pipe, 'img2img', StableDiffusionXLImg2ImgPipeline)
+
+def get_inpaint_pipeline(pipe):
+    from diffusers import StableDiffusionXLInpaintPipeline
+    return _derived_pipeline(pipe, 'inpaint', StableDiffusionXLInpaintPipeline)
+
+def get_controlnet_pipeline(pipe, kind, controlnet):
+    from diffusers import StableDiffusionXLControlNetPipeline
+    return _derived_pipeline(pipe, f'controlnet_{kind}', StableDiffusionXLControlNetPipeline, controlnet=controlnet)
+
+def prepare_sdxl_prompts(pipe, prompts, negatives, guidance, adapters=()):
+    """Activates the LoRA set on the resident pipeline and returns the (cached) prompt embeddings."""
+    embedding_cache = get_embedding_cache()
+    if not pipe.style_negatives_cached:
+        # Style negatives are identical for every request of a style: encode them once per load
+        embedding_cache.precompute(pipe, get_style_service().get_style_negatives())
+        pipe.style_negatives_cached = True
+
+    # Fuse this batch's LoRA set into the resident weights (no-op when it is already active)
+    lora_manager = get_lora_manager()
+    switch_start = time.time()
+    if lora_manager.activate(pipe, adapters):
+        print(f"[*] LoRA set {list(adapters) or 'none'} active in {time.time() - switch_start:.2f}s")
+    # Prompt embeddings only change when a LoRA touches the text encoders
+    variant = lora_manager.text_encoder_variant(adapters)
+
+    embeds = {}
+    embeds['prompt_embeds'], embeds['pooled_prompt_embeds'] = embedding_cache.encode(
+        pipe, prompts, variant=variant)
+    if guidance > 1:
+        # Negatives only matter with classifier-free guidance
+        embeds['negative_prompt_embeds'], embeds['negative_pooled_prompt_embeds'] = embedding_cache.encode(
+            pipe, negatives, zero_empty=pipe.config.force_zeros_for_empty_prompt, variant=variant)
+    return embeds
+
+def run_sdxl_batch(key, items):
+    """Runs one batched SDXL call; items carry their own prompt, negative prompt and seed.
+    With key.strength set, items start from their stored init_latent (vary/refine).
+    Yields the decoded images in item order."""
+    import torch
+    width, height, steps, guidance, is_lightning, strength, adapters, control = key
+    run_steps = max(1, int(steps * strength)) if strength else steps
+
+    # Live previews go only to the Socket.IO clients that asked for this generation
+    previewer = get_latent_previewer()
+    preview_targets = [(index, item['sid']) for index, item in enumerate(items) if item.get('sid')]
+    throttle = previewer.throttle() if preview_targets and PREVIEWS_ENABLED else None
+
+    def progress_callback(step, timestep, latents):
+        progress = int((step / run_steps) * 100)
+        socketio.emit('generation_progress', {"progress": progress, "status": "generating"})
+        if throttle is not None:
+            previewer.preview(latents, preview_targets, step, throttle, deliver_preview)
+
+    print(f"[*] Running SDXL inference (batch of {len(items)})...")
+    # One reservation for SDXL and its ControlNet: room is made for both at once and neither
+    # can be evicted, or waited on, while making room for the other
+    leased = ['sdxl', f'controlnet_{control[0]}'] if control else ['sdxl']
+    with vram_manager.acquire_many(leased) as models:
+        pipe, controlnet = models[0], models[1] if control else None
+        embeds = prepare_sdxl_prompts(pipe, [item['prompt'] for item in items],
+                                      [item['negative_prompt'] for item in items], guidance, adapters)
+
+        # Pick attention slicing / VAE slicing / VAE tiling only when the estimate exceeds the free VRAM
+        from_images = bool(strength) and items[0].get('init_image') is not None
+        plan = plan_execution(
+            width, height, len(items), activation_budget(),
+            cfg=guidance > 1,
+            vae_dtype_bytes=4 if pipe.vae.config.force_upcast else 2,
+            efficient_attention=has_efficient_attention(pipe),
+            vae_batch=len(items) if from_images else 1  # decode is per image; encoding init images is batched
+        )
+        if apply_memory_plan(pipe, plan):
+            print(f"[*] Memory plan: {plan.describe()}")
+        if not plan.fits:
+            print(f"[!] Memory plan over budget: {plan.describe()}")
+
+        if control:
+            from PIL import Image
+            # The pipeline resizes each map to width x height
+            runner = get_controlnet_pipeline(pipe, control[0], controlnet)
+            size_args = {"image": [Image.fromarray(item['control_map']) for item in items],
+                         "controlnet_conditioning_scale": control[1], "width": width, "height": height}
+        elif strength:
+            # Partial noise over a previous result: only steps * strength denoising steps run
+            runner = get_img2img_pipeline(pipe)
+            if from_images:
+                # Images (e.g. an upscaled cascade draft) are VAE-encoded by the pipeline
+                init = [item['init_image'] for item in items]
+            else:
+                init = torch.cat([item['init_latent'] for item in items]).to(pipe.device, dtype=pipe.unet.dtype)
+            size_args = {"image": init, "strength": strength}
+        else:
+            runner = pipe
+            size_args = {"width": width, "height": height}
+
+        generators = [torch.Generator(device=pipe.device).manual_seed(item['seed']) for item in items]
+        latents = runner(
+            **embeds,
+            **size_args,
+            num_inference_steps=steps,
+            guidance_scale=guidance,
+            generator=generators,
+            callback=progress_callback,
+            callback_steps=1,
+            output_type="latent"
+        ).images
+
+        # Keep the final latents so follow-up vary/refine requests can start from them
+        latent_store = get_latent_store()
+        for item, latent in zip(items, latents):
+            if item.get('generation_id'):
+                latent_store.put(item['generation_id'], LatentEntry(
+                    latent.unsqueeze(0).to("cpu"), item['seed'], item['prompt'], item['negative_prompt'],
+                    width, height, steps, guidance, is_lightning, adapters))
+
+        # Decode one image at a time so each request gets its result as soon as it exists
+        yield from decode_sdxl_latents(pipe, latents)
+
+MAX_IMAGES_PER_REQUEST = get_setting("generation.image.max_images", 4)
+
+# Cascade drafts and finals are delivered as /files URLs inside job updates
+CASCADE_OUTPUT = OutputSpec('url', get_setting("output.default_format", "png"), get_setting("output.quality", 90))
+
+def start_cascade_job(data, final_prompt, final_negative, width, height, steps, guidance, is_lightning, seed,
+                      adapters=()):
+    """Queues a draft-then-refine job; the draft URL arrives as a job update before the final image."""
+    plan = plan_cascade(width, height, steps,
+                        draft_megapixels=get_setting("cascade.draft_megapixels", 0.6),
+                        draft_steps=get_setting("cascade.draft_steps", 20),
+                        refine_strength=get_setting("cascade.refine_strength", 0.3))
+    job_data = {
+        "prompt": final_prompt, "negative_prompt": final_negative, "steps": steps, "guidance": guidance,
+        "is_lightning": is_lightning, "seed": seed, "plan": plan, "loras": [list(a) for a in adapters],
+        "refine": bool(data.get('refine', get_setting("cascade.refine", True))),
+        "sid": data.get('socket_id') or request.headers.get('X-Socket-ID'),
+        "draft_generation_id": LatentStore.new_generation_id(),
+        "generation_id": LatentStore.new_generation_id()
+    }
+    owner = (getattr(request, 'user', None) or {}).get('sub')
+    job = job_store.create("image_cascade", job_data, owner=owner, prefix="img")
+    job_queue.put({"id": job['id'], "type": "image_cascade", "data": job_data})
+    return jsonify({
+        "status": "success",
+        "job_id": job['id'],
+        "seed": seed,
+        "plan": plan,
+        "message": "Borrador en cola; la imagen final llegará como actualización del job"
+    })
+
+# Image modes and their default img2img strength (None: plain text-to-image)
+IMAGE_MODES = {
+    'generate': None,
+    'cascade': None,
+    'vary': get_setting("generation.image.vary_strength", 0.6),
+    'refine': get_setting("generation.image.refine_strength", 0.3)
+}
+
+def image_entry(spec, rendered):
+    """JSON fields for one image: a /files URL or a base64 data URI."""
+    if spec.mode == 'url':
+        return {"url": rendered.url, "format": rendered.format}
+    return {"image": rendered.data_uri()}
+
+def multi_image_response(spec, seeds, generation_ids, futures, sid, stream=False):
+    """
+    Returns N images of one request. Each one is rendered as soon as its latent is decoded and
+    pushed to the requesting Socket.IO client; the HTTP body is a streamed multipart/mixed
+    (binary mode), a streamed NDJSON (stream=true) or a single JSON with all images.
+    """
+    def finished():
+        for index, (seed, future) in enumerate(zip(seeds, futures)):
+            rendered = render_image(spec, image=future.result())
+            if sid:
+                socketio.emit('generation_image', {
+                    "index": index, "seed": seed, "generation_id": generation_ids[index],
+                    "format": rendered.format, "image": rendered.data
+                }, to=sid)
+            yield index, seed, rendered
+        socketio.emit('generation_progress', {"progress": 100, "status": "completed"})
+
+    if spec.mode == 'binary':
+        boundary = uuid.uuid4().hex
+        def parts():
+            for index, seed, rendered in finished():
+                yield (f"--{boundary}\r\nContent-Type: {rendered.mimetype}\r\n"
+                       f"Content-Length: {len(rendered.data)}\r\nX-Index: {index}\r\nX-Seed: {seed}\r\n"
+                       f"X-Generation-Id: {generation_ids[index]}\r\n\r\n").encode()
+                yield rendered.data + b"\r\n"
+            yield f"--{boundary}--\r\n".encode()
+        return app.response_class(parts(), mimetype=f"multipart/mixed; boundary={boundary}",
+                                  headers={"X-Seeds": ",".join(map(str, seeds))})
+
+    if stream:
+        def lines():
+            try:
+                for index, seed, rendered in finished():
+                    yield json.dumps({"index": index, "seed": seed, "generation_id": generation_ids[index],
+                                      **image_entry(spec, rendered)}) + "\n"
+                yield json.dumps({"status": "success", "seeds": seeds, "generation_ids": generation_ids, "done": True}) + "\n"
+            except Exception as e:
+                yield json.dumps({"status": "error", "message": str(e)}) + "\n"
+        return app.response_class(lines(), mimetype="application/x-ndjson")
+
+    images = [{"generation_id": generation_ids[index], **image_entry(spec, rendered)}
+              for index, _, rendered in finished()]
+    return jsonify({"status": "success", "images": images, "seeds": seeds, "generation_ids": generation_ids, "cached": False})
+
+image_batcher = MicroBatcher(
+    run_sdxl_batch,
+    window_ms=get_setting("batching.window_ms", 30),
+    max_batch_size=get_setting("batching.max_batch_size", 4),
+    max_batch_fn=sdxl_batch_limit,
+    dispatch=lambda run: get_worker_pool().submit(GPU_LANE, run, model='sdxl')
+)
+
+def validate_adapters(adapters):
+    """Unknown LoRA names are a client error; PEFT cannot inject adapters into int8-quantized layers."""
+    get_lora_manager().validate(adapters)
+    if adapters and EXECUTION_DEVICE == 'cpu' and CPU_DTYPE == 'int8':
+        raise ValueError("LoRAs no disponibles con pesos int8 en el backend CPU")
+
+def prepare_control(control):
+    """Validates the `control` field of a request; the map is preprocessed on the CPU lane or read from the cache.
+    Returns ((ControlNet type, conditioning scale), control map)."""
+    if not get_setting("features.controlnet", False):
+        raise ValueError("ControlNet deshabilitado (features.controlnet)")
+    if not isinstance(control, dict) or not control.get('image'):
+        raise ValueError("control debe incluir type e image")
+    kind = control.get('type')
+    if kind not in CONTROLNET_MODELS:
+        raise ValueError(f"Tipo de ControlNet no soportado: {kind}")
+    scale = round(float(control.get('scale', get_setting("controlnet.conditioning_scale", 0.8))), 3)
+    if not 0 <= scale <= 2:
+        raise ValueError("control.scale must be in [0, 2]")
+    params = control.get('params') or {}
+    if not isinstance(params, dict):
+        raise ValueError("control.params must be an object")
+
+    # preprocess=false: the reference already is a canny/depth/pose map
+    preprocessor = kind if control.get('preprocess', True) else 'none'
+    control_map, cached = get_worker_pool().submit(
+        CPU_LANE, get_control_map_cache().get, decode_base64(control['image']), preprocessor, params).result()
+    print(f"[*] Control map '{preprocessor}' {'reused from cache' if cached else 'computed'}")
+    return (kind, scale), control_map
+
+def resolve_sampling(data):
+    """Steps and guidance for the resident checkpoint; Juggernaut (non-lightning) gets quality defaults."""
+    steps = data.get('steps', 4)
+    guidance = data.get('guidance_scale', 0)
+    # No model load needed to know which checkpoint will be used
+    _, is_lightning = resolve_sdxl_checkpoint()
+    
+    if not is_lightning:
+        # Juggernaut XL needs more steps and guidance for best results
+        if steps <= 8: steps = 30 # Default for high quality
+        if guidance == 0: guidance = 7.0 # Default for realism
+        print(f"[*] Juggernaut Mode: Auto-adjusted Steps to {steps} and Guidance to {guidance}")
+    return steps, guidance, is_lightning
+
 @app.route('/generate-image', methods=['POST'])
 @require_auth
 def generate_image():
-    import torch
     import traceback
     
-    if not torch.cuda.is_available():
+    if EXECUTION_DEVICE is None:
         return jsonify({"status": "error", "message": "GPU no disponible en el servidor"}), 503
     
     try:
@@ -503,112 +1082,263 @@ def generate_image():
         prompt = data.get('prompt')
         style = data.get('style', 'Fooocus V2') # Default to Fooocus V2 for better quality
         user_negative = data.get('negative_prompt', '')
-        steps = data.get('steps', 4)
-        guidance = data.get('guidance_scale', 0)
         aspect_ratio = data.get('aspect_ratio', '1:1')
         
         # Mapping Aspect Ratio to SDXL standard dimensions (Fooocus Style)
-        ratio_map = {
-            '1:1': (1024, 1024),
-            '16:9': (1344, 768),
-            '9:16': (768, 1344),
-            '21:9': (1536, 640),
-            '9:21': (640, 1536),
-            '11:8': (1152, 832),
-            '8:11': (832, 1152),
-            '4:3': (1152, 896),
-            '3:4': (896, 1152)
-        }
-        width, height = ratio_map.get(aspect_ratio, (1024, 1024))
+        width, height = SDXL_BUCKETS.get(aspect_ratio, (1024, 1024))
+        steps, guidance, is_lightning = resolve_sampling(data)
         
-        # Load model and auto-adjust parameters if it's Juggernaut (non-lightning)
-        pipe = load_sdxl_model()
-        is_lightning = getattr(pipe, 'is_lightning', True)
-        
-        if not is_lightning:
-            # Juggernaut XL needs more steps and guidance for best results
-            if steps <= 8: steps = 30 # Default for high quality
-            if guidance == 0: guidance = 7.0 # Default for realism
-            print(f"[*] Juggernaut Mode: Auto-adjusted Steps to {steps} and Guidance to {guidance}")
+        # vary/refine start from the stored latent of a previous generation
+        mode = data.get('mode', 'generate')
+        source = None
+        adapters = None
+        if mode not in IMAGE_MODES:
+            return jsonify({"status": "error", "message": f"Modo no soportado: {mode}"}), 400
+        if mode in ('vary', 'refine'):
+            source = get_latent_store().get(data.get('generation_id') or '')
+            if source is None:
+                return jsonify({"status": "error", "message": "generation_id desconocido o expirado"}), 404
+            width, height, is_lightning = source.width, source.height, source.is_lightning
+            if 'loras' not in data:
+                adapters = source.adapters
+            steps = data.get('steps', source.steps)
+            guidance = data.get('guidance_scale', source.guidance)
         
-        
-        if not prompt:
+        if not prompt and source is None:
             return jsonify({"status": "error", "message": "Prompt vacío o no proporcionado"}), 400
+        
+        try:
+            spec = get_image_output_service().negotiate({**request.args.to_dict(), **data}, request.accept_mimetypes)
+            base_seed = data.get('seed')
+            if mode == 'refine' and base_seed is None:
+                base_seed = source.seed  # same noise, so the result stays close to the original
+            seeds = resolve_seeds(data.get('num_images'), base_seed, data.get('seeds'), MAX_IMAGES_PER_REQUEST)
+            strength = None
+            if source is not None:
+                strength = float(data.get('strength', IMAGE_MODES[mode]))
+                if not 0 < strength <= 1:
+                    raise ValueError("strength must be in (0, 1]")
+                strength = max(strength, 1.0 / steps)  # at least one denoising step
+            if adapters is None:
+                adapters = normalize_adapters(data.get('loras'), get_setting("loras.max_per_request", 3))
+            validate_adapters(adapters)
+            control, control_map = None, None
+            if data.get('control'):
+                if mode != 'generate':
+                    raise ValueError("control solo está disponible con mode=generate")
+                control, control_map = prepare_control(data['control'])
+        except (ValueError, OSError) as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        # Single text-to-image requests are cached; without an explicit seed any image for the spec is acceptable.
+        # Control maps are not part of the spec, so ControlNet requests always generate
+        use_cache = (mode == 'generate' and len(seeds) == 1 and data.get('seeds') is None and control is None)
+        generation = GenerationSpec(
+            prompt=prompt or source.prompt, negative_prompt=user_negative, style=style, width=width, height=height,
+            steps=steps, guidance=guidance, seed=seeds[0] if data.get('seed') is not None else None,
+            is_lightning=is_lightning, adapters=adapters, model=sdxl_fingerprint()
+        )
             
-        # Apply Style
+        # Apply Style (a follow-up without a new prompt reuses the already styled one)
         style_service = get_style_service()
-        final_prompt, final_negative = style_service.apply_style(style, prompt, user_negative)
+        if prompt:
+            final_prompt, final_negative = style_service.apply_style(style, prompt, user_negative)
+        else:
+            prompt, final_prompt, final_negative = source.prompt, source.prompt, source.negative_prompt
         
-        logger.info(f"Generating image. Style: {style}, Prompt: {prompt[:30]}...", extra={"steps": steps})
+        logger.info(f"Generating image. Style: {style}, Prompt: {prompt[:30]}...", extra={"steps": steps, "images": len(seeds)})
         # print(f"[*] Final Prompt: {final_prompt}")
         
+        if mode == 'cascade':
+            return start_cascade_job(data, final_prompt, final_negative, width, height, steps, guidance,
+                                     is_lightning, seeds[0], adapters)
+        
         # Cache check
-        try:
-            cache_service = get_cache_service()
-            cache_key = cache_service.get_cache_key(prompt, steps, guidance)
-            cached_image = cache_service.get_cached_image(cache_key)
+        if use_cache:
+            try:
+                cache_service = get_cache_service()
+                cache_key = cache_service.get_cache_key(generation)
+                # Hot keys are served from memory already encoded; cold entries may be lossless WebP on disk
+                rendered = cache_service.get_rendered(
+                    cache_key, (spec.format, spec.quality if spec.format != 'png' else None),
+                    lambda data, data_format: render_image(spec, encoded=data, encoded_format=data_format)
+                )
+                
+                if rendered:
+                    if spec.mode == 'url' and rendered.url is None:
+                        rendered.url = get_image_output_service().store(rendered.data, rendered.format)
+                    seed_field = {"seed": generation.seed} if generation.seed is not None else {}
+                    return image_response(spec, rendered, cached=True, **seed_field)
+            except Exception as cache_error:
+                print(f"[!] Cache error (continuing without cache): {cache_error}")
+        
+        # Compatible concurrent requests are merged into one batched pipeline call;
+        # the N images of this request are enqueued together so they share a batch
+        sid = data.get('socket_id') or request.headers.get('X-Socket-ID')
+        batch_key = SDXLBatchKey(width, height, steps, guidance, is_lightning, strength, adapters, control)
+        generation_ids = [LatentStore.new_generation_id() for _ in seeds]
+        futures = image_batcher.submit_many(batch_key, [{
+            "prompt": final_prompt,
+            "negative_prompt": final_negative,
+            "seed": seed,
+            "sid": sid,
+            "generation_id": generation_id,
+            "init_latent": source.latent if source is not None else None,
+            "control_map": control_map
+        } for seed, generation_id in zip(seeds, generation_ids)])
+        
+        if len(seeds) > 1:
+            return multi_image_response(spec, seeds, generation_ids, futures, sid, stream=bool(data.get('stream')))
+        
+        image = futures[0].result()
+        socketio.emit('generation_progress', {"progress": 100, "status": "completed"})
+        
+        rendered = render_image(spec, image=image)
+        
+        if use_cache:
+            # Save to cache (the cache holds PNG; encode it off the response path if the client asked for another format)
+            def save_png():
+                png_bytes = rendered.data if rendered.format == 'png' else encode_image(image, 'png')
+                cache_service.save_to_cache(
+                    cache_key, 
+                    png_bytes,
+                    metadata=generation.describe()
+                )
             
-            if cached_image:
-                import base64
-                img_str = base64.b64encode(cached_image).decode('utf-8')
-                return jsonify({
-                    "status": "success", 
-                    "image": f"data:image/png;base64,{img_str}",
-                    "cached": True
-                })
-        except Exception as cache_error:
-            print(f"[!] Cache error (continuing without cache): {cache_error}")
-        
-        # Load model
-        pipe = load_sdxl_model()
-        
-        # Progress callback
-        def progress_callback(step, timestep, latents):
-            progress = int((step / steps) * 100)
-            socketio.emit('generation_progress', {"progress": progress, "status": "generating"})
-        
-        print(f"[*] Running SDXL inference...")
-        image = pipe(
-            prompt=final_prompt, 
-            negative_prompt=final_negative,
-            num_inference_steps=steps, 
-            guidance_scale=guidance, 
+            def on_cache_saved(future):
+                if future.exception() is not None:
+                    logger.error(f"Failed to save to cache: {future.exception()}")
+            
+            get_worker_pool().submit(CPU_LANE, save_png).add_done_callback(on_cache_saved)
+        
+        logger.info(f"Image generated successfully", extra={"cached": False, "length": len(rendered.data)})
+        return image_response(spec, rendered, cached=False, seed=seeds[0], generation_id=generation_ids[0])
+        
+    except Exception as e:
+        error_trace = traceback.format_exc()
+        logger.error(f"Image Generation Error: {str(e)}", exc_info=True)
+        # print(f"[!] Traceback:\n{error_trace}")
+        return jsonify({
+            "status": "error", 
+            "message": str(e),
+            "type": type(e).__name__
+        }), 500
+
+# Region-cropped inpainting: only the mask's bounding box (plus context) goes through the UNet
+INPAINT_PADDING = get_setting("inpaint.padding", 96)
+INPAINT_FEATHER = get_setting("inpaint.feather", 16)
+INPAINT_MIN_MEGAPIXELS = get_setting("inpaint.min_megapixels", 0.6)
+
+def prepare_inpaint(image_data, mask_data, padding, feather):
+    """Decodes image and mask, picks the crop region and its bucket, and builds the blend alpha."""
+    import numpy as np
+    from PIL import Image
+    image = decode_image(image_data, 'RGB')
+    mask_image = decode_image(mask_data, 'L')
+    if mask_image.size != image.size:
+        mask_image = mask_image.resize(image.size, Image.NEAREST)
+    mask = np.asarray(mask_image) > 127  # white = repaint
+    bbox = mask_bbox(mask)
+    if bbox is None:
+        raise ValueError("La máscara está vacía")
+
+    region, size = crop_region(bbox, image.size, padding, INPAINT_MIN_MEGAPIXELS)
+    x0, y0, x1, y1 = region
+    crop_mask, alpha = feather_mask(mask[y0:y1, x0:x1], feather)
+    return {
+        "image": np.asarray(image),
+        "region": region,
+        "size": size,
+        "alpha": alpha,
+        "crop": image.crop(region).resize(size, Image.LANCZOS),
+        # The pipeline repaints the dilated mask so the feathered band has new content to blend
+        "mask": Image.fromarray(crop_mask.astype(np.uint8) * 255).resize(size, Image.NEAREST)
+    }
+
+def run_sdxl_inpaint(job):
+    """Inpaints the crop with the resident SDXL components (no second model in VRAM)."""
+    import torch
+    width, height = job['size']
+    run_steps = max(1, int(job['steps'] * job['strength']))
+
+    def progress_callback(step, timestep, latents):
+        socketio.emit('generation_progress', {"progress": int((step / run_steps) * 100), "status": "generating"})
+
+    with vram_manager.acquire('sdxl') as pipe:
+        embeds = prepare_sdxl_prompts(pipe, [job['prompt']], [job['negative_prompt']], job['guidance'],
+                                      job['adapters'])
+        plan = plan_execution(width, height, 1, activation_budget(), cfg=job['guidance'] > 1,
+                              vae_dtype_bytes=4 if pipe.vae.config.force_upcast else 2,
+                              efficient_attention=has_efficient_attention(pipe))
+        if apply_memory_plan(pipe, plan):
+            print(f"[*] Memory plan: {plan.describe()}")
+
+        return get_inpaint_pipeline(pipe)(
+            **embeds,
+            image=job['crop'],
+            mask_image=job['mask'],
             width=width,
             height=height,
-            callback=progress_callback, 
+            strength=job['strength'],
+            num_inference_steps=job['steps'],
+            guidance_scale=job['guidance'],
+            generator=torch.Generator(device=pipe.device).manual_seed(job['seed']),
+            callback=progress_callback,
             callback_steps=1
         ).images[0]
+
+def finish_inpaint(job, result):
+    """Scales the inpainted crop back to its region and feather-blends it into the full image."""
+    import numpy as np
+    from PIL import Image
+    x0, y0, x1, y1 = job['region']
+    patch = np.asarray(result.convert('RGB').resize((x1 - x0, y1 - y0), Image.LANCZOS))
+    return Image.fromarray(paste_region(job['image'], patch, job['alpha'], job['region']))
+
+@app.route('/inpaint', methods=['POST'])
+@require_auth
+def inpaint():
+    """Repinta la zona blanca de la máscara procesando solo su recorte con contexto."""
+    
+    if EXECUTION_DEVICE is None:
+        return jsonify({"status": "error", "message": "GPU no disponible en el servidor"}), 503
+    
+    try:
+        data = request.json
+        prompt = data.get('prompt')
+        if not prompt or not data.get('image') or not data.get('mask'):
+            return jsonify({"status": "error", "message": "Se requieren prompt, image y mask"}), 400
         
-        socketio.emit('generation_progress', {"progress": 100, "status": "completed"})
+        steps, guidance, _ = resolve_sampling(data)
+        pool = get_worker_pool()
+        try:
+            spec = get_image_output_service().negotiate({**request.args.to_dict(), **data}, request.accept_mimetypes)
+            seed = resolve_seeds(1, data.get('seed'), None, 1)[0]
+            strength = float(data.get('strength', get_setting("inpaint.strength", 1.0)))
+            if not 0 < strength <= 1:
+                raise ValueError("strength must be in (0, 1]")
+            adapters = normalize_adapters(data.get('loras'), get_setting("loras.max_per_request", 3))
+            validate_adapters(adapters)
+            job = pool.submit(CPU_LANE, prepare_inpaint, data['image'], data['mask'],
+                              int(data.get('padding', INPAINT_PADDING)), int(data.get('feather', INPAINT_FEATHER))).result()
+        except (ValueError, OSError) as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
         
-        print(f"[*] Encoding image to base64...")
-        import io, base64
-        buffered = io.BytesIO()
-        image.save(buffered, format="PNG")
-        image_bytes = buffered.getvalue()
-        img_str = base64.b64encode(image_bytes).decode('utf-8')
+        final_prompt, final_negative = get_style_service().apply_style(
+            data.get('style', 'Fooocus V2'), prompt, data.get('negative_prompt', ''))
+        job.update(prompt=final_prompt, negative_prompt=final_negative, steps=steps, guidance=guidance,
+                   strength=strength, seed=seed, adapters=adapters)
         
-        # Save to cache
-        try:
-            cache_service.save_to_cache(
-                cache_key, 
-                image_bytes,
-                metadata={'prompt': prompt, 'steps': steps, 'guidance': guidance}
-            )
-        except Exception as cache_error:
-            logger.error(f"Failed to save to cache: {cache_error}")
+        full_height, full_width = job['image'].shape[:2]
+        print(f"[*] Inpainting region {job['region']} at {job['size'][0]}x{job['size'][1]} "
+              f"(full image {full_width}x{full_height})")
+        result = pool.submit(GPU_LANE, run_sdxl_inpaint, job, model='sdxl').result()
+        image = pool.submit(CPU_LANE, finish_inpaint, job, result).result()
+        socketio.emit('generation_progress', {"progress": 100, "status": "completed"})
         
-        logger.info(f"Image generated successfully", extra={"cached": False, "length": len(img_str)})
-        return jsonify({
-            "status": "success", 
-            "image": f"data:image/png;base64,{img_str}",
-            "cached": False
-        })
+        return image_response(spec, render_image(spec, image=image), seed=seed, region=list(job['region']))
         
     except Exception as e:
-        error_trace = traceback.format_exc()
-        logger.error(f"Image Generation Error: {str(e)}", exc_info=True)
-        # print(f"[!] Traceback:\n{error_trace}")
+        logger.error(f"Inpaint Error: {str(e)}", exc_info=True)
         return jsonify({
             "status": "error", 
             "message": str(e),
@@ -620,7 +1350,20 @@ def gpu_status():
     """Enhanced GPU status with detailed VRAM monitoring."""
     try:
         import torch
-        if torch.cuda.is_available():
+        services = {
+            "models_loaded": vram_manager.resident_models(),
+            "vram_manager": vram_manager.get_stats(),
+            "prefetcher": model_prefetcher.get_stats(),
+            "batching": image_batcher.get_stats(),
+            "embedding_cache": get_embedding_cache().get_stats(),
+            "previews": get_latent_previewer().get_stats(),
+            "latent_store": get_latent_store().get_stats(),
+            "loras": get_lora_manager().get_stats(),
+            "control_maps": get_control_map_cache().get_stats(),
+            "image_cache": get_cache_service().get_cache_stats(),
+            "workers": get_worker_pool().get_stats()
+        }
+        if EXECUTION_DEVICE == 'cuda':
             total = torch.cuda.get_device_properties(0).total_memory / 1e9
             allocated = torch.cuda.memory_allocated(0) / 1e9
             reserved = torch.cuda.memory_reserved(0) / 1e9
@@ -628,15 +1371,25 @@ def gpu_status():
             
             return jsonify({
                 "status": "online",
+                "backend": "cuda",
                 "device": torch.cuda.get_device_name(0),
                 "vram_total_gb": round(total, 2),
                 "vram_allocated_gb": round(allocated, 2),
                 "vram_reserved_gb": round(reserved, 2),
                 "vram_free_gb": round(free, 2),
                 "utilization_percent": round((reserved / total) * 100, 1),
-                "models_loaded": list(loaded_models.keys()),
+                **services,
                 "cuda_version": torch.version.cuda
             })
+        if EXECUTION_DEVICE == 'cpu':
+            return jsonify({
+                "status": "online",
+                "backend": "cpu",
+                "device": "cpu",
+                "cpu_threads": torch.get_num_threads(),
+                "cpu_dtype": CPU_DTYPE,
+                **services
+            })
     except Exception as e:
         print(f"[!] GPU Status Error: {e}")
     
@@ -688,6 +1441,15 @@ def get_styles():
         "styles": get_style_service().get_styles() 
     })
 
+@app.route('/loras', methods=['GET'])
+def get_loras():
+    """Retorna los LoRAs disponibles para /generate-image."""
+    return jsonify({
+        "status": "success",
+        "loras": get_lora_manager().available(),
+        "max_per_request": get_setting("loras.max_per_request", 3)
+    })
+
 if __name__ == '__main__':
     print("\n" + "="*60)
     print("🚀 SERVIDOR FLASK INICIADO EN PUERTO 5000")
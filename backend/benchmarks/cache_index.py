@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark de latencia de un HIT del caché de imágenes con N entradas.
+Compara el antiguo cache_metadata.json (reescrito entero en cada acceso) con
+el índice SQLite de accesos por lotes. Mide solo la contabilidad de metadata,
+no la lectura del PNG.
+
+Uso:
+    python benchmarks/cache_index.py
+    python benchmarks/cache_index.py --entries 100000 --hits 2000 --legacy-hits 20
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from services.cache_index import CacheIndex
+
+def fake_metadata(i: int) -> dict:
+    now = time.time()
+    return {'created_at': now, 'last_accessed': now, 'access_count': 1, 'size_bytes': 1_400_000,
+            'prompt': f"product photo number {i}, studio lighting", 'steps': 4, 'guidance': 0}
+
+def percentiles(timings):
+    timings = sorted(timings)
+    pick = lambda q: timings[min(len(timings) - 1, int(q * len(timings)))] * 1000
+    return pick(0.5), pick(0.99), sum(timings) / len(timings) * 1000
+
+def bench_legacy(workdir: str, entries: int, hits: int):
+    path = os.path.join(workdir, "cache_metadata.json")
+    metadata = {f"key{i}": fake_metadata(i) for i in range(entries)}
+    with open(path, 'w') as f:
+        json.dump(metadata, f, indent=2)
+
+    timings = []
+    for _ in range(hits):
+        key = f"key{random.randrange(entries)}"
+        start = time.perf_counter()
+        metadata[key]['last_accessed'] = time.time()
+        metadata[key]['access_count'] += 1
+        with open(path, 'w') as f:
+            json.dump(metadata, f, indent=2)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def bench_index(workdir: str, entries: int, hits: int):
+    index = CacheIndex(os.path.join(workdir, "cache_index.db"))
+    # Bulk load through the legacy importer (one transaction)
+    legacy_path = os.path.join(workdir, "bulk.json")
+    with open(legacy_path, 'w') as f:
+        json.dump({f"key{i}": fake_metadata(i) for i in range(entries)}, f)
+    index.import_json(legacy_path)
+    index.start_flusher()
+
+    timings = []
+    for _ in range(hits):
+        key = f"key{random.randrange(entries)}"
+        start = time.perf_counter()
+        index.touch(key)
+        timings.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    index.close()
+    return timings, time.perf_counter() - start, index.flushes
+
+def main():
+    parser = argparse.ArgumentParser(description="Cache metadata hit latency benchmark")
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--hits", type=int, default=5000)
+    parser.add_argument("--legacy-hits", type=int, default=20, help="Hits for the JSON baseline (each rewrites the file)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        print(f"[*] {args.entries} entries")
+        p50, p99, mean = percentiles(bench_legacy(workdir, args.entries, args.legacy_hits))
+        print(f"{'store':>14}{'p50 ms':>12}{'p99 ms':>12}{'mean ms':>12}")
+        print(f"{'json rewrite':>14}{p50:>12.3f}{p99:>12.3f}{mean:>12.3f}")
+
+        timings, close_seconds, flushes = bench_index(workdir, args.entries, args.hits)
+        p50, p99, mean = percentiles(timings)
+        print(f"{'sqlite index':>14}{p50:>12.3f}{p99:>12.3f}{mean:>12.3f}")
+        print(f"[*] {flushes} batched flushes, final flush + close {close_seconds * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Compromiso velocidad/calidad de la cascada (borrador + Real-ESRGAN + refinado)
+frente a la generación directa, para cada bucket de SDXL_BUCKETS.
+
+Para cada bucket mide el tiempo de la generación directa, el tiempo hasta el
+borrador y el tiempo hasta la imagen final de la cascada, y compara el detalle
+(varianza del Laplaciano) de la imagen final con la directa.
+
+Uso (en la máquina con GPU, desde backend/):
+    python benchmarks/cascade_tradeoff.py
+    python benchmarks/cascade_tradeoff.py --ratios 1:1 21:9 --seed 7
+"""
+
+import argparse
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+
+def detail(image) -> float:
+    import cv2
+    import numpy as np
+    gray = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2GRAY)
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+def timed(fn):
+    import torch
+    torch.cuda.synchronize()
+    start = time.perf_counter()
+    result = fn()
+    torch.cuda.synchronize()
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Cascade speed/quality trade-off per bucket")
+    parser.add_argument("--prompt", default="product photo of a perfume bottle on a marble table, studio lighting")
+    parser.add_argument("--ratios", nargs="*", default=None)
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    import app
+    from services.cascade import SDXL_BUCKETS, plan_cascade, relative_cost, tradeoff_table
+    from utils.config import get_setting
+
+    _, is_lightning = app.resolve_sdxl_checkpoint()
+    steps, guidance = (4, 0) if is_lightning else (30, 7.0)
+    prompt, negative = app.get_style_service().apply_style('Fooocus V2', args.prompt, '')
+    item = {"prompt": prompt, "negative_prompt": negative, "seed": args.seed}
+
+    # Warm-up: load the pipeline and compile kernels outside the measurements
+    list(app.run_sdxl_batch(app.SDXLBatchKey(512, 512, 1, guidance, is_lightning), [dict(item)]))
+
+    rows = []
+    for ratio in args.ratios or list(SDXL_BUCKETS):
+        width, height = SDXL_BUCKETS[ratio]
+        plan = plan_cascade(width, height, steps,
+                            draft_megapixels=get_setting("cascade.draft_megapixels", 0.6),
+                            draft_steps=get_setting("cascade.draft_steps", 20),
+                            refine_strength=get_setting("cascade.refine_strength", 0.3))
+
+        full, full_seconds = timed(lambda: list(app.run_sdxl_batch(
+            app.SDXLBatchKey(width, height, steps, guidance, is_lightning), [dict(item)]))[0])
+
+        ctx = {"job_id": "benchmark", "data": {**item, "steps": steps, "guidance": guidance,
+                                               "is_lightning": is_lightning, "plan": plan,
+                                               "draft_generation_id": None, "generation_id": None}}
+        _, draft_seconds = timed(lambda: app.stage_cascade_draft(ctx))
+        _, upscale_seconds = timed(lambda: (app.stage_cascade_upscale(ctx), app.stage_cascade_resize(ctx)))
+        _, refine_seconds = timed(lambda: app.stage_cascade_refine(ctx))
+
+        cost = relative_cost(plan, steps)
+        rows.append({
+            'ratio': ratio,
+            'final_size': plan['final_size'],
+            'draft_size': plan['draft_size'],
+            'full_seconds': full_seconds,
+            'draft_seconds': draft_seconds,
+            'cascade_seconds': draft_seconds + upscale_seconds + refine_seconds,
+            'detail_ratio': detail(ctx['image']) / max(detail(full), 1e-6)
+        })
+        print(f"[*] {ratio}: estimated UNet cost draft={cost['draft']} cascade={cost['cascade']} (full=1.0)")
+
+    print()
+    print(tradeoff_table(rows))
+    print("\ndetail = Laplacian variance of the cascade result / direct generation (1.0 = same sharpness)")
+
+if __name__ == "__main__":
+    main()
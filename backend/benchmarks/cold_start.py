@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Benchmark de cold start del pipeline SDXL Lightning.
+Compara la carga original (init aleatorio + state dict en CPU) con la carga
+rápida (meta device + streaming mmap) y reporta tiempo y pico de RSS por fase.
+Cada modo corre en un proceso separado para que el pico de RSS sea limpio.
+
+Uso:
+    python benchmarks/cold_start.py
+    python benchmarks/cold_start.py --mode fast --device cuda
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+def run_single(mode: str, ckpt: str, cache_dir: str, device: str):
+    from services.model_loader import PhaseTimer, build_lightning_pipeline
+
+    timer = PhaseTimer()
+    timer.phase("import")
+    import torch  # noqa: F401
+    import diffusers  # noqa: F401
+
+    pipe = build_lightning_pipeline(ckpt, cache_dir, fast=(mode == "fast"), device=device or "cpu", timer=timer)
+    if device == "cuda":
+        timer.phase("to_device")
+        pipe.to("cuda")
+        torch.cuda.synchronize()
+        timer.done()
+
+    print(json.dumps({'mode': mode, 'phases': timer.phases}))
+
+def main():
+    parser = argparse.ArgumentParser(description="SDXL cold-start benchmark")
+    parser.add_argument("--mode", choices=["legacy", "fast", "both"], default="both")
+    parser.add_argument("--ckpt", default=os.path.join(BACKEND_DIR, "models", "unet", "sdxl_lightning_4step_unet.safetensors"))
+    parser.add_argument("--cache-dir", default=os.path.join(BACKEND_DIR, "models", "diffusers"))
+    parser.add_argument("--device", default="", help="cuda para medir también la transferencia a GPU")
+    parser.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        run_single(args.mode, args.ckpt, args.cache_dir, args.device)
+        return
+
+    from services.model_loader import PhaseTimer
+
+    modes = ["legacy", "fast"] if args.mode == "both" else [args.mode]
+    for mode in modes:
+        out = subprocess.run(
+            [sys.executable, __file__, "--single", "--mode", mode, "--ckpt", args.ckpt,
+             "--cache-dir", args.cache_dir, "--device", args.device],
+            capture_output=True, text=True
+        )
+        if out.returncode != 0:
+            print(f"[!] {mode} failed:\n{out.stderr[-2000:]}")
+            continue
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        timer = PhaseTimer()
+        timer.phases = result['phases']
+        print(f"\n=== {mode} ===")
+        print(timer.report())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Benchmark del backend CPU de SDXL Lightning (4 pasos).
+Mide segundos por imagen para cada número de núcleos y precisión de pesos.
+Cada combinación corre en un proceso separado porque torch solo permite fijar
+los threads inter-op una vez por proceso.
+
+Uso:
+    python benchmarks/cpu_inference.py
+    python benchmarks/cpu_inference.py --threads 2 4 8 --dtypes bf16 int8 --size 768
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+PROMPT = "product photo of a sneaker on a marble pedestal, studio lighting"
+
+def run_single(threads: int, dtype: str, size: int, images: int, steps: int, ckpt: str, cache_dir: str):
+    from services.cpu_backend import configure_threads, prepare_pipeline
+    configure_threads(threads)
+
+    import torch
+    from services.model_loader import build_lightning_pipeline
+
+    start = time.perf_counter()
+    pipe = prepare_pipeline(build_lightning_pipeline(ckpt, cache_dir, fast=True, device="cpu"), dtype)
+    load_seconds = time.perf_counter() - start
+
+    def generate(seed):
+        with torch.no_grad():
+            pipe(prompt=PROMPT, width=size, height=size, num_inference_steps=steps, guidance_scale=0,
+                 generator=torch.Generator().manual_seed(seed))
+
+    generate(0)  # warm-up: oneDNN primitive creation and allocator growth
+    timings = []
+    for seed in range(1, images + 1):
+        start = time.perf_counter()
+        generate(seed)
+        timings.append(time.perf_counter() - start)
+
+    print(json.dumps({
+        'threads': threads, 'dtype': dtype, 'load_seconds': round(load_seconds, 1),
+        'seconds_per_image': round(sum(timings) / len(timings), 2), 'best_seconds': round(min(timings), 2)
+    }))
+
+def default_threads():
+    cores, counts = os.cpu_count() or 1, []
+    threads = 1
+    while threads < cores:
+        counts.append(threads)
+        threads *= 2
+    return counts + [cores]
+
+def main():
+    parser = argparse.ArgumentParser(description="SDXL Lightning CPU benchmark")
+    parser.add_argument("--threads", type=int, nargs="+", default=default_threads())
+    parser.add_argument("--dtypes", nargs="+", choices=["fp32", "bf16", "int8"], default=["fp32", "bf16", "int8"])
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--images", type=int, default=3)
+    parser.add_argument("--steps", type=int, default=4)
+    parser.add_argument("--ckpt", default=os.path.join(BACKEND_DIR, "models", "unet", "sdxl_lightning_4step_unet.safetensors"))
+    parser.add_argument("--cache-dir", default=os.path.join(BACKEND_DIR, "models", "diffusers"))
+    parser.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        run_single(args.threads[0], args.dtypes[0], args.size, args.images, args.steps, args.ckpt, args.cache_dir)
+        return
+
+    print(f"{'threads':>8}{'dtype':>8}{'load s':>10}{'s/image':>10}{'best s':>10}")
+    for dtype in args.dtypes:
+        for threads in args.threads:
+            out = subprocess.run(
+                [sys.executable, __file__, "--single", "--threads", str(threads), "--dtypes", dtype,
+                 "--size", str(args.size), "--images", str(args.images), "--steps", str(args.steps),
+                 "--ckpt", args.ckpt, "--cache-dir", args.cache_dir],
+                capture_output=True, text=True
+            )
+            if out.returncode != 0:
+                print(f"[!] {dtype} x{threads} failed:\n{out.stderr[-2000:]}")
+                continue
+            r = json.loads(out.stdout.strip().splitlines()[-1])
+            print(f"{r['threads']:>8}{r['dtype']:>8}{r['load_seconds']:>10}{r['seconds_per_image']:>10}{r['best_seconds']:>10}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Mantenimiento del caché de imágenes.
+
+    migrate  Mueve un caché plano (<md5>.png en data/cache) al layout ab/cd/<clave>
+             y registra tamaño y checksum de cada archivo en el índice.
+    verify   Barre los shards (temporales abandonados, imágenes sin fila en el índice)
+             y recalcula en paralelo el checksum de todas las entradas; con --repair
+             elimina las dañadas o ausentes (ejecutar con el servidor detenido).
+
+Uso:
+    python manage_cache.py migrate
+    python manage_cache.py verify --workers 8 --repair
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.cache_layout import migrate_flat_layout
+from services.cache_service import ImageCacheService
+from utils.config import get_setting
+
+def main():
+    parser = argparse.ArgumentParser(description="Image cache maintenance")
+    parser.add_argument("command", choices=["migrate", "verify"])
+    parser.add_argument("--cache-dir", default=get_setting("storage.cache_dir", "data/cache"))
+    parser.add_argument("--workers", type=int, default=None, help="Verifier threads (default: all cores)")
+    parser.add_argument("--repair", action="store_true", help="Remove damaged or missing entries")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.cache_dir):
+        print(f"[!] Cache directory not found: {args.cache_dir}")
+        return 1
+
+    # Opening the service imports legacy JSON metadata and migrates a flat layout once
+    cache = ImageCacheService(cache_dir=args.cache_dir, hot_max_bytes=0)
+    try:
+        if args.command == "migrate":
+            # Re-run even if the marker exists: picks up files copied in flat after the first migration
+            stats = migrate_flat_layout(args.cache_dir, cache.index)
+            print(f"[✓] {stats['moved']} files moved, {stats['adopted']} adopted, "
+                  f"{stats['removed_tmp']} temp files removed; {cache.index.entries} entries indexed")
+            return 0
+
+        swept = cache.sweep()
+        print(f"[*] Sweep: {swept['removed_tmp']} temp files removed, {swept['adopted']} files adopted, "
+              f"{swept['removed_orphans']} orphans removed")
+        report = cache.verify(workers=args.workers, repair=args.repair)
+        print(f"[*] Verified {report['entries']} entries with {report['workers']} threads in {report['seconds']}s")
+        for status in ('ok', 'unverified', 'missing', 'size_mismatch', 'checksum_mismatch', 'unreadable'):
+            print(f"    {status:>18}: {report[status]}")
+        if report['unverified']:
+            print(f"[*] Stored checksums for {report['unverified']} entries that had none")
+        if report['damaged'] and not args.repair:
+            print("[!] Damaged entries found; run again with --repair to remove them")
+        elif report['repaired']:
+            print(f"[✓] Removed {report['repaired']} damaged entries")
+        return 1 if report['damaged'] and not args.repair else 0
+    finally:
+        cache.index.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,10 +3,32 @@ Servicios de EnfoadsIA.
 
 Este paquete contiene todos los servicios de IA y procesamiento:
 - cache_service: Sistema de caché de imágenes
+- cache_index: Índice SQLite del caché con estadísticas de acceso por lotes
+- cache_layout: Layout ab/cd/<clave> con escrituras atómicas, migración y verificación paralela
+- cache_evictor: Desalojo LRU/LFU del caché por presupuesto de bytes con marcas alta/baja
+- hot_cache: Tier en memoria de respuestas ya codificadas delante del caché en disco
+- generation_spec: Especificación canónica de una generación y su clave de caché BLAKE2
 - upscale_service: Upscaling con Real-ESRGAN
 - liveportrait_service: Animación facial con LivePortrait
 - subtitle_service: Subtítulos automáticos con Faster-Whisper
 - face_swap_service: Intercambio de rostros con InsightFace
+- worker_pool: Pool de workers con carriles GPU y CPU
+- job_store: Almacén persistente de jobs en SQLite
+- vram_manager: Presupuesto de VRAM multi-modelo con desalojo LRU
+- prefetcher: Prefetch del modelo del próximo trabajo en la cola GPU
+- batcher: Micro-batching dinámico de peticiones de inferencia
+- embedding_cache: Caché LRU de embeddings de texto SDXL
+- model_loader: Carga rápida (mmap, sin init) del pipeline SDXL
+- model_snapshot: Snapshot pre-fusionado del pipeline SDXL en un solo safetensors
+- preview_service: Previews en vivo de latentes (lineal o TAESD)
+- image_output: Negociación de formato de las imágenes de respuesta (binario, URL, base64)
+- latent_store: Latentes recientes para variaciones y refinados
+- cascade: Planificación de la cascada borrador + Real-ESRGAN + refinado
+- memory_planner: Plan de memoria (attention slicing, VAE slicing/tiling) según VRAM libre
+- lora_service: LoRAs intercambiables en caliente con caché LRU de tensores en CPU
+- inpaint: Recorte, ajuste a bucket y mezcla suavizada para inpainting por región
+- controlnet: Preprocesadores ControlNet y caché de mapas por hash de contenido
+- cpu_backend: Backend de inferencia en CPU (fp32/bf16/int8) que sustituye al gestor de VRAM
 """
 
 __all__ = [
@@ -15,4 +37,8 @@ __all__ = [
     'get_liveportrait_service',
     'get_subtitle_service',
     'get_face_swap_service',
+    'get_worker_pool',
+    'get_job_store',
+    'get_vram_manager',
+    'get_embedding_cache',
 ]
@@ -0,0 +1,136 @@
+"""
+Micro-batching dinámico para inferencia.
+Agrupa durante unos milisegundos las peticiones compatibles (misma clave:
+resolución, pasos, guidance, modo) y las ejecuta en una sola llamada batch,
+devolviendo a cada petición su propio resultado.
+"""
+
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+class BatchItem:
+    def __init__(self, key: Hashable, payload: Any):
+        self.key = key
+        self.payload = payload
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+
+class MicroBatcher:
+    def __init__(self, run_batch: Callable[[Hashable, List[Any]], List[Any]],
+                 window_ms: float = 30, max_batch_size: int = 4,
+                 max_batch_fn: Optional[Callable[[Hashable], int]] = None,
+                 dispatch: Optional[Callable[[Callable[[], None]], Any]] = None):
+        """
+        Args:
+            run_batch: Función run_batch(key, payloads) que retorna (o va generando, en orden) un resultado por payload
+            window_ms: Milisegundos que se espera a peticiones compatibles
+            max_batch_size: Tamaño máximo de batch
+            max_batch_fn: Límite de batch por clave (ej: según presupuesto de memoria)
+            dispatch: Cómo ejecutar cada batch (default: en el thread del colector)
+        """
+        self.run_batch = run_batch
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_batch_fn = max_batch_fn
+        self.dispatch = dispatch or (lambda fn: fn())
+
+        self.batches = 0
+        self.items = 0
+        self._pending: Dict[Hashable, List[BatchItem]] = {}
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, key: Hashable, payload: Any) -> Future:
+        """
+        Encola una petición.
+
+        Args:
+            key: Clave de compatibilidad; solo se agrupan peticiones con la misma clave
+            payload: Datos propios de la petición (prompt, negative, seed...)
+
+        Returns:
+            Future con el resultado individual de la petición
+        """
+        item = BatchItem(key, payload)
+        with self._cond:
+            self._pending.setdefault(key, []).append(item)
+            self._cond.notify()
+        return item.future
+
+    def submit_many(self, key: Hashable, payloads: List[Any]) -> List[Future]:
+        """Encola varias peticiones a la vez para que caigan en el mismo batch."""
+        items = [BatchItem(key, payload) for payload in payloads]
+        with self._cond:
+            self._pending.setdefault(key, []).extend(items)
+            self._cond.notify()
+        return [item.future for item in items]
+
+    def batch_limit(self, key: Hashable) -> int:
+        limit = self.max_batch_size
+        if self.max_batch_fn is not None:
+            limit = min(limit, self.max_batch_fn(key))
+        return max(1, limit)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+
+                now = time.monotonic()
+                ready = []
+                next_deadline = None
+                for key, items in list(self._pending.items()):
+                    deadline = items[0].enqueued_at + self.window
+                    if now >= deadline or len(items) >= self.batch_limit(key):
+                        ready.append((key, self._pending.pop(key)))
+                    elif next_deadline is None or deadline < next_deadline:
+                        next_deadline = deadline
+
+                if not ready:
+                    self._cond.wait(max(0.0, next_deadline - now))
+                    continue
+
+            for key, items in ready:
+                limit = self.batch_limit(key)
+                for start in range(0, len(items), limit):
+                    self._dispatch_batch(key, items[start:start + limit])
+
+    def _dispatch_batch(self, key: Hashable, items: List[BatchItem]):
+        self.batches += 1
+        self.items += len(items)
+
+        def run():
+            # run_batch may return a list or yield results in order; each future resolves as soon as its result exists
+            delivered = 0
+            try:
+                for result in self.run_batch(key, [item.payload for item in items]):
+                    if delivered == len(items):
+                        raise RuntimeError(f"Batch returned more than {len(items)} results")
+                    items[delivered].future.set_result(result)
+                    delivered += 1
+                if delivered != len(items):
+                    raise RuntimeError(f"Batch returned {delivered} results for {len(items)} requests")
+            except BaseException as e:
+                for item in items:
+                    if not item.future.done():
+                        item.future.set_exception(e)
+
+        try:
+            self.dispatch(run)
+        except BaseException as e:
+            for item in items:
+                if not item.future.done():
+                    item.future.set_exception(e)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'batches': self.batches,
+            'requests': self.items,
+            'avg_batch_size': round(self.items / self.batches, 2) if self.batches else 0,
+            'window_ms': round(self.window * 1000, 1),
+            'max_batch_size': self.max_batch_size
+        }
@@ -0,0 +1,154 @@
+"""
+Desalojo en segundo plano del caché de imágenes según un presupuesto de bytes.
+Usa la contabilidad incremental del índice (sin recorrer el directorio) con
+dos marcas: al superar high_watermark se desalojan entradas LRU o LFU hasta
+bajar de low_watermark. Opcionalmente, las entradas PNG frías se recomprimen
+a WebP sin pérdida antes de desalojar nada.
+"""
+
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from .cache_index import EVICTION_ORDER
+
+class CacheEvictor:
+    def __init__(self, cache: Any, max_bytes: int, policy: str = 'lru', high_watermark: float = 0.95,
+                 low_watermark: float = 0.85, interval_seconds: float = 60,
+                 recompress_after_seconds: Optional[float] = None, recompress_batch: int = 32,
+                 batch_size: int = 256):
+        """
+        Args:
+            cache: ImageCacheService a vigilar
+            max_bytes: Presupuesto total del caché en disco
+            policy: 'lru' o 'lfu'
+            high_watermark: Fracción del presupuesto que dispara el desalojo
+            low_watermark: Fracción a la que se baja tras desalojar
+            interval_seconds: Periodo de la pasada de fondo
+            recompress_after_seconds: Antigüedad del último acceso para recomprimir a WebP (None = no recomprimir)
+            recompress_batch: Máximo de entradas recomprimidas por pasada
+            batch_size: Candidatos leídos del índice por consulta
+        """
+        if policy not in EVICTION_ORDER:
+            raise ValueError(f"Unsupported eviction policy: {policy}")
+        if not 0 < low_watermark < high_watermark <= 1:
+            raise ValueError("Watermarks must satisfy 0 < low_watermark < high_watermark <= 1")
+        self.cache = cache
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.high_bytes = int(max_bytes * high_watermark)
+        self.low_bytes = int(max_bytes * low_watermark)
+        self.interval_seconds = interval_seconds
+        self.recompress_after_seconds = recompress_after_seconds
+        self.recompress_batch = recompress_batch
+        self.batch_size = batch_size
+
+        self.passes = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self.recompressed = 0
+        self.reclaimed_bytes = 0
+        self.last_pass_seconds = 0.0
+        self._pass_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def notify(self):
+        """Llamado tras cada escritura: despierta al evictor si se superó la marca alta (O(1))."""
+        if self.cache.index.total_bytes > self.high_bytes:
+            self._wake.set()
+
+    def recompress_cold(self, now: Optional[float] = None) -> int:
+        """Recomprime a WebP sin pérdida las entradas PNG sin accesos recientes. Retorna bytes recuperados."""
+        if self.recompress_after_seconds is None:
+            return 0
+        now = time.time() if now is None else now
+        reclaimed = 0
+        for cache_key, _ in self.cache.index.cold_entries(now - self.recompress_after_seconds,
+                                                          limit=self.recompress_batch):
+            try:
+                saved = self.cache.recompress_entry(cache_key)
+            except OSError as e:
+                print(f"[!] Could not recompress cache entry {cache_key}: {e}")
+                continue
+            if saved > 0:
+                self.recompressed += 1
+                reclaimed += saved
+        self.reclaimed_bytes += reclaimed
+        return reclaimed
+
+    def evict(self) -> int:
+        """Si el caché supera la marca alta, desaloja hasta la marca baja. Retorna entradas desalojadas."""
+        index = self.cache.index
+        if index.total_bytes <= self.high_bytes:
+            return 0
+        evicted = 0
+        while index.total_bytes > self.low_bytes:
+            candidates = index.eviction_candidates(self.policy, self.batch_size)
+            if not candidates:
+                break
+            victims, projected = [], index.total_bytes
+            for cache_key, size_bytes, image_format in candidates:
+                if projected <= self.low_bytes:
+                    break
+                victims.append((cache_key, image_format))
+                projected -= size_bytes
+            # Only what was still indexed counts: a victim may already be gone (clear_old_cache, a corrupt read)
+            removed = self.cache.remove_entries(victims)
+            evicted += len(removed)
+            self.evicted_bytes += sum(removed.values())
+        self.evictions += evicted
+        return evicted
+
+    def run_once(self, now: Optional[float] = None) -> Dict[str, int]:
+        """Una pasada: recompresión de entradas frías y, si hace falta, desalojo."""
+        with self._pass_lock:
+            start = time.perf_counter()
+            reclaimed = self.recompress_cold(now)
+            evicted = self.evict()
+            self.passes += 1
+            self.last_pass_seconds = time.perf_counter() - start
+        if evicted:
+            print(f"[✓] Cache evictor: removed {evicted} entries ({self.policy}), "
+                  f"{self.cache.index.total_bytes / (1024 * 1024):.1f} MB in use")
+        return {'evicted': evicted, 'reclaimed_bytes': reclaimed}
+
+    def start(self):
+        """Thread de fondo: una pasada cada interval_seconds o en cuanto notify() detecta la marca alta."""
+        if self._thread is not None:
+            return
+
+        def run():
+            while not self._stopped.is_set():
+                try:
+                    self.run_once()
+                except Exception as e:
+                    print(f"[!] Cache evictor error: {e}")
+                self._wake.wait(self.interval_seconds)
+                self._wake.clear()
+
+        self._thread = threading.Thread(target=run, daemon=True, name="cache-evictor")
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'policy': self.policy,
+            'max_mb': round(self.max_bytes / (1024 * 1024), 2),
+            'used_mb': round(self.cache.index.total_bytes / (1024 * 1024), 2),
+            'high_watermark_mb': round(self.high_bytes / (1024 * 1024), 2),
+            'low_watermark_mb': round(self.low_bytes / (1024 * 1024), 2),
+            'passes': self.passes,
+            'evictions': self.evictions,
+            'evicted_mb': round(self.evicted_bytes / (1024 * 1024), 2),
+            'recompressed': self.recompressed,
+            'reclaimed_mb': round(self.reclaimed_bytes / (1024 * 1024), 2),
+            'last_pass_ms': round(self.last_pass_seconds * 1000, 1)
+        }
@@ -0,0 +1,306 @@
+"""
+Índice SQLite (modo WAL) de las entradas del caché de imágenes.
+Sustituye al cache_metadata.json: cada escritura o consulta toca una sola
+fila, y las estadísticas de acceso (last_accessed, access_count) se acumulan
+en memoria y se vuelcan por lotes en segundo plano.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    last_accessed REAL NOT NULL,
+    access_count INTEGER NOT NULL DEFAULT 1,
+    size_bytes INTEGER NOT NULL DEFAULT 0,
+    metadata TEXT,
+    format TEXT NOT NULL DEFAULT 'png',
+    checksum TEXT
+);
+"""
+# Columns added after the first release, created on older databases with ALTER TABLE
+ADDED_COLUMNS = {
+    'format': "format TEXT NOT NULL DEFAULT 'png'",
+    'checksum': "checksum TEXT",
+}
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_entries_last_accessed ON entries(last_accessed);
+CREATE INDEX IF NOT EXISTS idx_entries_created_at ON entries(created_at);
+CREATE INDEX IF NOT EXISTS idx_entries_access_count ON entries(access_count, last_accessed);
+"""
+
+COLUMNS = ('created_at', 'last_accessed', 'access_count', 'size_bytes', 'format', 'checksum')
+# Order in which each policy gives up entries
+EVICTION_ORDER = {
+    'lru': "last_accessed ASC",
+    'lfu': "access_count ASC, last_accessed ASC",
+}
+
+class CacheIndex:
+    def __init__(self, db_path: str, flush_interval: float = 2.0, max_pending: int = 1000):
+        """
+        Args:
+            db_path: Ruta del archivo SQLite
+            flush_interval: Segundos entre volcados de las estadísticas de acceso
+            max_pending: Accesos pendientes que fuerzan un volcado inmediato
+        """
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.flushes = 0
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(entries)")}
+        for name, definition in ADDED_COLUMNS.items():
+            if name not in columns:
+                self._conn.execute(f"ALTER TABLE entries ADD COLUMN {definition}")
+        self._conn.executescript(INDEXES)
+
+        # key -> (last_accessed, accesses not yet written)
+        self._pending: Dict[str, Tuple[float, int]] = {}
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._flusher = None
+
+        row = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM entries").fetchone()
+        self.entries, self.total_bytes = row[0], row[1]
+
+    def _row_to_dict(self, row: Tuple) -> Dict[str, Any]:
+        key, created_at, last_accessed, access_count, size_bytes, metadata, image_format, checksum = row
+        entry = {**json.loads(metadata or '{}'), 'created_at': created_at, 'last_accessed': last_accessed,
+                 'access_count': access_count, 'size_bytes': size_bytes, 'format': image_format,
+                 'checksum': checksum}
+        pending = self._pending.get(key)
+        if pending is not None:
+            entry['last_accessed'] = max(entry['last_accessed'], pending[0])
+            entry['access_count'] += pending[1]
+        return entry
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Entrada con sus metadatos (incluye los accesos aún no volcados) o None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT key, created_at, last_accessed, access_count, size_bytes, metadata, format, checksum FROM entries WHERE key = ?",
+                (key,)
+            ).fetchone()
+            return self._row_to_dict(row) if row else None
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone() is not None
+
+    def put(self, key: str, size_bytes: int, metadata: Dict[str, Any] = None, now: Optional[float] = None,
+            image_format: str = 'png', checksum: Optional[str] = None):
+        """Inserta o reemplaza una entrada (una sola fila, sin reescribir el índice)."""
+        now = time.time() if now is None else now
+        extra = {k: v for k, v in (metadata or {}).items() if k not in COLUMNS}
+        with self._lock:
+            previous = self._conn.execute("SELECT size_bytes FROM entries WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries "
+                "(key, created_at, last_accessed, access_count, size_bytes, metadata, format, checksum) "
+                "VALUES (?, ?, ?, 1, ?, ?, ?, ?)",
+                (key, now, now, size_bytes, json.dumps(extra), image_format, checksum)
+            )
+            self._pending.pop(key, None)
+            if previous is None:
+                self.entries += 1
+                self.total_bytes += size_bytes
+            else:
+                self.total_bytes += size_bytes - previous[0]
+
+    def update(self, key: str, **fields):
+        """Modifica columnas de una entrada (created_at, last_accessed, access_count, size_bytes, format, checksum)."""
+        unknown = set(fields) - set(COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown cache index fields: {', '.join(sorted(unknown))}")
+        if not fields:
+            return
+        with self._lock:
+            if 'size_bytes' in fields:
+                previous = self._conn.execute("SELECT size_bytes FROM entries WHERE key = ?", (key,)).fetchone()
+                if previous is not None:
+                    self.total_bytes += fields['size_bytes'] - previous[0]
+            assignments = ", ".join(f"{name} = ?" for name in fields)
+            self._conn.execute(f"UPDATE entries SET {assignments} WHERE key = ?", (*fields.values(), key))
+
+    def touch(self, key: str, now: Optional[float] = None):
+        """Registra un acceso en memoria; se escribe en el próximo volcado por lotes."""
+        now = time.time() if now is None else now
+        with self._lock:
+            _, count = self._pending.get(key, (now, 0))
+            self._pending[key] = (now, count + 1)
+            pending = len(self._pending)
+        if pending >= self.max_pending:
+            self._wake.set()
+
+    def flush(self) -> int:
+        """Vuelca los accesos pendientes en una sola transacción. Retorna cuántas entradas actualizó."""
+        with self._lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "UPDATE entries SET last_accessed = MAX(last_accessed, ?), access_count = access_count + ? "
+                    "WHERE key = ?",
+                    [(last_accessed, count, key) for key, (last_accessed, count) in batch.items()]
+                )
+                self._conn.execute("COMMIT")
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                # Keep the stats for the next attempt
+                for key, value in batch.items():
+                    last_accessed, count = self._pending.get(key, (0, 0))
+                    self._pending[key] = (max(last_accessed, value[0]), count + value[1])
+                raise
+            self.flushes += 1
+            return len(batch)
+
+    def delete(self, keys: List[str]) -> Dict[str, int]:
+        """Elimina entradas. Retorna {key: size_bytes} de las que existían."""
+        removed = {}
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for key in keys:
+                    row = self._conn.execute("SELECT size_bytes FROM entries WHERE key = ?", (key,)).fetchone()
+                    if row is None:
+                        continue
+                    self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    self._pending.pop(key, None)
+                    self.entries -= 1
+                    self.total_bytes -= row[0]
+                    removed[key] = row[0]
+                self._conn.execute("COMMIT")
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+        return removed
+
+    def entries_created_before(self, timestamp: float) -> List[Tuple[str, str]]:
+        """(key, format) de las entradas creadas antes de `timestamp`."""
+        with self._lock:
+            return [tuple(row) for row in self._conn.execute(
+                "SELECT key, format FROM entries WHERE created_at < ?", (timestamp,))]
+
+    def eviction_candidates(self, policy: str = 'lru', limit: int = 256) -> List[Tuple[str, int, str]]:
+        """
+        Entradas a desalojar primero según la política.
+
+        Args:
+            policy: 'lru' (menos recientes) o 'lfu' (menos accedidas, desempate por antigüedad)
+            limit: Máximo de entradas devueltas
+
+        Returns:
+            Lista de (key, size_bytes, format)
+        """
+        if policy not in EVICTION_ORDER:
+            raise ValueError(f"Unsupported eviction policy: {policy}")
+        # Pending hits must count, or a hot key could be evicted between flushes
+        self.flush()
+        with self._lock:
+            return [tuple(row) for row in self._conn.execute(
+                f"SELECT key, size_bytes, format FROM entries ORDER BY {EVICTION_ORDER[policy]} LIMIT ?", (limit,))]
+
+    def cold_entries(self, accessed_before: float, image_format: str = 'png', limit: int = 64) -> List[Tuple[str, int]]:
+        """(key, size_bytes) de entradas en `image_format` sin accesos desde `accessed_before`."""
+        self.flush()
+        with self._lock:
+            return [tuple(row) for row in self._conn.execute(
+                "SELECT key, size_bytes FROM entries WHERE format = ? AND last_accessed < ? "
+                "ORDER BY last_accessed ASC LIMIT ?", (image_format, accessed_before, limit))]
+
+    def file_entries(self) -> List[Tuple[str, str, int, Optional[str]]]:
+        """(key, format, size_bytes, checksum) de todas las entradas, sin decodificar la metadata."""
+        with self._lock:
+            return [tuple(row) for row in self._conn.execute("SELECT key, format, size_bytes, checksum FROM entries")]
+
+    def items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Todas las entradas (materializadas bajo el lock para no bloquearlo durante la iteración)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, created_at, last_accessed, access_count, size_bytes, metadata, format, checksum FROM entries").fetchall()
+            entries = [(row[0], self._row_to_dict(row)) for row in rows]
+        return iter(entries)
+
+    def total_accesses(self) -> int:
+        with self._lock:
+            stored = self._conn.execute("SELECT COALESCE(SUM(access_count), 0) FROM entries").fetchone()[0]
+            return stored + sum(count for _, count in self._pending.values())
+
+    def import_json(self, metadata_file: str) -> int:
+        """Migra un cache_metadata.json del formato anterior (una vez) y lo renombra a .migrated."""
+        if not os.path.exists(metadata_file):
+            return 0
+        try:
+            with open(metadata_file, 'r') as f:
+                legacy = json.load(f)
+        except (OSError, ValueError):
+            legacy = {}
+
+        rows = []
+        for key, meta in legacy.items():
+            extra = {k: v for k, v in meta.items() if k not in COLUMNS}
+            created_at = meta.get('created_at', time.time())
+            rows.append((key, created_at, meta.get('last_accessed', created_at), meta.get('access_count', 1),
+                         meta.get('size_bytes', 0), json.dumps(extra), meta.get('format', 'png')))
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO entries (key, created_at, last_accessed, access_count, size_bytes, metadata, format) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.execute("COMMIT")
+            row = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM entries").fetchone()
+            self.entries, self.total_bytes = row[0], row[1]
+        os.replace(metadata_file, metadata_file + ".migrated")
+        print(f"[✓] Migrated {len(rows)} cache entries from {os.path.basename(metadata_file)}")
+        return len(rows)
+
+    def start_flusher(self):
+        """Thread en segundo plano que vuelca los accesos cada flush_interval (o antes si se acumulan)."""
+        if self._flusher is not None:
+            return
+
+        def run():
+            while not self._stopped.is_set():
+                self._wake.wait(self.flush_interval)
+                self._wake.clear()
+                try:
+                    self.flush()
+                except sqlite3.Error as e:
+                    print(f"[!] Cache index flush failed: {e}")
+
+        self._flusher = threading.Thread(target=run, daemon=True, name="cache-index-flusher")
+        self._flusher.start()
+
+    def close(self):
+        """Detiene el flusher, vuelca lo pendiente y cierra la conexión."""
+        self._stopped.set()
+        self._wake.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=5)
+            self._flusher = None
+        self.flush()
+        with self._lock:
+            self._conn.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'entries': self.entries,
+            'size_bytes': self.total_bytes,
+            'pending_accesses': len(self._pending),
+            'flushes': self.flushes
+        }
@@ -0,0 +1,236 @@
+"""
+Layout en disco del caché de imágenes.
+Los archivos se reparten en subdirectorios ab/cd/<clave>.<formato> (dos
+niveles de 256) para que ningún directorio crezca sin límite, se escriben en
+un temporal y se confirman con os.replace (un corte a mitad de escritura nunca
+deja un PNG truncado bajo su nombre final) y su checksum BLAKE2 queda en el
+índice. Incluye la migración desde el layout plano, un barrido de restos de
+escrituras interrumpidas y un verificador paralelo.
+"""
+
+import hashlib
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+LAYOUT_MARKER = ".layout"
+LAYOUT_VERSION = "sharded-v1"
+IMAGE_EXTENSIONS = ('png', 'webp')
+# Files younger than this may belong to a write in progress (temp file not yet replaced, row not yet indexed)
+SWEEP_GRACE_SECONDS = 600
+_READ_CHUNK = 1024 * 1024
+
+def shard_path(cache_dir: str, cache_key: str, image_format: str = 'png') -> str:
+    """Ruta <cache_dir>/ab/cd/<clave>.<formato> (las claves cortas se rellenan con '_')."""
+    prefix = cache_key.ljust(4, '_')
+    return os.path.join(cache_dir, prefix[:2], prefix[2:4], f"{cache_key}.{image_format}")
+
+def checksum_bytes(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def checksum_file(path: str) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_READ_CHUNK), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def write_atomic(path: str, data: bytes):
+    """Escribe en un temporal del mismo directorio, fsync y os.replace: el archivo final está completo o no existe."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def is_migrated(cache_dir: str) -> bool:
+    try:
+        with open(os.path.join(cache_dir, LAYOUT_MARKER), 'r') as f:
+            return f.read().strip() == LAYOUT_VERSION
+    except OSError:
+        return False
+
+def migrate_flat_layout(cache_dir: str, index: Any) -> Dict[str, int]:
+    """
+    Mueve un caché plano (<cache_dir>/<clave>.png) al layout por shards.
+
+    Las entradas del índice reciben checksum y tamaño reales; los archivos sin
+    fila se adoptan (created_at = mtime) y los temporales huérfanos se borran.
+    Es idempotente y deja un marcador para no volver a recorrer el directorio.
+
+    Args:
+        cache_dir: Carpeta del caché
+        index: CacheIndex del caché
+
+    Returns:
+        Conteos: moved, adopted, removed_tmp
+    """
+    stats = {'moved': 0, 'adopted': 0, 'removed_tmp': 0}
+    with os.scandir(cache_dir) as entries:
+        files = [entry for entry in entries if entry.is_file()]
+
+    for entry in files:
+        name, extension = os.path.splitext(entry.name)
+        extension = extension.lstrip('.')
+        if extension == 'tmp':
+            os.remove(entry.path)
+            stats['removed_tmp'] += 1
+            continue
+        if extension not in IMAGE_EXTENSIONS:
+            continue
+
+        target = shard_path(cache_dir, name, extension)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(entry.path, target)
+        size, checksum = os.path.getsize(target), checksum_file(target)
+        if name in index:
+            index.update(name, size_bytes=size, format=extension, checksum=checksum)
+        else:
+            index.put(name, size, now=os.path.getmtime(target), image_format=extension, checksum=checksum)
+            stats['adopted'] += 1
+        stats['moved'] += 1
+
+    with open(os.path.join(cache_dir, LAYOUT_MARKER), 'w') as f:
+        f.write(LAYOUT_VERSION)
+    if stats['moved']:
+        print(f"[✓] Cache layout migrated: {stats['moved']} files sharded ({stats['adopted']} adopted)")
+    return stats
+
+def _shard_files(cache_dir: str):
+    """Archivos dentro de <cache_dir>/ab/cd/ (solo los dos niveles de shards)."""
+    with os.scandir(cache_dir) as level1:
+        outer = [entry.path for entry in level1 if entry.is_dir() and len(entry.name) == 2]
+    for outer_dir in outer:
+        with os.scandir(outer_dir) as level2:
+            inner = [entry.path for entry in level2 if entry.is_dir() and len(entry.name) == 2]
+        for inner_dir in inner:
+            with os.scandir(inner_dir) as files:
+                yield from [entry for entry in files if entry.is_file()]
+
+def sweep_shards(cache_dir: str, index: Any, grace_seconds: float = SWEEP_GRACE_SECONDS,
+                 now: Optional[float] = None) -> Dict[str, int]:
+    """
+    Limpia lo que deja un proceso que muere a mitad de save_to_cache o de una recompresión.
+
+    Borra los temporales (*.tmp) abandonados, adopta en el índice las imágenes
+    sin fila (para que cuenten en el presupuesto del evictor) y elimina las que
+    quedaron en un formato distinto del que registra el índice.
+
+    Args:
+        cache_dir: Carpeta del caché
+        index: CacheIndex del caché
+        grace_seconds: Antigüedad mínima (mtime) para tocar un archivo
+        now: Instante de referencia (default: ahora)
+
+    Returns:
+        Conteos: removed_tmp, adopted, removed_orphans
+    """
+    now = time.time() if now is None else now
+    stats = {'removed_tmp': 0, 'adopted': 0, 'removed_orphans': 0}
+    indexed = {cache_key: image_format for cache_key, image_format, _, _ in index.file_entries()}
+
+    for entry in _shard_files(cache_dir):
+        name, extension = os.path.splitext(entry.name)
+        extension = extension.lstrip('.')
+        try:
+            mtime = entry.stat().st_mtime
+            if now - mtime < grace_seconds:
+                continue
+            if extension == 'tmp':
+                os.remove(entry.path)
+                stats['removed_tmp'] += 1
+                continue
+            if extension not in IMAGE_EXTENSIONS or indexed.get(name) == extension:
+                continue
+
+            # Re-read the row: it may have been written after the snapshot
+            current = index.get(name)
+            if current is None:
+                index.put(name, os.path.getsize(entry.path), now=mtime, image_format=extension,
+                          checksum=checksum_file(entry.path))
+                stats['adopted'] += 1
+            elif current['format'] != extension:
+                os.remove(entry.path)
+                stats['removed_orphans'] += 1
+        except FileNotFoundError:
+            continue
+
+    if any(stats.values()):
+        print(f"[✓] Cache sweep: {stats['removed_tmp']} temp files removed, {stats['adopted']} files adopted, "
+              f"{stats['removed_orphans']} orphans removed")
+    return stats
+
+def _verify_one(cache_dir: str, row: Tuple[str, str, int, Optional[str]]) -> Tuple[str, str, Optional[str]]:
+    cache_key, image_format, size_bytes, checksum = row
+    path = shard_path(cache_dir, cache_key, image_format)
+    try:
+        if os.path.getsize(path) != size_bytes:
+            return cache_key, 'size_mismatch', None
+        actual = checksum_file(path)
+    except FileNotFoundError:
+        return cache_key, 'missing', None
+    except OSError:
+        return cache_key, 'unreadable', None
+    if checksum is None:
+        return cache_key, 'unverified', actual
+    return cache_key, ('ok' if actual == checksum else 'checksum_mismatch'), actual
+
+def verify_cache(cache_dir: str, index: Any, workers: Optional[int] = None, repair: bool = False,
+                 backfill: bool = True) -> Dict[str, Any]:
+    """
+    Comprueba tamaño y checksum de todas las entradas en paralelo.
+
+    hashlib libera el GIL al hashear, así que un pool de threads reparte la
+    lectura y el BLAKE2 entre todos los núcleos sin copiar datos entre procesos.
+
+    Args:
+        cache_dir: Carpeta del caché
+        index: CacheIndex del caché
+        workers: Threads (default: número de núcleos)
+        repair: Eliminar del índice y del disco las entradas dañadas o ausentes
+        backfill: Guardar el checksum de las entradas que no lo tenían
+
+    Returns:
+        Conteo por estado, claves dañadas y duración
+    """
+    start = time.perf_counter()
+    rows = index.file_entries()
+    workers = workers or os.cpu_count() or 1
+    counts = {status: 0 for status in ('ok', 'unverified', 'missing', 'size_mismatch', 'checksum_mismatch', 'unreadable')}
+    damaged: List[Tuple[str, str]] = []
+    formats = {row[0]: row[1] for row in rows}
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for cache_key, status, actual in pool.map(lambda row: _verify_one(cache_dir, row), rows):
+            counts[status] += 1
+            if status == 'unverified' and backfill:
+                index.update(cache_key, checksum=actual)
+            elif status not in ('ok', 'unverified'):
+                damaged.append((cache_key, status))
+
+    if repair and damaged:
+        index.delete([cache_key for cache_key, _ in damaged])
+        for cache_key, _ in damaged:
+            try:
+                os.remove(shard_path(cache_dir, cache_key, formats[cache_key]))
+            except FileNotFoundError:
+                pass
+
+    return {
+        'entries': len(rows),
+        **counts,
+        'damaged': damaged,
+        'repaired': len(damaged) if repair else 0,
+        'workers': workers,
+        'seconds': round(time.perf_counter() - start, 2)
+    }
@@ -1,61 +1,158 @@
 """
 Sistema de caché de imágenes para evitar regenerar contenido idéntico.
-Usa hash MD5 de los parámetros de generación como clave.
+La clave es el hash BLAKE2 de la GenerationSpec canónica (services/generation_spec.py).
+La metadata vive en un índice SQLite (cache_index.db); los accesos se
+acumulan en memoria y se vuelcan por lotes (ver services/cache_index.py).
+Los archivos siguen el layout ab/cd/<clave> con escrituras atómicas y
+checksum en el índice (ver services/cache_layout.py).
 """
 
+import atexit
 import os
-import hashlib
-import json
+import threading
 import time
-from typing import Optional, Dict, Any
+from collections.abc import Mapping
+from io import BytesIO
+from typing import Optional, Dict, Any, Iterator, List, Tuple, Callable, Hashable, Union
+
+from PIL import Image
+
+from .cache_evictor import CacheEvictor
+from .cache_index import CacheIndex
+from .cache_layout import (checksum_bytes, is_migrated, migrate_flat_layout, shard_path, sweep_shards,
+                           verify_cache, write_atomic)
+from .generation_spec import GenerationSpec
+from .hot_cache import HotImageCache
+
+class MetadataView(Mapping):
+    """Vista de solo lectura del índice con la interfaz del antiguo dict de metadata."""
+
+    def __init__(self, index: CacheIndex):
+        self.index = index
+
+    def __getitem__(self, cache_key: str) -> Dict[str, Any]:
+        entry = self.index.get(cache_key)
+        if entry is None:
+            raise KeyError(cache_key)
+        return entry
+
+    def __contains__(self, cache_key: object) -> bool:
+        return isinstance(cache_key, str) and cache_key in self.index
+
+    def __iter__(self) -> Iterator[str]:
+        return (cache_key for cache_key, _ in self.index.items())
+
+    def __len__(self) -> int:
+        return self.index.entries
 
 class ImageCacheService:
-    def __init__(self, cache_dir: str = "data/cache"):
+    def __init__(self, cache_dir: str = "data/cache", flush_interval: float = 2.0, max_pending: int = 1000,
+                 hot_max_bytes: int = 64 * 1024 * 1024, hot_promote_after: int = 2):
+        """
+        Args:
+            cache_dir: Carpeta de las imágenes y del índice
+            flush_interval: Segundos entre volcados de las estadísticas de acceso
+            max_pending: Accesos pendientes que fuerzan un volcado
+            hot_max_bytes: Memoria del tier de respuestas ya codificadas (0 = desactivado)
+            hot_promote_after: Hits de disco antes de subir una clave al tier en memoria
+        """
         self.cache_dir = cache_dir
         self.metadata_file = os.path.join(cache_dir, "cache_metadata.json")
         os.makedirs(cache_dir, exist_ok=True)
-        self.metadata = self._load_metadata()
+        self.index = CacheIndex(os.path.join(cache_dir, "cache_index.db"),
+                                flush_interval=flush_interval, max_pending=max_pending)
+        self.index.import_json(self.metadata_file)
+        if not is_migrated(cache_dir):
+            migrate_flat_layout(cache_dir, self.index)
+        self.metadata = MetadataView(self.index)
+        self.hot = HotImageCache(max_bytes=hot_max_bytes, promote_after=hot_promote_after)
+        # Size-bounded background eviction (see services/cache_evictor.py), attached by get_cache_service()
+        self.evictor = None
     
-    def _load_metadata(self) -> Dict:
-        """Carga metadata del caché desde disco."""
-        if os.path.exists(self.metadata_file):
-            try:
-                with open(self.metadata_file, 'r') as f:
-                    return json.load(f)
-            except:
-                return {}
-        return {}
+    def _path(self, cache_key: str, image_format: str = 'png') -> str:
+        return shard_path(self.cache_dir, cache_key, image_format)
     
-    def _save_metadata(self):
-        """Guarda metadata del caché a disco."""
-        with open(self.metadata_file, 'w') as f:
-            json.dump(self.metadata, f, indent=2)
-    
-    def get_cache_key(self, prompt: str, steps: int = 4, guidance: float = 0, 
+    def get_cache_key(self, prompt: Union[str, GenerationSpec], steps: int = 4, guidance: float = 0,
                      width: int = 1024, height: int = 1024, **kwargs) -> str:
         """
         Genera una clave única basada en los parámetros de generación.
         
         Args:
-            prompt: Texto del prompt
+            prompt: GenerationSpec de la petición, o texto del prompt
             steps: Número de pasos de inferencia
             guidance: Guidance scale
             width: Ancho de la imagen
             height: Alto de la imagen
-            **kwargs: Otros parámetros opcionales
+            **kwargs: Otros campos de GenerationSpec (style, negative_prompt, seed, ...)
         
         Returns:
-            Hash MD5 de los parámetros
+            Hash BLAKE2 de la especificación canónica
+        """
+        if isinstance(prompt, GenerationSpec):
+            return prompt.cache_key()
+        return GenerationSpec(prompt=prompt, steps=steps, guidance=guidance, width=width, height=height,
+                              **kwargs).cache_key()
+    
+    def get_cached_entry(self, cache_key: str) -> Optional[Tuple[bytes, str]]:
         """
-        # Crear string con todos los parámetros
-        params = f"{prompt}_{steps}_{guidance}_{width}_{height}"
+        Recupera una imagen del caché junto con su formato.
         
-        # Agregar kwargs ordenados alfabéticamente para consistencia
-        for key in sorted(kwargs.keys()):
-            params += f"_{key}_{kwargs[key]}"
+        Args:
+            cache_key: Clave del caché
         
-        # Generar hash MD5
-        return hashlib.md5(params.encode()).hexdigest()
+        Returns:
+            (bytes, formato) o None si no existe; las entradas frías pueden estar en 'webp'
+        """
+        entry = self.index.get(cache_key)
+        if entry is None:
+            print(f"[*] Cache MISS: {cache_key}")
+            return None
+        image_format = entry['format']
+        
+        try:
+            # The evictor may remove or recompress the file between the lookup and the read
+            with open(self._path(cache_key, image_format), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            print(f"[*] Cache MISS: {cache_key}")
+            return None
+        
+        if len(data) != entry['size_bytes']:
+            # Cheap integrity check on every hit; full checksums are left to verify()
+            latest = self.index.get(cache_key)
+            if latest is not None and latest['format'] == image_format and latest['size_bytes'] == entry['size_bytes']:
+                print(f"[!] Corrupt cache entry removed: {cache_key}")
+                self.remove_entries([(cache_key, image_format)])
+            return None
+        
+        # Access stats are batched; the index row is written on the next flush
+        self.index.touch(cache_key)
+        print(f"[✓] Cache HIT: {cache_key}")
+        return data, image_format
+    
+    def get_rendered(self, cache_key: str, variant: Hashable,
+                     render: Callable[[bytes, str], Any]) -> Optional[Any]:
+        """
+        Respuesta lista para enviar: del tier en memoria o, si no está, leída del disco y codificada.
+        
+        Args:
+            cache_key: Clave del caché
+            variant: Forma de la respuesta (ej: formato y calidad)
+            render: Convierte (bytes, formato) del disco en la respuesta (RenderedImage)
+        
+        Returns:
+            La respuesta o None si la clave no está en el caché
+        """
+        def load():
+            cached = self.get_cached_entry(cache_key)
+            return render(*cached) if cached is not None else None
+        
+        rendered, tier = self.hot.get(cache_key, variant, load)
+        if tier == 'memory':
+            # Keep the disk entry warm for the evictor
+            self.index.touch(cache_key)
+            print(f"[✓] Cache HIT (memory): {cache_key}")
+        return rendered
     
     def get_cached_image(self, cache_key: str) -> Optional[bytes]:
         """
@@ -67,21 +164,8 @@ class ImageCacheService:
         Returns:
             Bytes de la imagen o None si no existe
         """
-        cache_path = os.path.join(self.cache_dir, f"{cache_key}.png")
-        
-        if os.path.exists(cache_path):
-            # Actualizar timestamp de último acceso
-            if cache_key in self.metadata:
-                self.metadata[cache_key]['last_accessed'] = time.time()
-                self.metadata[cache_key]['access_count'] = self.metadata[cache_key].get('access_count', 0) + 1
-                self._save_metadata()
-            
-            with open(cache_path, 'rb') as f:
-                print(f"[✓] Cache HIT: {cache_key}")
-                return f.read()
-        
-        print(f"[*] Cache MISS: {cache_key}")
-        return None
+        cached = self.get_cached_entry(cache_key)
+        return cached[0] if cached is not None else None
     
     def save_to_cache(self, cache_key: str, image_bytes: bytes, metadata: Dict[str, Any] = None):
         """
@@ -92,23 +176,72 @@ class ImageCacheService:
             image_bytes: Bytes de la imagen
             metadata: Metadata adicional (prompt, parámetros, etc.)
         """
-        cache_path = os.path.join(self.cache_dir, f"{cache_key}.png")
-        
-        # Guardar imagen
-        with open(cache_path, 'wb') as f:
-            f.write(image_bytes)
+        # Guardar imagen (temporal + os.replace: nunca queda un PNG a medias con el nombre final)
+        write_atomic(self._path(cache_key), image_bytes)
         
-        # Guardar metadata
-        self.metadata[cache_key] = {
-            'created_at': time.time(),
-            'last_accessed': time.time(),
-            'access_count': 1,
-            'size_bytes': len(image_bytes),
-            **(metadata or {})
-        }
-        self._save_metadata()
+        # Guardar metadata (una fila del índice)
+        previous = self.index.get(cache_key)
+        self.index.put(cache_key, len(image_bytes), metadata, checksum=checksum_bytes(image_bytes))
+        self.hot.invalidate(cache_key)
+        if previous is not None and previous['format'] != 'png':
+            self._remove_file(cache_key, previous['format'])
         
         print(f"[✓] Cached: {cache_key}")
+        if self.evictor is not None:
+            self.evictor.notify()
+    
+    def _remove_file(self, cache_key: str, image_format: str = 'png'):
+        try:
+            os.remove(self._path(cache_key, image_format))
+        except FileNotFoundError:
+            pass
+    
+    def remove_entries(self, entries: List[Tuple[str, str]]) -> Dict[str, int]:
+        """
+        Elimina entradas (archivo y fila del índice).
+        
+        Args:
+            entries: Lista de (key, formato)
+        
+        Returns:
+            {key: size_bytes} de las entradas que seguían en el índice y se eliminaron
+        """
+        # Index first: a concurrent reader then misses instead of finding a dangling row
+        removed = self.index.delete([cache_key for cache_key, _ in entries])
+        for cache_key, image_format in entries:
+            self.hot.invalidate(cache_key)
+            self._remove_file(cache_key, image_format)
+        return removed
+    
+    def recompress_entry(self, cache_key: str, webp_method: int = 6) -> int:
+        """
+        Recomprime una entrada PNG a WebP sin pérdida (mismos píxeles, menos bytes).
+        
+        Args:
+            cache_key: Clave del caché
+            webp_method: Esfuerzo del encoder (0 rápido - 6 máxima compresión)
+        
+        Returns:
+            Bytes recuperados (0 si WebP no resultó más pequeño o la entrada ya no existe)
+        """
+        png_path = self._path(cache_key, 'png')
+        try:
+            with Image.open(png_path) as image:
+                image.load()
+                buffered = BytesIO()
+                image.save(buffered, format='WEBP', lossless=True, method=webp_method)
+        except FileNotFoundError:
+            return 0
+        
+        entry = self.index.get(cache_key)
+        webp_bytes = buffered.getvalue()
+        if entry is None or entry['format'] != 'png' or len(webp_bytes) >= entry['size_bytes']:
+            return 0
+        
+        write_atomic(self._path(cache_key, 'webp'), webp_bytes)
+        self.index.update(cache_key, format='webp', size_bytes=len(webp_bytes), checksum=checksum_bytes(webp_bytes))
+        self._remove_file(cache_key, 'png')
+        return entry['size_bytes'] - len(webp_bytes)
     
     def clear_old_cache(self, max_age_days: int = 7):
         """
@@ -117,26 +250,49 @@ class ImageCacheService:
         Args:
             max_age_days: Edad máxima en días
         """
-        current_time = time.time()
         max_age_seconds = max_age_days * 24 * 60 * 60
+        # Key and format come from one query: the evictor may delete entries concurrently
+        entries_to_remove = self.index.entries_created_before(time.time() - max_age_seconds)
+        
+        # Eliminar archivos y metadata
+        removed = self.remove_entries(entries_to_remove)
         
-        keys_to_remove = []
+        if removed:
+            print(f"[✓] Removed {len(removed)} old cache entries")
+    
+    def sweep(self, grace_seconds: Optional[float] = None) -> Dict[str, int]:
+        """
+        Barre los shards: temporales abandonados e imágenes sin fila en el índice (ver cache_layout.sweep_shards).
         
-        for cache_key, meta in self.metadata.items():
-            age = current_time - meta.get('created_at', 0)
-            if age > max_age_seconds:
-                keys_to_remove.append(cache_key)
+        Args:
+            grace_seconds: Antigüedad mínima de los archivos a tocar (default: SWEEP_GRACE_SECONDS)
         
-        # Eliminar archivos y metadata
-        for cache_key in keys_to_remove:
-            cache_path = os.path.join(self.cache_dir, f"{cache_key}.png")
-            if os.path.exists(cache_path):
-                os.remove(cache_path)
-            del self.metadata[cache_key]
-        
-        if keys_to_remove:
-            self._save_metadata()
-            print(f"[✓] Removed {len(keys_to_remove)} old cache entries")
+        Returns:
+            Conteos del barrido
+        """
+        kwargs = {'grace_seconds': grace_seconds} if grace_seconds is not None else {}
+        stats = sweep_shards(self.cache_dir, self.index, **kwargs)
+        if stats['adopted'] and self.evictor is not None:
+            self.evictor.notify()
+        return stats
+    
+    def verify(self, workers: Optional[int] = None, repair: bool = False) -> Dict[str, Any]:
+        """
+        Verifica tamaño y checksum de todas las entradas en paralelo (ver cache_layout.verify_cache).
+        
+        Args:
+            workers: Threads (default: número de núcleos)
+            repair: Eliminar las entradas dañadas o ausentes
+        
+        Returns:
+            Resumen de la verificación
+        """
+        self.index.flush()
+        report = verify_cache(self.cache_dir, self.index, workers=workers, repair=repair)
+        if repair:
+            for cache_key, _ in report['damaged']:
+                self.hot.invalidate(cache_key)
+        return report
     
     def get_cache_stats(self) -> Dict[str, Any]:
         """
@@ -145,14 +301,16 @@ class ImageCacheService:
         Returns:
             Diccionario con estadísticas
         """
-        total_size = sum(meta.get('size_bytes', 0) for meta in self.metadata.values())
-        total_accesses = sum(meta.get('access_count', 0) for meta in self.metadata.values())
+        index_stats = self.index.get_stats()
         
         return {
-            'total_entries': len(self.metadata),
-            'total_size_mb': round(total_size / (1024 * 1024), 2),
-            'total_accesses': total_accesses,
-            'cache_dir': self.cache_dir
+            'total_entries': index_stats['entries'],
+            'total_size_mb': round(index_stats['size_bytes'] / (1024 * 1024), 2),
+            'total_accesses': self.index.total_accesses(),
+            'pending_accesses': index_stats['pending_accesses'],
+            'cache_dir': self.cache_dir,
+            'tiers': self.hot.get_stats(),
+            **({'eviction': self.evictor.get_stats()} if self.evictor is not None else {})
         }
 
 # Singleton instance
@@ -162,5 +320,28 @@ def get_cache_service() -> ImageCacheService:
     """Obtiene la instancia singleton del servicio de caché."""
     global _cache_service
     if _cache_service is None:
-        _cache_service = ImageCacheService()
+        from utils.config import get_setting
+        _cache_service = ImageCacheService(
+            cache_dir=get_setting("storage.cache_dir", "data/cache"),
+            flush_interval=get_setting("storage.cache_index.flush_interval_seconds", 2.0),
+            max_pending=get_setting("storage.cache_index.max_pending", 1000),
+            hot_max_bytes=int(get_setting("storage.hot_cache.max_mb", 256) * 1024 * 1024),
+            hot_promote_after=get_setting("storage.hot_cache.promote_after", 2)
+        )
+        _cache_service.index.start_flusher()
+        atexit.register(_cache_service.index.close)
+        if get_setting("storage.auto_cleanup", True):
+            recompress_hours = get_setting("storage.eviction.recompress_cold_after_hours")
+            _cache_service.evictor = CacheEvictor(
+                _cache_service,
+                max_bytes=int(get_setting("storage.max_cache_size_gb", 5.0) * 1024 ** 3),
+                policy=get_setting("storage.eviction.policy", "lru"),
+                high_watermark=get_setting("storage.eviction.high_watermark", 0.95),
+                low_watermark=get_setting("storage.eviction.low_watermark", 0.85),
+                interval_seconds=get_setting("storage.eviction.interval_seconds", 60),
+                recompress_after_seconds=recompress_hours * 3600 if recompress_hours else None
+            )
+            _cache_service.evictor.start()
+        # Leftovers of writes interrupted by a crash; scanning the shards is kept off the startup path
+        threading.Thread(target=_cache_service.sweep, daemon=True, name="cache-sweep").start()
     return _cache_service
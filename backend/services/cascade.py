@@ -0,0 +1,87 @@
+"""
+Planificación de la generación en cascada (borrador + refinado).
+Genera primero un borrador en un bucket de menor resolución, lo entrega de
+inmediato y luego produce la imagen final con Real-ESRGAN y un refinado
+img2img de baja intensidad a la resolución completa.
+"""
+
+import math
+from typing import Any, Dict, List, Tuple
+
+# Aspect ratio -> SDXL standard dimensions (Fooocus style)
+SDXL_BUCKETS = {
+    '1:1': (1024, 1024),
+    '16:9': (1344, 768),
+    '9:16': (768, 1344),
+    '21:9': (1536, 640),
+    '9:21': (640, 1536),
+    '11:8': (1152, 832),
+    '8:11': (832, 1152),
+    '4:3': (1152, 896),
+    '3:4': (896, 1152)
+}
+
+def snap(value: float, multiple: int = 64) -> int:
+    return max(multiple, int(round(value / multiple)) * multiple)
+
+def draft_bucket(width: int, height: int, draft_megapixels: float = 0.6) -> Tuple[int, int]:
+    """
+    Bucket del borrador: misma proporción, ~draft_megapixels, múltiplos de 64.
+
+    Args:
+        width: Ancho final
+        height: Alto final
+        draft_megapixels: Área objetivo del borrador en megapíxeles
+
+    Returns:
+        (ancho, alto) del borrador (nunca mayor que el final)
+    """
+    if width * height <= draft_megapixels * 1e6:
+        return width, height
+    scale = math.sqrt(draft_megapixels * 1e6 / (width * height))
+    return min(width, snap(width * scale)), min(height, snap(height * scale))
+
+def plan_cascade(width: int, height: int, steps: int, draft_megapixels: float = 0.6,
+                 draft_steps: int = 20, refine_strength: float = 0.3) -> Dict[str, Any]:
+    """
+    Calcula las etapas de una cascada.
+
+    Returns:
+        Dict con draft_size, draft_steps, upscale (factor), refine_steps y refine_strength
+    """
+    draft_w, draft_h = draft_bucket(width, height, draft_megapixels)
+    refine_strength = max(refine_strength, 1.0 / steps)
+    return {
+        'final_size': (width, height),
+        'draft_size': (draft_w, draft_h),
+        'draft_steps': min(steps, draft_steps),
+        'upscale': round(max(width / draft_w, height / draft_h), 3),
+        'refine_steps': max(1, int(steps * refine_strength)),
+        'refine_strength': refine_strength
+    }
+
+def relative_cost(plan: Dict[str, Any], steps: int) -> Dict[str, float]:
+    """
+    Coste de UNet estimado (pasos x píxeles) del borrador y de la cascada
+    completa, relativo a una generación directa a resolución final.
+    """
+    width, height = plan['final_size']
+    draft_w, draft_h = plan['draft_size']
+    full = steps * width * height
+    draft = plan['draft_steps'] * draft_w * draft_h
+    refine = plan['refine_steps'] * width * height
+    return {'draft': round(draft / full, 3), 'cascade': round((draft + refine) / full, 3)}
+
+def tradeoff_table(rows: List[Dict[str, Any]]) -> str:
+    """Tabla de texto con el compromiso velocidad/calidad por bucket."""
+    headers = ['ratio', 'final', 'draft', 'full s', 'draft s', 'final s', 'speedup', 'detail']
+    lines = ["".join(f"{h:>12}" for h in headers)]
+    for row in rows:
+        values = [
+            row['ratio'], "x".join(map(str, row['final_size'])), "x".join(map(str, row['draft_size'])),
+            f"{row['full_seconds']:.2f}", f"{row['draft_seconds']:.2f}", f"{row['cascade_seconds']:.2f}",
+            f"{row['full_seconds'] / row['cascade_seconds']:.2f}x" if row['cascade_seconds'] else "-",
+            f"{row['detail_ratio']:.2f}"
+        ]
+        lines.append("".join(f"{v:>12}" for v in values))
+    return "\n".join(lines)
@@ -0,0 +1,245 @@
+"""
+Preprocesadores ControlNet (canny, depth, pose) y caché de sus mapas.
+Los mapas se indexan por hash del contenido de la imagen de referencia más el
+preprocesador y sus parámetros, así que reutilizar el layout de una marca en
+muchos prompts no vuelve a ejecutar la detección de bordes o de profundidad.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from io import BytesIO
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+# Long side at which reference images are preprocessed; maps are resized to the output afterwards
+PREPROCESS_MAX_SIDE = 1024
+DEPTH_MODEL = "Intel/dpt-hybrid-midas"
+
+def _fit(image: Image.Image, max_side: int) -> Image.Image:
+    scale = max_side / max(image.size)
+    if scale >= 1:
+        return image
+    return image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.LANCZOS)
+
+def canny_map(image: Image.Image, low: int = 100, high: int = 200) -> np.ndarray:
+    """Bordes Canny como mapa RGB uint8."""
+    import cv2
+    edges = cv2.Canny(np.asarray(image.convert('L')), int(low), int(high))
+    return np.repeat(edges[:, :, None], 3, axis=2)
+
+_depth_estimator = None
+_depth_lock = threading.Lock()
+
+def depth_map(image: Image.Image) -> np.ndarray:
+    """Profundidad monocular (transformers, en CPU) normalizada a 0-255."""
+    global _depth_estimator
+    with _depth_lock:
+        if _depth_estimator is None:
+            from transformers import pipeline
+            _depth_estimator = pipeline("depth-estimation", model=DEPTH_MODEL, device="cpu")
+        depth = np.asarray(_depth_estimator(image.convert('RGB'))["depth"], dtype=np.float32)
+    depth = (depth - depth.min()) / max(float(depth.max() - depth.min()), 1e-6)
+    gray = np.rint(depth * 255).astype(np.uint8)
+    return np.repeat(gray[:, :, None], 3, axis=2)
+
+_pose_detector = None
+_pose_lock = threading.Lock()
+
+def pose_map(image: Image.Image, hands: bool = False, face: bool = False) -> np.ndarray:
+    """Esqueleto OpenPose (requiere controlnet_aux)."""
+    global _pose_detector
+    with _pose_lock:
+        if _pose_detector is None:
+            try:
+                from controlnet_aux import OpenposeDetector
+            except ImportError:
+                raise RuntimeError("El preprocesador 'pose' requiere el paquete controlnet_aux")
+            _pose_detector = OpenposeDetector.from_pretrained("lllyasviel/Annotators")
+        result = _pose_detector(image.convert('RGB'), include_hand=bool(hands), include_face=bool(face))
+    return np.asarray(result.convert('RGB'))
+
+def passthrough_map(image: Image.Image) -> np.ndarray:
+    """La referencia ya es un mapa de control."""
+    return np.asarray(image.convert('RGB'))
+
+PREPROCESSORS: Dict[str, Callable[..., np.ndarray]] = {
+    'canny': canny_map,
+    'depth': depth_map,
+    'pose': pose_map,
+    'none': passthrough_map,
+}
+# Parameters a request may set for each preprocessor
+PREPROCESSOR_PARAMS = {
+    'canny': ('low', 'high'),
+    'depth': (),
+    'pose': ('hands', 'face'),
+    'none': (),
+}
+
+class ControlMapCache:
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, cache_dir: Optional[str] = None,
+                 max_side: int = PREPROCESS_MAX_SIDE):
+        """
+        Args:
+            max_bytes: Memoria máxima de los mapas en RAM
+            cache_dir: Carpeta para persistir los mapas entre reinicios (None = solo RAM)
+            max_side: Lado mayor al que se reduce la referencia antes de preprocesar
+        """
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.max_side = max_side
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.compute_seconds = 0.0
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._bytes = 0
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, image_bytes: bytes, kind: str, params: Dict[str, Any]) -> str:
+        content = hashlib.blake2b(image_bytes, digest_size=16).hexdigest()
+        spec = json.dumps({'kind': kind, 'params': params, 'max_side': self.max_side}, sort_keys=True)
+        return hashlib.blake2b(f"{content}\0{spec}".encode('utf-8'), digest_size=16).hexdigest()
+
+    def get(self, image_bytes: bytes, kind: str, params: Optional[Dict[str, Any]] = None) -> Tuple[np.ndarray, bool]:
+        """
+        Mapa de control para la referencia, calculándolo solo si no está en caché.
+
+        Args:
+            image_bytes: Bytes del archivo de la imagen de referencia
+            kind: Preprocesador ('canny', 'depth', 'pose' o 'none')
+            params: Parámetros del preprocesador (forman parte de la clave)
+
+        Returns:
+            (mapa RGB uint8, True si vino del caché)
+        """
+        if kind not in PREPROCESSORS:
+            raise ValueError(f"Unsupported control type: {kind}")
+        params = params or {}
+        unknown = set(params) - set(PREPROCESSOR_PARAMS[kind])
+        if unknown:
+            raise ValueError(f"Unsupported {kind} parameters: {', '.join(sorted(unknown))}")
+        key = self.key(image_bytes, kind, params)
+
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return cached, True
+            pending = self._inflight.get(key)
+            if pending is None:
+                pending = self._inflight[key] = Future()
+                owner = True
+            else:
+                self.coalesced += 1
+                owner = False
+
+        if not owner:
+            # Same reference already being preprocessed by another request
+            return pending.result(), True
+
+        try:
+            control_map = self._read(key)
+            hit = control_map is not None
+            if hit:
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+                start = time.perf_counter()
+                image = _fit(Image.open(BytesIO(image_bytes)), self.max_side)
+                control_map = np.ascontiguousarray(PREPROCESSORS[kind](image, **params), dtype=np.uint8)
+                self.compute_seconds += time.perf_counter() - start
+                self._write(key, control_map)
+            self._put(key, control_map)
+            pending.set_result(control_map)
+            return control_map, hit
+        except BaseException as e:
+            pending.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _put(self, key: str, control_map: np.ndarray):
+        if control_map.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key).nbytes
+            self._entries[key] = control_map
+            self._bytes += control_map.nbytes
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def _path(self, key: str) -> Optional[str]:
+        return os.path.join(self.cache_dir, f"{key}.png") if self.cache_dir else None
+
+    def _read(self, key: str) -> Optional[np.ndarray]:
+        path = self._path(key)
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            with Image.open(path) as image:
+                return np.asarray(image.convert('RGB'))
+        except OSError:
+            return None
+
+    def _write(self, key: str, control_map: np.ndarray):
+        path = self._path(key)
+        if path is None:
+            return
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                Image.fromarray(control_map).save(f, format='PNG', compress_level=1)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[!] Could not persist control map: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def get_stats(self) -> Dict[str, Any]:
+        total = self.memory_hits + self.disk_hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'size_mb': round(self._bytes / (1024 * 1024), 2),
+            'max_mb': round(self.max_bytes / (1024 * 1024), 2),
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'hit_ratio': round((self.memory_hits + self.disk_hits) / total, 3) if total else 0,
+            'evictions': self.evictions,
+            'compute_seconds': round(self.compute_seconds, 2)
+        }
+
+# Singleton instance
+_control_map_cache = None
+
+def get_control_map_cache() -> ControlMapCache:
+    """Obtiene la instancia singleton del caché de mapas ControlNet."""
+    global _control_map_cache
+    if _control_map_cache is None:
+        from utils.config import get_setting
+        _control_map_cache = ControlMapCache(
+            max_bytes=int(get_setting("controlnet.map_cache_mb", 256) * 1024 * 1024),
+            cache_dir=get_setting("controlnet.map_cache_dir", "data/controlnet_maps"),
+            max_side=get_setting("controlnet.preprocess_max_side", PREPROCESS_MAX_SIDE)
+        )
+    return _control_map_cache
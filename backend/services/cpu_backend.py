@@ -0,0 +1,220 @@
+"""
+Backend de inferencia en CPU.
+Permite seguir sirviendo SDXL Lightning e InsightFace sin GPU: pesos en
+fp32/bf16 (o Linear cuantizadas a int8), todos los núcleos para los kernels de
+torch y ONNX Runtime, y un host de modelos que sustituye al gestor de VRAM
+(todo queda residente en RAM: sin transferencias, presupuesto ni desalojos).
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+GB = 1024 ** 3
+CPU_DTYPES = ('fp32', 'bf16', 'int8')
+
+def resolve_backend(setting: str = 'auto') -> Optional[str]:
+    """
+    Device de ejecución según la configuración.
+
+    Args:
+        setting: 'auto' (GPU si hay, si no CPU), 'cuda' o 'cpu'
+
+    Returns:
+        'cuda', 'cpu' o None si se pidió 'cuda' y no hay GPU
+    """
+    if setting not in ('auto', 'cuda', 'cpu'):
+        raise ValueError(f"Unsupported execution backend: {setting}")
+    if setting == 'cpu':
+        return 'cpu'
+    try:
+        import torch
+        has_cuda = torch.cuda.is_available()
+    except ImportError:
+        has_cuda = False
+    if has_cuda:
+        return 'cuda'
+    return 'cpu' if setting == 'auto' else None
+
+def torch_dtype(dtype: str) -> Any:
+    """dtype de torch para cargar los pesos (int8 carga en fp32 y cuantiza después)."""
+    import torch
+    if dtype not in CPU_DTYPES:
+        raise ValueError(f"Unsupported CPU dtype: {dtype} (expected one of {', '.join(CPU_DTYPES)})")
+    return torch.bfloat16 if dtype == 'bf16' else torch.float32
+
+def configure_threads(threads: Optional[int] = None) -> int:
+    """
+    Usa todos los núcleos (o `threads`) para los kernels intra-op de torch.
+
+    Returns:
+        Número de threads configurado
+    """
+    import torch
+    threads = threads or os.cpu_count() or 1
+    torch.set_num_threads(threads)
+    try:
+        # Only allowed before the first inter-op parallel region
+        torch.set_num_interop_threads(max(1, min(4, threads // 4)))
+    except RuntimeError:
+        pass
+    return threads
+
+def quantize_int8(module: Any) -> Any:
+    """Cuantización dinámica int8 de las capas Linear (atención y feed-forward); las convoluciones quedan en fp32."""
+    import torch
+    return torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+def prepare_pipeline(pipe: Any, dtype: str = 'bf16', quantize: tuple = ('unet',)) -> Any:
+    """
+    Deja un pipeline de diffusers listo para inferir en CPU.
+
+    Args:
+        pipe: Pipeline cargado (normalmente en fp16)
+        dtype: 'fp32', 'bf16' o 'int8'
+        quantize: Componentes cuyas Linear se cuantizan en modo int8
+
+    Returns:
+        El mismo pipeline, convertido
+    """
+    pipe.to("cpu", torch_dtype(dtype))
+    if dtype == 'int8':
+        for name in quantize:
+            component = getattr(pipe, name, None)
+            if component is not None:
+                quantize_int8(component)
+    return pipe
+
+def quantize_onnx_int8(model_path: str) -> str:
+    """
+    Versión int8 (pesos cuantizados dinámicamente) de un modelo ONNX; se genera una vez junto al original.
+
+    Returns:
+        Ruta del modelo cuantizado
+    """
+    root, extension = os.path.splitext(model_path)
+    quantized_path = f"{root}.int8{extension}"
+    if not os.path.exists(quantized_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        tmp_path = f"{quantized_path}.tmp"
+        quantize_dynamic(model_path, tmp_path, weight_type=QuantType.QInt8)
+        os.replace(tmp_path, quantized_path)
+    return quantized_path
+
+def available_ram_bytes() -> int:
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return 16 * GB
+
+class CPUModelHost:
+    """
+    Sustituto del VRAMManager para el backend CPU, con la misma interfaz:
+    los modelos se construyen en el primer acquire() y quedan en RAM.
+    """
+
+    prefetches = 0
+    prefetch_hits = 0
+    prefetch_cancels = 0
+
+    def __init__(self, threads: Optional[int] = None, dtype: str = 'bf16'):
+        """
+        Args:
+            threads: Threads de torch (default: todos los núcleos)
+            dtype: Precisión de los pesos ('fp32', 'bf16' o 'int8')
+        """
+        if dtype not in CPU_DTYPES:
+            raise ValueError(f"Unsupported CPU dtype: {dtype} (expected one of {', '.join(CPU_DTYPES)})")
+        self.threads = threads
+        self.dtype = dtype
+        self.entries: Dict[str, Any] = {}
+        self.loaders: Dict[str, Callable[[], Any]] = {}
+        self.leases = 0
+        self.load_seconds: Dict[str, float] = {}
+        self._loader_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, model: Any, mover: Optional[Callable[[str], Any]] = None,
+                 size_bytes: int = 0) -> Any:
+        # Models never move between devices here, so the mover is not needed
+        with self._lock:
+            self.entries[name] = model
+        return model
+
+    def register_loader(self, name: str, loader: Callable[[], Any]):
+        self.loaders[name] = loader
+        self._loader_locks.setdefault(name, threading.Lock())
+
+    @contextmanager
+    def acquire(self, name: str) -> Iterator[Any]:
+        if name not in self.entries:
+            if name not in self.loaders:
+                raise KeyError(f"Model not registered: {name}")
+            with self._loader_locks[name]:
+                if name not in self.entries:
+                    start = time.perf_counter()
+                    self.loaders[name]()
+                    self.load_seconds[name] = round(time.perf_counter() - start, 2)
+        with self._lock:
+            self.leases += 1
+        yield self.entries[name]
+
+    def ensure_resident(self, name: str) -> Any:
+        with self.acquire(name) as model:
+            return model
+
+    def is_registered(self, name: str) -> bool:
+        return name in self.entries
+
+    def is_resident(self, name: str) -> bool:
+        return name in self.entries
+
+    def resident_models(self) -> List[str]:
+        return list(self.entries)
+
+    def used_bytes(self) -> int:
+        return 0
+
+    def activation_bytes(self, for_model: Optional[str] = None) -> int:
+        return available_ram_bytes()
+
+    def prefetch(self, name: str, cancel: Optional[threading.Event] = None) -> bool:
+        return False
+
+    def evict(self, name: str):
+        pass
+
+    def offload_all(self, except_model: str = None):
+        pass
+
+    def sweep_idle(self) -> List[str]:
+        return []
+
+    def start_idle_sweeper(self, interval_seconds: float = 60):
+        pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'backend': 'cpu',
+            'dtype': self.dtype,
+            'threads': self.threads,
+            'available_ram_gb': round(available_ram_bytes() / GB, 2),
+            'leases': self.leases,
+            'load_seconds': dict(self.load_seconds),
+            'models': list(self.entries)
+        }
+
+# Singleton instance
+_cpu_model_host = None
+
+def get_cpu_model_host() -> CPUModelHost:
+    """Obtiene el host de modelos del backend CPU (configura los threads de torch)."""
+    global _cpu_model_host
+    if _cpu_model_host is None:
+        from utils.config import get_setting
+        threads = configure_threads(get_setting("execution.cpu.threads"))
+        _cpu_model_host = CPUModelHost(threads=threads, dtype=get_setting("execution.cpu.dtype", "bf16"))
+        print(f"[*] CPU backend: {threads} threads, {_cpu_model_host.dtype} weights")
+    return _cpu_model_host
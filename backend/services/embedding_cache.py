@@ -0,0 +1,155 @@
+"""
+Caché LRU de embeddings de texto para SDXL.
+Evita re-ejecutar los dos text encoders para prompts repetidos y para los
+negativos largos de cada estilo, que son idénticos en cada petición.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+def _tensor_bytes(tensor: Any) -> int:
+    return tensor.numel() * tensor.element_size()
+
+class PromptEmbeddingCache:
+    def __init__(self, max_bytes: int = 128 * 1024 * 1024):
+        """
+        Args:
+            max_bytes: Memoria máxima ocupada por los embeddings cacheados
+        """
+        self.max_bytes = max_bytes
+        self.namespace = ""
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Tuple[Any, Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def set_namespace(self, namespace: str):
+        """Fija el modelo al que pertenecen los embeddings; si cambia, vacía el caché."""
+        with self._lock:
+            if namespace != self.namespace:
+                self._entries.clear()
+                self._bytes = 0
+                self.namespace = namespace
+
+    def key(self, text: str, variant: str = "") -> str:
+        return hashlib.blake2b(f"{self.namespace}\0{variant}\0{text}".encode('utf-8'), digest_size=16).hexdigest()
+
+    def get(self, text: str, variant: str = "") -> Optional[Tuple[Any, Any]]:
+        """Retorna (prompt_embeds, pooled_prompt_embeds) o None."""
+        key = self.key(text, variant)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, text: str, prompt_embeds: Any, pooled_embeds: Any, variant: str = ""):
+        key = self.key(text, variant)
+        size = _tensor_bytes(prompt_embeds) + _tensor_bytes(pooled_embeds)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[2]
+            self._entries[key] = (prompt_embeds, pooled_embeds, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def encode(self, pipe: Any, texts: List[str], zero_empty: bool = False, variant: str = "") -> Tuple[Any, Any]:
+        """
+        Obtiene los embeddings de una lista de textos, codificando solo los que faltan.
+
+        Args:
+            pipe: Pipeline SDXL (text encoders residentes)
+            texts: Un texto por imagen del batch
+            zero_empty: Usar ceros para textos vacíos (force_zeros_for_empty_prompt en negativos)
+            variant: Estado de los text encoders (ej: LoRAs que los modifican); separa las entradas
+
+        Returns:
+            (prompt_embeds, pooled_prompt_embeds) con batch = len(texts), en el device del pipeline
+        """
+        import torch
+
+        results: List[Optional[Tuple[Any, Any]]] = [None] * len(texts)
+        missing: Dict[str, List[int]] = {}
+        for index, text in enumerate(texts):
+            if zero_empty and not text:
+                results[index] = self._zeros(pipe)
+                continue
+            cached = self.get(text, variant)
+            if cached is not None:
+                results[index] = cached
+            else:
+                missing.setdefault(text, []).append(index)
+
+        if missing:
+            unique = list(missing)
+            with torch.no_grad():
+                prompt_embeds, _, pooled_embeds, _ = pipe.encode_prompt(
+                    prompt=unique,
+                    device=pipe.device,
+                    num_images_per_prompt=1,
+                    do_classifier_free_guidance=False
+                )
+            for position, text in enumerate(unique):
+                entry = (prompt_embeds[position:position + 1].to("cpu"),
+                         pooled_embeds[position:position + 1].to("cpu"))
+                self.put(text, *entry, variant=variant)
+                for index in missing[text]:
+                    results[index] = entry
+
+        return (torch.cat([r[0] for r in results]).to(pipe.device),
+                torch.cat([r[1] for r in results]).to(pipe.device))
+
+    def precompute(self, pipe: Any, texts: List[str]):
+        """Codifica por adelantado textos conocidos (ej: negativos de cada estilo)."""
+        with self._lock:
+            pending = [text for text in dict.fromkeys(texts) if text and self.key(text) not in self._entries]
+        if pending:
+            self.encode(pipe, pending)
+            print(f"[✓] Precomputed {len(pending)} prompt embeddings")
+
+    @staticmethod
+    def _zeros(pipe: Any) -> Tuple[Any, Any]:
+        import torch
+        seq_len = pipe.tokenizer_2.model_max_length
+        hidden = pipe.text_encoder.config.hidden_size + pipe.text_encoder_2.config.hidden_size
+        pooled = pipe.text_encoder_2.config.projection_dim
+        dtype = pipe.text_encoder_2.dtype
+        return torch.zeros(1, seq_len, hidden, dtype=dtype), torch.zeros(1, pooled, dtype=dtype)
+
+    def get_stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'size_mb': round(self._bytes / (1024 * 1024), 2),
+            'max_mb': round(self.max_bytes / (1024 * 1024), 2),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 3) if total else 0,
+            'evictions': self.evictions
+        }
+
+# Singleton instance
+_embedding_cache = None
+
+def get_embedding_cache() -> PromptEmbeddingCache:
+    """Obtiene la instancia singleton del caché de embeddings."""
+    global _embedding_cache
+    if _embedding_cache is None:
+        from utils.config import get_setting
+        _embedding_cache = PromptEmbeddingCache(
+            max_bytes=int(get_setting("embedding_cache.max_mb", 128) * 1024 * 1024)
+        )
+    return _embedding_cache
@@ -18,6 +18,20 @@ class FaceSwapService:
         self.app = None
         self.swapper = None
         self._initialized = False
+        self.providers = None  # None: InsightFace default (CUDA when available)
+        self.ctx_id = 0
+        self.int8 = False
+    
+    def use_cpu(self, int8: bool = False):
+        """
+        Ejecuta los modelos ONNX en CPU (ONNX Runtime usa todos los núcleos físicos).
+        
+        Args:
+            int8: Usar una copia del inswapper con pesos cuantizados a int8
+        """
+        self.providers = ['CPUExecutionProvider']
+        self.ctx_id = -1
+        self.int8 = int8
     
     def initialize(self):
         """Inicializa los modelos de InsightFace (lazy loading)."""
@@ -36,21 +50,24 @@ class FaceSwapService:
             checkpoints_dir = os.path.join(base_dir, "models", "checkpoints")
 
             # Análisis de rostros (buffalo_l se descargará/buscará en models/insightface)
-            self.app = FaceAnalysis(name='buffalo_l', root=models_root)
-            self.app.prepare(ctx_id=0, det_size=(640, 640))
+            self.app = FaceAnalysis(name='buffalo_l', root=models_root, providers=self.providers)
+            self.app.prepare(ctx_id=self.ctx_id, det_size=(640, 640))
             
             # Modelo de swap
             # Buscamos inswapper_128.onnx en models/checkpoints
             swapper_path = os.path.join(checkpoints_dir, 'inswapper_128.onnx')
             
             if os.path.exists(swapper_path):
-                self.swapper = insightface.model_zoo.get_model(swapper_path)
+                if self.int8:
+                    from .cpu_backend import quantize_onnx_int8
+                    swapper_path = quantize_onnx_int8(swapper_path)
+                self.swapper = insightface.model_zoo.get_model(swapper_path, providers=self.providers)
             else:
                 print(f"[!] Modelo inswapper no encontrado en {swapper_path}")
                 # Fallback: intentar descarga automática o ubicación default
                 # InsightFace por defecto busca en ~/.insightface/models/
                 try:
-                     self.swapper = insightface.model_zoo.get_model('inswapper_128.onnx')
+                     self.swapper = insightface.model_zoo.get_model('inswapper_128.onnx', providers=self.providers)
                 except:
                      self.swapper = None
 
@@ -129,23 +146,36 @@ class FaceSwapService:
             print(f"[!] Error en face swap: {e}")
             raise
     
-    def process_base64(self, source_b64: str, target_b64: str) -> str:
+    def swap_from_base64(self, source_b64: str, target_b64: str) -> np.ndarray:
         """
-        Procesa imágenes en formato base64.
+        Intercambia rostros a partir de imágenes base64, sin codificar el resultado.
         
         Args:
             source_b64: Imagen fuente en base64
             target_b64: Imagen objetivo en base64
         
         Returns:
-            Imagen resultado en base64
+            Imagen resultado (numpy BGR)
         """
         # Convertir base64 a imágenes
         source_img = self.base64_to_image(source_b64)
         target_img = self.base64_to_image(target_b64)
         
         # Realizar swap
-        result_img = self.swap_faces(source_img, target_img)
+        return self.swap_faces(source_img, target_img)
+    
+    def process_base64(self, source_b64: str, target_b64: str) -> str:
+        """
+        Procesa imágenes en formato base64.
+        
+        Args:
+            source_b64: Imagen fuente en base64
+            target_b64: Imagen objetivo en base64
+        
+        Returns:
+            Imagen resultado en base64
+        """
+        result_img = self.swap_from_base64(source_b64, target_b64)
         
         # Convertir resultado a base64
         result_b64 = self.image_to_base64(result_img)
@@ -0,0 +1,95 @@
+"""
+Especificación canónica de una generación de imagen.
+Reúne todo lo que afecta a los píxeles de salida (prompt normalizado, estilo,
+negativo, tamaño, pasos, guidance, semilla, modo Lightning/Juggernaut, LoRAs y
+huella del modelo) y deriva de ella la clave del caché con BLAKE2, de modo que
+generate_image y el caché comparten una única definición de "misma imagen".
+"""
+
+import hashlib
+import json
+import re
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from .model_snapshot import source_checksum
+
+# Bump when the key layout changes so old entries stop matching
+SPEC_VERSION = 1
+
+_WHITESPACE = re.compile(r"\s+")
+# Spaces between a letter/digit and punctuation; spaces between two punctuation marks are kept
+# because CLIP merges adjacent punctuation into one token
+_SPACE_NEXT_TO_PUNCTUATION = re.compile(r"(?<=[^\W_])\s+(?=[^\w\s]|_)|(?<=[^\w\s]|_)\s+(?=[^\W_])")
+
+def normalize_prompt(text: Optional[str]) -> str:
+    """
+    Forma canónica de un prompt para la clave del caché.
+
+    Los tokenizers CLIP de ambos text encoders de SDXL pasan el texto a
+    minúsculas y descartan los espacios al separar palabras y puntuación,
+    así que estas variantes producen los mismos tokens y la misma imagen.
+
+    Args:
+        text: Prompt tal como llegó
+
+    Returns:
+        Prompt en minúsculas, con espacios colapsados y sin espacios entre palabra y puntuación
+    """
+    text = _WHITESPACE.sub(' ', (text or '').lower()).strip()
+    return _SPACE_NEXT_TO_PUNCTUATION.sub('', text)
+
+def model_fingerprint(checkpoint: str, backend: Optional[str] = 'cuda', dtype: str = 'fp16') -> str:
+    """
+    Huella de los pesos y del backend numérico que generan las imágenes.
+
+    Args:
+        checkpoint: Ruta del checkpoint SDXL (se hashea tamaño, mtime y muestras del contenido)
+        backend: 'cuda' o 'cpu'
+        dtype: Precisión de los pesos ('fp16', 'bf16', 'int8'...)
+    """
+    return hashlib.blake2b(f"{source_checksum(checkpoint)}\0{backend}\0{dtype}".encode('utf-8'),
+                           digest_size=8).hexdigest()
+
+@dataclass(frozen=True)
+class GenerationSpec:
+    """Parámetros que determinan la imagen; se normalizan al construirse."""
+    prompt: str
+    negative_prompt: str = ""
+    style: str = ""
+    width: int = 1024
+    height: int = 1024
+    steps: int = 4
+    guidance: float = 0.0
+    seed: Optional[int] = None  # None = any seed is acceptable
+    is_lightning: bool = True
+    adapters: Tuple[Tuple[str, float], ...] = ()
+    model: str = ""
+
+    def __post_init__(self):
+        normalized = {
+            'prompt': normalize_prompt(self.prompt),
+            'negative_prompt': normalize_prompt(self.negative_prompt),
+            'style': self.style or "",
+            'width': int(self.width),
+            'height': int(self.height),
+            'steps': int(self.steps),
+            'guidance': round(float(self.guidance), 4),
+            'seed': int(self.seed) if self.seed is not None else None,
+            'is_lightning': bool(self.is_lightning),
+            'adapters': tuple(sorted((str(name), round(float(weight), 3)) for name, weight in self.adapters)),
+        }
+        for name, value in normalized.items():
+            object.__setattr__(self, name, value)
+
+    def describe(self) -> Dict[str, Any]:
+        """Campos como dict serializable (metadata del caché)."""
+        fields = asdict(self)
+        fields['adapters'] = [list(adapter) for adapter in self.adapters]
+        return fields
+
+    def cache_key(self) -> str:
+        """Clave BLAKE2 (128 bits) del JSON canónico de la especificación."""
+        canonical = json.dumps({'v': SPEC_VERSION, **self.describe()}, sort_keys=True, separators=(',', ':'),
+                               ensure_ascii=False)
+        return hashlib.blake2b(canonical.encode('utf-8'), digest_size=16).hexdigest()
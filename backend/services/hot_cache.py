@@ -0,0 +1,153 @@
+"""
+Tier en memoria delante del caché de imágenes en disco.
+Guarda la respuesta ya codificada (bytes y data URL base64) de las claves más
+calientes, de modo que un HIT repetido no lee el PNG ni vuelve a codificarlo.
+Las claves se promueven tras varios hits de disco, se degradan (solo quedan en
+disco) por LRU al superar el presupuesto de bytes, y las lecturas de disco
+concurrentes de la misma clave se unifican en una sola.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+TIERS = ('memory', 'disk', 'miss')
+
+def payload_bytes(rendered: Any) -> int:
+    """Bytes retenidos por una respuesta: imagen codificada más su data URL."""
+    return len(rendered.data) + len(rendered.data_uri())
+
+class HotImageCache:
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, promote_after: int = 2, sketch_size: int = 4096):
+        """
+        Args:
+            max_bytes: Memoria máxima del tier (0 = desactivado)
+            promote_after: Hits de disco de una clave antes de subirla a memoria
+            sketch_size: Claves recientes cuyo número de hits se recuerda para decidir la promoción
+        """
+        self.max_bytes = max_bytes
+        self.promote_after = max(1, promote_after)
+        self.sketch_size = sketch_size
+        self.promotions = 0
+        self.demotions = 0
+        self.coalesced = 0
+        self.hits = {tier: 0 for tier in TIERS}
+        self.seconds = {tier: 0.0 for tier in TIERS}
+        self._entries: "OrderedDict[Tuple[str, Hashable], Any]" = OrderedDict()
+        self._bytes = 0
+        self._disk_hits: "OrderedDict[str, int]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, Hashable], Future] = {}
+        self._lock = threading.Lock()
+
+    def get(self, cache_key: str, variant: Hashable, loader: Callable[[], Optional[Any]]) -> Tuple[Optional[Any], str]:
+        """
+        Respuesta para la clave, desde memoria o, si no está, desde el loader (disco).
+
+        Args:
+            cache_key: Clave del caché de imágenes
+            variant: Forma de la respuesta (formato/calidad); cada variante se guarda aparte
+            loader: Lee del disco y codifica; retorna None si la clave no está en el caché
+
+        Returns:
+            (respuesta o None, tier: 'memory', 'disk' o 'miss')
+        """
+        start = time.perf_counter()
+        key = (cache_key, variant)
+        with self._lock:
+            rendered = self._entries.get(key)
+            if rendered is not None:
+                self._entries.move_to_end(key)
+                self._record('memory', start)
+                return rendered, 'memory'
+            pending = self._inflight.get(key)
+            if pending is None:
+                pending = self._inflight[key] = Future()
+                owner = True
+            else:
+                self.coalesced += 1
+                owner = False
+
+        if not owner:
+            # Another request is already reading this key from disk
+            rendered = pending.result()
+            tier = 'disk' if rendered is not None else 'miss'
+            with self._lock:
+                self._record(tier, start)
+            return rendered, tier
+
+        try:
+            rendered = loader()
+            tier = 'disk' if rendered is not None else 'miss'
+            if rendered is not None:
+                self._maybe_promote(key, rendered)
+            pending.set_result(rendered)
+        except BaseException as e:
+            pending.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+        with self._lock:
+            self._record(tier, start)
+        return rendered, tier
+
+    def _record(self, tier: str, start: float):
+        self.hits[tier] += 1
+        self.seconds[tier] += time.perf_counter() - start
+
+    def _maybe_promote(self, key: Tuple[str, Hashable], rendered: Any):
+        if self.max_bytes <= 0:
+            return
+        with self._lock:
+            count = self._disk_hits.pop(key[0], 0) + 1
+            if count < self.promote_after:
+                self._disk_hits[key[0]] = count
+                while len(self._disk_hits) > self.sketch_size:
+                    self._disk_hits.popitem(last=False)
+                return
+        # Encode the data URL outside the lock; it is kept alongside the raw bytes
+        size = payload_bytes(rendered)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= payload_bytes(previous)
+            self._entries[key] = rendered
+            self._bytes += size
+            self.promotions += 1
+            while self._bytes > self.max_bytes:
+                _, demoted = self._entries.popitem(last=False)
+                self._bytes -= payload_bytes(demoted)
+                self.demotions += 1
+
+    def invalidate(self, cache_key: str):
+        """Descarta todas las variantes de una clave (entrada reemplazada o desalojada del disco)."""
+        with self._lock:
+            self._disk_hits.pop(cache_key, None)
+            for key in [key for key in self._entries if key[0] == cache_key]:
+                self._bytes -= payload_bytes(self._entries.pop(key))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._disk_hits.clear()
+            self._bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        total = sum(self.hits.values())
+        return {
+            'entries': len(self._entries),
+            'size_mb': round(self._bytes / (1024 * 1024), 2),
+            'max_mb': round(self.max_bytes / (1024 * 1024), 2),
+            'lookups': total,
+            **{f'{tier}_hits' if tier != 'miss' else 'misses': self.hits[tier] for tier in TIERS},
+            **{f'{tier}_hit_ratio': round(self.hits[tier] / total, 3) if total else 0 for tier in ('memory', 'disk')},
+            **{f'{tier}_mean_ms': round(self.seconds[tier] / self.hits[tier] * 1000, 3) if self.hits[tier] else 0
+               for tier in TIERS},
+            'promotions': self.promotions,
+            'demotions': self.demotions,
+            'coalesced': self.coalesced
+        }
@@ -0,0 +1,203 @@
+"""
+Negociación y codificación de las imágenes de respuesta.
+Permite devolver la imagen como cuerpo binario (webp/jpeg/png), como JSON con
+una URL /files/... direccionada por contenido, o como base64 en JSON (legado).
+"""
+
+import base64
+import hashlib
+import os
+import tempfile
+from io import BytesIO
+from typing import Any, Dict, Optional
+
+from PIL import Image
+
+FORMATS = {
+    'png': ('PNG', 'image/png'),
+    'webp': ('WEBP', 'image/webp'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+}
+FORMAT_ALIASES = {'jpg': 'jpeg'}
+MODES = ('base64', 'url', 'binary')
+JSON_MIMETYPE = 'application/json'
+
+class OutputSpec:
+    def __init__(self, mode: str = 'base64', image_format: str = 'png', quality: int = 90):
+        self.mode = mode
+        self.format = image_format
+        self.quality = quality
+
+    @property
+    def mimetype(self) -> str:
+        return FORMATS[self.format][1]
+
+    def __repr__(self):
+        return f"OutputSpec({self.mode}, {self.format}, q={self.quality})"
+
+class RenderedImage:
+    def __init__(self, data: bytes, image_format: str, url: Optional[str] = None):
+        self.data = data
+        self.format = image_format
+        self.url = url
+        self._data_uri = None
+
+    @property
+    def mimetype(self) -> str:
+        return FORMATS[self.format][1]
+
+    def data_uri(self) -> str:
+        # Memoized: hot cache entries are served many times
+        if self._data_uri is None:
+            self._data_uri = f"data:{self.mimetype};base64,{base64.b64encode(self.data).decode('utf-8')}"
+        return self._data_uri
+
+def normalize_format(image_format: Optional[str]) -> Optional[str]:
+    if not image_format:
+        return None
+    image_format = image_format.lower().strip()
+    image_format = FORMAT_ALIASES.get(image_format, image_format)
+    if image_format not in FORMATS:
+        raise ValueError(f"Unsupported image format: {image_format}")
+    return image_format
+
+def encode_image(image: Image.Image, image_format: str = 'png', quality: int = 90,
+                 png_compress_level: int = 6, webp_method: int = 4) -> bytes:
+    """
+    Codifica una imagen PIL.
+
+    Args:
+        image: Imagen PIL
+        image_format: 'png', 'webp' o 'jpeg'
+        quality: Calidad para webp/jpeg
+        png_compress_level: Nivel zlib para png (menor = más rápido)
+        webp_method: Esfuerzo del encoder webp (0 rápido - 6 lento)
+
+    Returns:
+        Bytes codificados
+    """
+    image_format = normalize_format(image_format) or 'png'
+    buffered = BytesIO()
+    if image_format == 'png':
+        image.save(buffered, format='PNG', compress_level=png_compress_level)
+    elif image_format == 'webp':
+        image.save(buffered, format='WEBP', quality=quality, method=webp_method)
+    else:
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        image.save(buffered, format='JPEG', quality=quality)
+    return buffered.getvalue()
+
+def decode_base64(data: str) -> bytes:
+    """Bytes de un base64 con o sin prefijo data:."""
+    if 'base64,' in data:
+        data = data.split('base64,', 1)[1]
+    return base64.b64decode(data)
+
+def decode_image(data: str, mode: str = 'RGB') -> Image.Image:
+    """Decodifica una imagen base64 (con o sin prefijo data:) a PIL en el modo pedido."""
+    image = Image.open(BytesIO(decode_base64(data)))
+    image.load()
+    return image.convert(mode) if image.mode != mode else image
+
+class ImageOutputService:
+    def __init__(self, files_dir: str = "data/images", url_prefix: str = "/files/images",
+                 default_format: str = 'png', quality: int = 90, png_compress_level: int = 6,
+                 webp_method: int = 4):
+        """
+        Args:
+            files_dir: Directorio de las imágenes servidas por URL
+            url_prefix: Prefijo público de esas URLs
+            default_format: Formato si el cliente no pide ninguno
+            quality: Calidad por defecto para webp/jpeg
+            png_compress_level: Nivel zlib para png
+            webp_method: Esfuerzo del encoder webp
+        """
+        self.files_dir = files_dir
+        self.url_prefix = url_prefix.rstrip('/')
+        self.default_format = normalize_format(default_format) or 'png'
+        self.quality = quality
+        self.png_compress_level = png_compress_level
+        self.webp_method = webp_method
+        os.makedirs(files_dir, exist_ok=True)
+
+    def negotiate(self, params: Dict[str, Any], accept_mimetypes: Any = None) -> OutputSpec:
+        """
+        Decide cómo responder a partir de los parámetros y la cabecera Accept.
+
+        Args:
+            params: Parámetros de la petición ('response', 'format', 'quality')
+            accept_mimetypes: request.accept_mimetypes (werkzeug MIMEAccept)
+
+        Returns:
+            OutputSpec con modo, formato y calidad
+        """
+        mode = (params.get('response') or '').lower() or None
+        if mode is not None and mode not in MODES:
+            raise ValueError(f"Unsupported response mode: {mode}")
+        image_format = normalize_format(params.get('format'))
+
+        if mode is None and accept_mimetypes is not None:
+            # JSON comes first so that */* keeps the legacy response
+            candidates = [JSON_MIMETYPE] + [FORMATS[name][1] for name in FORMATS]
+            best = accept_mimetypes.best_match(candidates)
+            if best and best != JSON_MIMETYPE:
+                mode = 'binary'
+                image_format = image_format or next(name for name, (_, mime) in FORMATS.items() if mime == best)
+
+        quality = int(params.get('quality') or self.quality)
+        return OutputSpec(mode or 'base64', image_format or self.default_format, max(1, min(quality, 100)))
+
+    def render(self, spec: OutputSpec, image: Optional[Image.Image] = None,
+               encoded: Optional[bytes] = None, encoded_format: str = 'png') -> RenderedImage:
+        """
+        Produce los bytes de respuesta; reutiliza `encoded` si ya está en el formato pedido.
+
+        Args:
+            spec: Resultado de negotiate()
+            image: Imagen PIL (si no hay bytes reutilizables)
+            encoded: Bytes ya codificados (ej: desde el caché)
+            encoded_format: Formato de `encoded`
+        """
+        if encoded is not None and normalize_format(encoded_format) == spec.format:
+            data = encoded
+        else:
+            if image is None:
+                image = Image.open(BytesIO(encoded))
+            data = encode_image(image, spec.format, spec.quality, self.png_compress_level, self.webp_method)
+
+        url = self.store(data, spec.format) if spec.mode == 'url' else None
+        return RenderedImage(data, spec.format, url)
+
+    def store(self, data: bytes, image_format: str) -> str:
+        """Guarda los bytes con nombre = hash del contenido y retorna su URL."""
+        name = f"{hashlib.blake2b(data, digest_size=16).hexdigest()}.{image_format}"
+        path = os.path.join(self.files_dir, name)
+        if not os.path.exists(path):
+            fd, tmp_path = tempfile.mkstemp(dir=self.files_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        return f"{self.url_prefix}/{name}"
+
+# Singleton instance
+_image_output_service = None
+
+def get_image_output_service() -> ImageOutputService:
+    """Obtiene la instancia singleton del servicio de salida de imágenes."""
+    global _image_output_service
+    if _image_output_service is None:
+        from utils.config import get_setting
+        _image_output_service = ImageOutputService(
+            files_dir=get_setting("output.files_dir", "data/images"),
+            default_format=get_setting("output.default_format", "png"),
+            quality=get_setting("output.quality", 90),
+            png_compress_level=get_setting("output.png_compress_level", 6),
+            webp_method=get_setting("output.webp_method", 4)
+        )
+    return _image_output_service
@@ -0,0 +1,116 @@
+"""
+Inpainting recortado a la región de la máscara.
+En lugar de procesar el cuadro completo, se recorta el bounding box de la
+máscara más un margen de contexto, se ajusta a la proporción de un bucket SDXL
+y, tras el inpainting, el parche se mezcla de vuelta con un borde suavizado.
+Todo el trabajo de píxeles es NumPy vectorizado (sin bucles por píxel).
+"""
+
+import math
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from .cascade import SDXL_BUCKETS, draft_bucket
+
+Box = Tuple[int, int, int, int]
+
+def mask_bbox(mask: np.ndarray) -> Optional[Box]:
+    """
+    Bounding box (x0, y0, x1, y1) de los píxeles activos de la máscara.
+
+    Args:
+        mask: Array 2D booleano (True = repintar)
+
+    Returns:
+        Caja con x1/y1 exclusivos, o None si la máscara está vacía
+    """
+    rows = np.flatnonzero(mask.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(mask.any(axis=0))
+    return int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1
+
+def _fit_span(lo: int, hi: int, size: int, limit: int) -> Tuple[int, int]:
+    """Centra un intervalo de longitud `size` sobre [lo, hi) sin salirse de [0, limit)."""
+    size = min(size, limit)
+    start = int(round((lo + hi - size) / 2))
+    start = min(max(0, start), limit - size)
+    return start, start + size
+
+def crop_region(bbox: Box, image_size: Tuple[int, int], padding: int = 96,
+                min_megapixels: float = 0.6, buckets: Optional[Dict[str, Tuple[int, int]]] = None
+                ) -> Tuple[Box, Tuple[int, int]]:
+    """
+    Región a procesar y resolución de inferencia.
+
+    Args:
+        bbox: Caja de la máscara
+        image_size: (ancho, alto) de la imagen completa
+        padding: Margen de contexto alrededor de la máscara (px)
+        min_megapixels: Área mínima de inferencia (SDXL pierde calidad por debajo)
+        buckets: Resoluciones soportadas (default: SDXL_BUCKETS)
+
+    Returns:
+        (región (x0, y0, x1, y1) en la imagen, (ancho, alto) de inferencia)
+    """
+    buckets = buckets or SDXL_BUCKETS
+    width, height = image_size
+    x0, y0, x1, y1 = bbox
+    x0, y0 = max(0, x0 - padding), max(0, y0 - padding)
+    x1, y1 = min(width, x1 + padding), min(height, y1 + padding)
+
+    # Closest bucket aspect ratio, then grow the short side of the region to match it
+    aspect = (x1 - x0) / (y1 - y0)
+    bucket_w, bucket_h = min(buckets.values(), key=lambda b: abs(math.log(b[0] / b[1]) - math.log(aspect)))
+    target_aspect = bucket_w / bucket_h
+    if aspect < target_aspect:
+        x0, x1 = _fit_span(x0, x1, int(round((y1 - y0) * target_aspect)), width)
+    else:
+        y0, y1 = _fit_span(y0, y1, int(round((x1 - x0) / target_aspect)), height)
+
+    # Infer near the crop's own resolution: never below min_megapixels, never above the bucket
+    area = (x1 - x0) * (y1 - y0)
+    megapixels = min(max(area, min_megapixels * 1e6), bucket_w * bucket_h) / 1e6
+    return (x0, y0, x1, y1), draft_bucket(bucket_w, bucket_h, megapixels)
+
+def box_blur(values: np.ndarray, radius: int) -> np.ndarray:
+    """Media en una ventana (2r+1)² con imagen integral; coste independiente del radio."""
+    if radius <= 0:
+        return values.astype(np.float32)
+    k = 2 * radius + 1
+    padded = np.pad(values.astype(np.float64), radius, mode='edge')
+    integral = np.zeros((padded.shape[0] + 1, padded.shape[1] + 1))
+    integral[1:, 1:] = padded.cumsum(axis=0).cumsum(axis=1)
+    sums = integral[k:, k:] - integral[:-k, k:] - integral[k:, :-k] + integral[:-k, :-k]
+    return (sums / (k * k)).astype(np.float32)
+
+def feather_mask(mask: np.ndarray, radius: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Máscara dilatada y alfa de mezcla.
+
+    Args:
+        mask: Array 2D booleano
+        radius: Ancho del borde suave (px)
+
+    Returns:
+        (máscara dilatada para el pipeline, alfa float32 en [0, 1]; 1 en toda la máscara original)
+    """
+    if radius <= 0:
+        return mask, mask.astype(np.float32)
+    grown = box_blur(mask, radius) > 1e-6
+    # The max() keeps the original mask fully opaque despite float rounding in the blur
+    return grown, np.maximum(np.clip(box_blur(grown, radius), 0.0, 1.0), mask)
+
+def blend(base: np.ndarray, patch: np.ndarray, alpha: np.ndarray) -> np.ndarray:
+    """Mezcla patch sobre base (uint8 HxWxC) con alfa HxW."""
+    base = base.astype(np.float32)
+    mixed = base + (patch.astype(np.float32) - base) * alpha[..., None]
+    return np.clip(np.rint(mixed), 0, 255).astype(np.uint8)
+
+def paste_region(image: np.ndarray, patch: np.ndarray, alpha: np.ndarray, region: Box) -> np.ndarray:
+    """Retorna una copia de image con el parche mezclado en la región."""
+    x0, y0, x1, y1 = region
+    result = image.copy()
+    result[y0:y1, x0:x1] = blend(image[y0:y1, x0:x1], patch, alpha)
+    return result
@@ -0,0 +1,226 @@
+"""
+Almacén persistente de jobs en SQLite (modo WAL).
+Reemplaza el diccionario en memoria jobs_status: sobrevive reinicios,
+genera IDs sin colisiones y purga jobs terminados tras un TTL.
+"""
+
+import os
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+ACTIVE_STATUSES = ('queued', 'processing')
+FINISHED_STATUSES = ('completed', 'failed')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    status TEXT NOT NULL,
+    owner TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    data TEXT,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status);
+CREATE INDEX IF NOT EXISTS idx_jobs_type ON jobs(type);
+CREATE INDEX IF NOT EXISTS idx_jobs_owner ON jobs(owner);
+CREATE INDEX IF NOT EXISTS idx_jobs_created_at ON jobs(created_at);
+"""
+
+class JobStore:
+    def __init__(self, db_path: str = "data/jobs.db", ttl_seconds: int = 7 * 24 * 60 * 60):
+        """
+        Args:
+            db_path: Ruta del archivo SQLite
+            ttl_seconds: Tiempo que se conservan los jobs terminados (default: 7 días)
+        """
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._sweeper = None
+
+    @staticmethod
+    def new_job_id(prefix: str = "job") -> str:
+        """Genera un ID único (no depende del reloj, así que no colisiona)."""
+        return f"{prefix}_{uuid.uuid4().hex}"
+
+    def create(self, job_type: str, data: Dict = None, owner: str = None, prefix: str = None) -> Dict[str, Any]:
+        """
+        Crea un job en estado 'queued'.
+
+        Args:
+            job_type: Tipo de job (ej: 'video')
+            data: Payload necesario para ejecutar el job
+            owner: Usuario que lo creó
+            prefix: Prefijo del ID (default: job_type)
+
+        Returns:
+            Diccionario público del job
+        """
+        job_id = self.new_job_id(prefix or job_type)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, type, status, owner, created_at, updated_at, data, result) "
+                "VALUES (?, ?, 'queued', ?, ?, ?, ?, '{}')",
+                (job_id, job_type, owner, now, now, json.dumps(data or {}))
+            )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Obtiene el estado público de un job o None si no existe."""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_public(row) if row else None
+
+    def get_data(self, job_id: str) -> Optional[Dict]:
+        """Obtiene el payload de ejecución de un job."""
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row['data'] or '{}') if row else None
+
+    def update(self, job_id: str, status: str = None, **fields) -> bool:
+        """
+        Actualiza el estado y/o campos de resultado (url, error, progress...) de un job.
+
+        Returns:
+            True si el job existe
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT result FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return False
+
+            result = json.loads(row['result'] or '{}')
+            result.update(fields)
+            if status is None:
+                self._conn.execute(
+                    "UPDATE jobs SET result = ?, updated_at = ? WHERE id = ?",
+                    (json.dumps(result), time.time(), job_id)
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, result = ?, updated_at = ? WHERE id = ?",
+                    (status, json.dumps(result), time.time(), job_id)
+                )
+        return True
+
+    def list_jobs(self, status: str = None, job_type: str = None, owner: str = None,
+                  limit: int = 100) -> List[Dict[str, Any]]:
+        """Lista jobs filtrando por columnas indexadas, más recientes primero."""
+        clauses, params = [], []
+        for column, value in (('status', status), ('type', job_type), ('owner', owner)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+
+        query = "SELECT * FROM jobs"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [self._to_public(row) for row in rows]
+
+    def recover(self) -> List[Dict[str, Any]]:
+        """
+        Recupera los jobs pendientes tras un reinicio.
+
+        Los jobs 'processing' fueron interrumpidos: vuelven a 'queued'.
+
+        Returns:
+            Lista de jobs {'id', 'type', 'data'} en orden de creación, listos para encolar
+        """
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'queued', updated_at = ? WHERE status = 'processing'",
+                (time.time(),)
+            )
+            rows = self._conn.execute(
+                "SELECT id, type, data FROM jobs WHERE status = 'queued' ORDER BY created_at"
+            ).fetchall()
+
+        jobs = [{"id": row['id'], "type": row['type'], "data": json.loads(row['data'] or '{}')} for row in rows]
+        if jobs:
+            print(f"[*] Recovered {len(jobs)} pending jobs")
+        return jobs
+
+    def sweep(self, ttl_seconds: int = None) -> int:
+        """
+        Elimina jobs terminados más antiguos que el TTL.
+
+        Returns:
+            Número de jobs eliminados
+        """
+        cutoff = time.time() - (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (*FINISHED_STATUSES, cutoff)
+            )
+        if cursor.rowcount:
+            print(f"[*] Swept {cursor.rowcount} expired jobs")
+        return cursor.rowcount
+
+    def start_sweeper(self, interval_seconds: int = 3600):
+        """Arranca un thread que ejecuta sweep() periódicamente."""
+        if self._sweeper is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval_seconds)
+                try:
+                    self.sweep()
+                except Exception as e:
+                    print(f"[!] Job sweep failed: {e}")
+
+        self._sweeper = threading.Thread(target=run, name="job-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def get_stats(self) -> Dict[str, int]:
+        """Cuenta de jobs por estado."""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row['status']: row['n'] for row in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _to_public(row: sqlite3.Row) -> Dict[str, Any]:
+        job = json.loads(row['result'] or '{}')
+        job.update({
+            "id": row['id'],
+            "status": row['status'],
+            "type": row['type'],
+            "owner": row['owner'],
+            "created_at": row['created_at'],
+            "updated_at": row['updated_at'],
+        })
+        return job
+
+# Singleton instance
+_job_store = None
+
+def get_job_store() -> JobStore:
+    """Obtiene la instancia singleton del almacén de jobs."""
+    global _job_store
+    if _job_store is None:
+        _job_store = JobStore()
+    return _job_store
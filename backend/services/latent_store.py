@@ -0,0 +1,93 @@
+"""
+Almacén acotado de latentes finales de generaciones recientes.
+Permite variaciones ("vary") y refinados ("refine") que parten del latente de
+una generación anterior en lugar de repetir un text-to-image completo.
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+class LatentEntry:
+    def __init__(self, latent: Any, seed: int, prompt: str, negative_prompt: str,
+                 width: int, height: int, steps: int, guidance: float, is_lightning: bool,
+                 adapters: Tuple[Tuple[str, float], ...] = ()):
+        self.latent = latent
+        self.seed = seed
+        self.prompt = prompt
+        self.negative_prompt = negative_prompt
+        self.width = width
+        self.height = height
+        self.steps = steps
+        self.guidance = guidance
+        self.is_lightning = is_lightning
+        self.adapters = adapters
+        self.created_at = time.time()
+        self.size_bytes = latent.numel() * latent.element_size()
+
+class LatentStore:
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        """
+        Args:
+            max_bytes: Memoria máxima ocupada por los latentes guardados (en CPU)
+        """
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, LatentEntry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def new_generation_id() -> str:
+        return f"gen_{uuid.uuid4().hex}"
+
+    def put(self, generation_id: str, entry: LatentEntry):
+        if entry.size_bytes > self.max_bytes:
+            return
+
+        with self._lock:
+            if generation_id in self._entries:
+                self._bytes -= self._entries.pop(generation_id).size_bytes
+            self._entries[generation_id] = entry
+            self._bytes += entry.size_bytes
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size_bytes
+                self.evictions += 1
+
+    def get(self, generation_id: str) -> Optional[LatentEntry]:
+        with self._lock:
+            entry = self._entries.get(generation_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(generation_id)
+            self.hits += 1
+            return entry
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'entries': len(self._entries),
+            'size_mb': round(self._bytes / (1024 * 1024), 2),
+            'max_mb': round(self.max_bytes / (1024 * 1024), 2),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+# Singleton instance
+_latent_store = None
+
+def get_latent_store() -> LatentStore:
+    """Obtiene la instancia singleton del almacén de latentes."""
+    global _latent_store
+    if _latent_store is None:
+        from utils.config import get_setting
+        _latent_store = LatentStore(
+            max_bytes=int(get_setting("latent_store.max_mb", 64) * 1024 * 1024)
+        )
+    return _latent_store
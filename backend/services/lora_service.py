@@ -0,0 +1,225 @@
+"""
+Adaptadores LoRA intercambiables en caliente.
+Los tensores de cada LoRA se guardan en un caché LRU en CPU acotado por bytes;
+el conjunto activo se fusiona/desfusiona sobre el pipeline residente, sin
+recargar el modelo base.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+LORA_EXTENSIONS = ('.safetensors',)
+TEXT_ENCODER_PREFIXES = ('lora_te', 'text_encoder', 'te_', 'te1', 'te2')
+
+# Canonical, hashable adapter set: sorted ((name, weight), ...)
+AdapterSet = Tuple[Tuple[str, float], ...]
+
+def normalize_adapters(spec: Any, max_adapters: int = 3) -> AdapterSet:
+    """
+    Convierte la petición en un conjunto de adaptadores canónico.
+
+    Args:
+        spec: {"nombre": peso}, [{"name": ..., "weight": ...}] o ["nombre", ...]
+        max_adapters: Máximo de adaptadores por petición
+
+    Returns:
+        Tupla ordenada de (nombre, peso); pesos 0 se descartan
+    """
+    if not spec:
+        return ()
+    if isinstance(spec, dict):
+        pairs = list(spec.items())
+    elif isinstance(spec, list):
+        pairs = []
+        for entry in spec:
+            if isinstance(entry, str):
+                pairs.append((entry, 1.0))
+            elif isinstance(entry, dict) and entry.get('name'):
+                pairs.append((entry['name'], entry.get('weight', 1.0)))
+            else:
+                raise ValueError(f"Invalid LoRA entry: {entry!r}")
+    else:
+        raise ValueError("loras must be an object or a list")
+
+    adapters = {}
+    for name, weight in pairs:
+        try:
+            weight = round(float(weight), 3)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid LoRA weight for {name}: {weight!r}")
+        if not -2.0 <= weight <= 2.0:
+            raise ValueError(f"LoRA weight out of range [-2, 2] for {name}: {weight}")
+        if weight != 0:
+            adapters[str(name)] = weight
+
+    if len(adapters) > max_adapters:
+        raise ValueError(f"At most {max_adapters} LoRAs per request")
+    return tuple(sorted(adapters.items()))
+
+class LoRAManager:
+    def __init__(self, lora_dir: str, max_cache_bytes: int = 1024 * 1024 * 1024, max_loaded: int = 4,
+                 fuse: bool = True):
+        """
+        Args:
+            lora_dir: Carpeta con los .safetensors de cada LoRA
+            max_cache_bytes: Memoria máxima (CPU) del caché de tensores
+            max_loaded: Adaptadores inyectados a la vez en el pipeline
+            fuse: Fusionar el conjunto activo en los pesos (sin coste por paso)
+        """
+        self.lora_dir = lora_dir
+        self.max_cache_bytes = max_cache_bytes
+        self.max_loaded = max(1, max_loaded)
+        self.fuse = fuse
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.switches = 0
+        self.switch_seconds = 0.0
+        self._cache: "OrderedDict[str, Tuple[Dict[str, Any], int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+
+    def available(self) -> List[str]:
+        if not os.path.isdir(self.lora_dir):
+            return []
+        return sorted(os.path.splitext(name)[0] for name in os.listdir(self.lora_dir)
+                      if name.endswith(LORA_EXTENSIONS))
+
+    def path(self, name: str) -> str:
+        if os.path.basename(name) != name or name.startswith('.'):
+            raise ValueError(f"Invalid LoRA name: {name}")
+        for extension in LORA_EXTENSIONS:
+            candidate = os.path.join(self.lora_dir, name + extension)
+            if os.path.exists(candidate):
+                return candidate
+        raise ValueError(f"Unknown LoRA: {name}")
+
+    def validate(self, adapters: AdapterSet):
+        for name, _ in adapters:
+            self.path(name)
+
+    def _read(self, path: str) -> Dict[str, Any]:
+        from safetensors.torch import load_file
+        return load_file(path, device="cpu")
+
+    def state_dict(self, name: str) -> Dict[str, Any]:
+        """Tensores del LoRA desde el caché LRU (lee el archivo solo en un fallo)."""
+        with self._lock:
+            cached = self._cache.get(name)
+            if cached is not None:
+                self._cache.move_to_end(name)
+                self.hits += 1
+                return cached[0]
+            self.misses += 1
+
+        state = self._read(self.path(name))
+        size = sum(t.numel() * t.element_size() for t in state.values())
+        with self._lock:
+            if size <= self.max_cache_bytes:
+                if name in self._cache:
+                    self._bytes -= self._cache.pop(name)[1]
+                self._cache[name] = (state, size)
+                self._bytes += size
+                while self._bytes > self.max_cache_bytes:
+                    _, (_, evicted_size) = self._cache.popitem(last=False)
+                    self._bytes -= evicted_size
+                    self.evictions += 1
+        return state
+
+    def touches_text_encoders(self, adapters: AdapterSet) -> bool:
+        return any(key.startswith(TEXT_ENCODER_PREFIXES)
+                   for name, _ in adapters for key in self.state_dict(name))
+
+    def text_encoder_variant(self, adapters: AdapterSet) -> str:
+        """Variante para el caché de embeddings: solo cambia si algún LoRA modifica los text encoders."""
+        if not adapters or not self.touches_text_encoders(adapters):
+            return ""
+        return ",".join(f"{name}:{weight}" for name, weight in adapters)
+
+    def activate(self, pipe: Any, adapters: AdapterSet) -> bool:
+        """
+        Deja activo exactamente `adapters` sobre el pipeline residente.
+
+        Args:
+            pipe: Pipeline SDXL (API de LoRA de diffusers/PEFT)
+            adapters: Conjunto canónico de normalize_adapters()
+
+        Returns:
+            True si hubo que cambiar el conjunto activo
+        """
+        with self._lock:
+            current = getattr(pipe, 'active_adapters_set', ())
+            if current == adapters:
+                return False
+
+            start = time.perf_counter()
+            loaded: "OrderedDict[str, None]" = getattr(pipe, 'loaded_adapters', None)
+            if loaded is None:
+                loaded = pipe.loaded_adapters = OrderedDict()
+
+            if getattr(pipe, 'lora_fused', False):
+                pipe.unfuse_lora()
+                pipe.lora_fused = False
+
+            if not adapters:
+                if loaded:
+                    pipe.disable_lora()
+            else:
+                names = [name for name, _ in adapters]
+                for name in names:
+                    if name in loaded:
+                        loaded.move_to_end(name)
+                        continue
+                    # load_lora_weights consumes the dict it gets, so it gets a shallow copy
+                    pipe.load_lora_weights(dict(self.state_dict(name)), adapter_name=name)
+                    loaded[name] = None
+
+                # Keep the number of injected adapters bounded (the CPU copy stays cached)
+                for stale in [name for name in loaded if name not in names][:max(0, len(loaded) - self.max_loaded)]:
+                    pipe.delete_adapters(stale)
+                    del loaded[stale]
+
+                pipe.enable_lora()
+                pipe.set_adapters(names, adapter_weights=[weight for _, weight in adapters])
+                if self.fuse:
+                    pipe.fuse_lora(adapter_names=names)
+                    pipe.lora_fused = True
+
+            pipe.active_adapters_set = adapters
+            self.switches += 1
+            self.switch_seconds += time.perf_counter() - start
+            return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'available': len(self.available()),
+            'cached': list(self._cache),
+            'cache_mb': round(self._bytes / (1024 * 1024), 2),
+            'max_cache_mb': round(self.max_cache_bytes / (1024 * 1024), 2),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'switches': self.switches,
+            'avg_switch_ms': round(self.switch_seconds / self.switches * 1000, 2) if self.switches else 0
+        }
+
+# Singleton instance
+_lora_manager = None
+
+def get_lora_manager() -> LoRAManager:
+    """Obtiene la instancia singleton del gestor de LoRAs."""
+    global _lora_manager
+    if _lora_manager is None:
+        from utils.config import get_setting
+        backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        _lora_manager = LoRAManager(
+            lora_dir=os.path.join(backend_dir, get_setting("loras.dir", "models/loras")),
+            max_cache_bytes=int(get_setting("loras.max_cache_mb", 1024) * 1024 * 1024),
+            max_loaded=get_setting("loras.max_loaded", 4),
+            fuse=get_setting("loras.fuse", True)
+        )
+    return _lora_manager
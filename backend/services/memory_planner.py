@@ -0,0 +1,219 @@
+"""
+Planificador de memoria para la inferencia SDXL.
+Estima el pico de activaciones de la UNet y del decode del VAE a partir de
+resolución, batch y dtype, y activa attention slicing, VAE slicing o VAE
+tiling solo cuando la estimación supera la VRAM libre.
+
+Las estimaciones son aproximadas (órdenes de magnitud calibrados para SDXL),
+pensadas para decidir sin GPU y con margen, no para contabilidad exacta.
+"""
+
+from typing import Any, Dict, Optional, Tuple
+
+GB = 1024 ** 3
+
+# SDXL UNet transformer levels: (downsampling vs. latent, attention heads)
+SDXL_ATTENTION_LEVELS = ((2, 10), (4, 20))
+# Feature maps (at latent resolution, 320 channels) alive at the UNet peak, including skip connections
+UNET_FEATURE_MAPS = 80
+# SDXL VAE decoder: the last up blocks run 128-256 channels at 1/2 and full resolution
+VAE_FULL_RES_CHANNELS = 128
+VAE_LIVE_MAPS = 3
+VAE_TILE_SIZES = (1024, 768, 512)
+
+def unet_activation_bytes(width: int, height: int, batch: int = 1, cfg: bool = False, dtype_bytes: int = 2,
+                          efficient_attention: bool = True, attention_slices: int = 1) -> int:
+    """
+    Pico estimado de activaciones de la UNet durante un paso.
+
+    Args:
+        width: Ancho de la imagen
+        height: Alto de la imagen
+        batch: Imágenes por llamada
+        cfg: Classifier-free guidance (duplica el batch efectivo)
+        dtype_bytes: Bytes por elemento (2 para fp16)
+        efficient_attention: xFormers / SDPA (memoria de atención lineal en tokens)
+        attention_slices: En cuántas partes se divide la matriz de atención
+
+    Returns:
+        Bytes estimados
+    """
+    effective_batch = batch * (2 if cfg else 1)
+    latent_pixels = (height // 8) * (width // 8)
+    features = effective_batch * latent_pixels * 320 * dtype_bytes * UNET_FEATURE_MAPS
+
+    attention = 0
+    if not efficient_attention:
+        # Full softmax(QK^T) matrix per head; slicing processes only part of batch*heads at a time
+        attention = max(
+            effective_batch * heads * (latent_pixels // (down * down)) ** 2 * dtype_bytes
+            for down, heads in SDXL_ATTENTION_LEVELS
+        ) // max(1, attention_slices)
+    return features + attention
+
+def vae_decode_bytes(width: int, height: int, batch: int = 1, dtype_bytes: int = 4,
+                     efficient_attention: bool = True, tile: Optional[int] = None) -> int:
+    """
+    Pico estimado del decode del VAE.
+
+    Args:
+        width: Ancho de la imagen
+        height: Alto de la imagen
+        batch: Latentes decodificados a la vez (1 con VAE slicing)
+        dtype_bytes: Bytes por elemento (4: el VAE de SDXL se decodifica en fp32)
+        efficient_attention: Atención del mid-block con memoria lineal
+        tile: Lado del tile en píxeles si se usa VAE tiling
+
+    Returns:
+        Bytes estimados
+    """
+    if tile is not None:
+        width, height = min(width, tile), min(height, tile)
+    maps = batch * VAE_FULL_RES_CHANNELS * width * height * dtype_bytes * VAE_LIVE_MAPS
+    attention = 0
+    if not efficient_attention:
+        tokens = (height // 8) * (width // 8)
+        attention = batch * tokens * tokens * dtype_bytes
+    return maps + attention
+
+class ExecutionPlan:
+    def __init__(self, width: int, height: int, batch: int, free_bytes: int):
+        self.width = width
+        self.height = height
+        self.batch = batch
+        self.free_bytes = free_bytes
+        self.attention_slicing: Optional[str] = None
+        self.vae_slicing = False
+        self.vae_tile: Optional[int] = None
+        self.unet_bytes = 0
+        self.vae_bytes = 0
+
+    @property
+    def peak_bytes(self) -> int:
+        return max(self.unet_bytes, self.vae_bytes)
+
+    @property
+    def fits(self) -> bool:
+        return self.peak_bytes <= self.free_bytes
+
+    @property
+    def key(self) -> Tuple[Optional[str], bool, Optional[int]]:
+        return self.attention_slicing, self.vae_slicing, self.vae_tile
+
+    def describe(self) -> str:
+        options = []
+        if self.attention_slicing:
+            options.append(f"attention slicing {self.attention_slicing}")
+        if self.vae_slicing:
+            options.append("VAE slicing")
+        if self.vae_tile:
+            options.append(f"VAE tiling {self.vae_tile}px")
+        return (f"{self.width}x{self.height} x{self.batch}: {', '.join(options) or 'no slicing/tiling'} "
+                f"(est. peak {self.peak_bytes / GB:.2f} GB / free {self.free_bytes / GB:.2f} GB)")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'attention_slicing': self.attention_slicing,
+            'vae_slicing': self.vae_slicing,
+            'vae_tile': self.vae_tile,
+            'unet_gb': round(self.unet_bytes / GB, 3),
+            'vae_gb': round(self.vae_bytes / GB, 3),
+            'free_gb': round(self.free_bytes / GB, 3),
+            'fits': self.fits
+        }
+
+def plan_execution(width: int, height: int, batch: int, free_bytes: int, cfg: bool = False,
+                   unet_dtype_bytes: int = 2, vae_dtype_bytes: int = 4, efficient_attention: bool = True,
+                   vae_batch: Optional[int] = None, safety: float = 0.9) -> ExecutionPlan:
+    """
+    Elige la configuración más rápida cuya estimación cabe en la VRAM libre.
+
+    Args:
+        width: Ancho de la imagen
+        height: Alto de la imagen
+        batch: Imágenes por llamada a la UNet
+        free_bytes: VRAM disponible para activaciones
+        cfg: Classifier-free guidance
+        unet_dtype_bytes: Bytes por elemento en la UNet
+        vae_dtype_bytes: Bytes por elemento en el VAE (4 si se hace upcast a fp32)
+        efficient_attention: xFormers / SDPA disponibles
+        vae_batch: Latentes decodificados por llamada al VAE (default: batch)
+        safety: Fracción de free_bytes que se considera utilizable
+
+    Returns:
+        ExecutionPlan (fits=False si ni la opción más ahorradora cabe)
+    """
+    plan = ExecutionPlan(width, height, batch, int(free_bytes * safety))
+    budget = plan.free_bytes
+
+    unet_args = dict(width=width, height=height, batch=batch, cfg=cfg, dtype_bytes=unet_dtype_bytes,
+                     efficient_attention=efficient_attention)
+    plan.unet_bytes = unet_activation_bytes(**unet_args)
+    if plan.unet_bytes > budget and not efficient_attention:
+        # 'auto' halves the heads per slice; 'max' runs one head at a time
+        for mode, slices in (("auto", 2), ("max", batch * (2 if cfg else 1) * max(h for _, h in SDXL_ATTENTION_LEVELS))):
+            plan.attention_slicing = mode
+            plan.unet_bytes = unet_activation_bytes(attention_slices=slices, **unet_args)
+            if plan.unet_bytes <= budget:
+                break
+
+    vae_batch = batch if vae_batch is None else vae_batch
+    vae_args = dict(width=width, height=height, dtype_bytes=vae_dtype_bytes, efficient_attention=efficient_attention)
+    plan.vae_bytes = vae_decode_bytes(batch=vae_batch, **vae_args)
+    if plan.vae_bytes > budget and vae_batch > 1:
+        plan.vae_slicing = True
+        plan.vae_bytes = vae_decode_bytes(batch=1, **vae_args)
+    if plan.vae_bytes > budget:
+        for tile in VAE_TILE_SIZES:
+            if tile >= max(width, height):
+                continue
+            plan.vae_tile = tile
+            plan.vae_bytes = vae_decode_bytes(batch=1 if plan.vae_slicing else vae_batch, tile=tile, **vae_args)
+            if plan.vae_bytes <= budget:
+                break
+    return plan
+
+def max_batch_size(width: int, height: int, free_bytes: int, limit: int, **kwargs) -> int:
+    """Mayor batch (<= limit) cuyo plan cabe en la VRAM libre, usando slicing/tiling si hace falta."""
+    for batch in range(max(1, limit), 1, -1):
+        if plan_execution(width, height, batch, free_bytes, **kwargs).fits:
+            return batch
+    return 1
+
+def apply_plan(pipe: Any, plan: ExecutionPlan) -> bool:
+    """
+    Aplica el plan al pipeline (solo si cambió respecto al anterior).
+
+    Returns:
+        True si se modificó la configuración del pipeline
+    """
+    previous = getattr(pipe, 'memory_plan_key', (None, False, None))
+    if previous == plan.key:
+        return False
+
+    if plan.attention_slicing != previous[0]:
+        if plan.attention_slicing:
+            pipe.enable_attention_slicing(plan.attention_slicing)
+        else:
+            pipe.disable_attention_slicing()
+            # Disabling slicing resets the attention processors; restore xFormers if it was on
+            if getattr(pipe, 'xformers_enabled', False):
+                pipe.enable_xformers_memory_efficient_attention()
+
+    if plan.vae_slicing != previous[1]:
+        if plan.vae_slicing:
+            pipe.enable_vae_slicing()
+        else:
+            pipe.disable_vae_slicing()
+
+    if plan.vae_tile != previous[2]:
+        if plan.vae_tile:
+            vae = pipe.vae
+            vae.tile_sample_min_size = plan.vae_tile
+            vae.tile_latent_min_size = plan.vae_tile // 8
+            pipe.enable_vae_tiling()
+        else:
+            pipe.disable_vae_tiling()
+
+    pipe.memory_plan_key = plan.key
+    return True
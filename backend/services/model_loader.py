@@ -0,0 +1,151 @@
+"""
+Carga rápida (cold start) del pipeline SDXL Lightning.
+Crea la UNet sin materializar pesos de inicialización y lee cada tensor
+del safetensors mapeado en memoria directo al device/dtype destino, sin
+una segunda copia completa del state dict en CPU.
+"""
+
+import resource
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+SDXL_BASE = "stabilityai/stable-diffusion-xl-base-1.0"
+
+def peak_rss_mb() -> float:
+    """Pico de memoria residente del proceso en MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KB on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+class PhaseTimer:
+    """Mide duración y pico de RSS de cada fase de una carga."""
+
+    def __init__(self):
+        self.phases: List[Dict[str, Any]] = []
+        self._name = None
+        self._start = 0.0
+
+    def phase(self, name: str):
+        self._close()
+        self._name = name
+        self._start = time.perf_counter()
+        return self
+
+    def done(self) -> List[Dict[str, Any]]:
+        self._close()
+        return self.phases
+
+    def _close(self):
+        if self._name is not None:
+            self.phases.append({
+                'phase': self._name,
+                'seconds': round(time.perf_counter() - self._start, 3),
+                'peak_rss_mb': round(peak_rss_mb(), 1)
+            })
+            self._name = None
+
+    def report(self) -> str:
+        lines = [f"{'phase':<24}{'seconds':>10}{'peak RSS MB':>14}"]
+        for p in self.phases:
+            lines.append(f"{p['phase']:<24}{p['seconds']:>10.3f}{p['peak_rss_mb']:>14.1f}")
+        lines.append(f"{'total':<24}{sum(p['seconds'] for p in self.phases):>10.3f}")
+        return "\n".join(lines)
+
+def load_unet_legacy(ckpt_path: str, cache_dir: str, timer: PhaseTimer, base: str = SDXL_BASE):
+    """Camino original: init aleatorio completo + state dict en CPU + load_state_dict."""
+    import torch
+    from diffusers import UNet2DConditionModel
+    from safetensors.torch import load_file
+
+    timer.phase("unet_init")
+    unet_config = UNet2DConditionModel.load_config(base, subfolder="unet", cache_dir=cache_dir)
+    unet = UNet2DConditionModel.from_config(unet_config, torch_dtype=torch.float16)
+
+    timer.phase("unet_weights")
+    state_dict = load_file(ckpt_path, device="cpu")
+    unet.load_state_dict(state_dict, strict=True)
+    del state_dict
+    return unet
+
+def load_unet_fast(ckpt_path: str, cache_dir: str, timer: PhaseTimer, device: str = "cpu",
+                   base: str = SDXL_BASE):
+    """
+    Crea la UNet en el meta device y transmite los tensores del safetensors
+    (mmap) uno a uno al device/dtype destino.
+
+    Args:
+        ckpt_path: Ruta del safetensors de la UNet
+        cache_dir: Caché de diffusers para la config
+        timer: PhaseTimer donde registrar las fases
+        device: Device destino de los pesos (en la app siempre 'cpu': el VRAMManager hace la subida a GPU)
+    """
+    import torch
+    from accelerate import init_empty_weights
+    from accelerate.utils import set_module_tensor_to_device
+    from diffusers import UNet2DConditionModel
+    from safetensors import safe_open
+
+    timer.phase("unet_init")
+    unet_config = UNet2DConditionModel.load_config(base, subfolder="unet", cache_dir=cache_dir)
+    with init_empty_weights():
+        unet = UNet2DConditionModel.from_config(unet_config)
+
+    timer.phase("unet_weights")
+    expected = set(unet.state_dict().keys())
+    with safe_open(ckpt_path, framework="pt", device="cpu") as f:
+        keys = set(f.keys())
+        if keys != expected:
+            missing, unexpected = sorted(expected - keys), sorted(keys - expected)
+            raise RuntimeError(f"UNet checkpoint mismatch: missing={missing[:5]} unexpected={unexpected[:5]}")
+        for name in keys:
+            # Each tensor is a view of the mapped file until it is cast/copied to its destination
+            set_module_tensor_to_device(unet, name, device, value=f.get_tensor(name), dtype=torch.float16)
+
+    unet.to(dtype=torch.float16)
+    return unet
+
+def build_lightning_pipeline(ckpt_path: str, cache_dir: str, fast: bool = True, device: str = "cpu",
+                             timer: Optional[PhaseTimer] = None, base: str = SDXL_BASE):
+    """
+    Ensambla el pipeline SDXL con la UNet Lightning.
+
+    Args:
+        ckpt_path: Safetensors de la UNet Lightning
+        cache_dir: Caché de diffusers
+        fast: Usar la carga sin init y con streaming de tensores
+        device: Device destino de la UNet en modo rápido. Por defecto CPU: los pesos
+            cargados directo en GPU quedarían fuera del presupuesto del VRAMManager
+        timer: PhaseTimer para medir las fases
+
+    Returns:
+        Pipeline SDXL listo (el resto de componentes queda en CPU)
+    """
+    import torch
+    try:
+        from diffusers import DiffusionPipeline, EulerAncestralDiscreteScheduler
+    except ImportError:
+        from diffusers import StableDiffusionXLPipeline as DiffusionPipeline, EulerAncestralDiscreteScheduler
+
+    timer = timer or PhaseTimer()
+    if fast:
+        unet = load_unet_fast(ckpt_path, cache_dir, timer, device=device, base=base)
+    else:
+        unet = load_unet_legacy(ckpt_path, cache_dir, timer, base=base)
+
+    timer.phase("pipeline_assembly")
+    pipe = DiffusionPipeline.from_pretrained(
+        base,
+        unet=unet,
+        torch_dtype=torch.float16,
+        variant="fp16",
+        use_safetensors=True,
+        low_cpu_mem_usage=True,
+        cache_dir=cache_dir
+    )
+    pipe.scheduler = EulerAncestralDiscreteScheduler.from_config(
+        pipe.scheduler.config,
+        timestep_spacing="trailing"
+    )
+    timer.done()
+    return pipe
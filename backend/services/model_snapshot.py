@@ -0,0 +1,242 @@
+"""
+Snapshot pre-fusionado del pipeline SDXL.
+Tras la primera carga se escribe el pipeline ensamblado (UNet Lightning ya
+integrada, VAE, text encoders) en un único safetensors fp16 contiguo, junto a
+un manifest con la estructura de componentes y checksums de las fuentes.
+Los arranques siguientes lo cargan en una sola pasada mmap; si alguna fuente
+cambia, el snapshot se invalida y se reconstruye.
+"""
+
+import hashlib
+import importlib
+import inspect
+import json
+import os
+import shutil
+import struct
+from typing import Any, Dict, Optional
+
+from .model_loader import PhaseTimer
+
+SNAPSHOT_VERSION = 1
+WEIGHTS_FILE = "pipeline.safetensors"
+MANIFEST_FILE = "manifest.json"
+_SAMPLE_BYTES = 1024 * 1024
+
+def source_checksum(source: str) -> str:
+    """
+    Checksum de una fuente del snapshot.
+
+    Para archivos se hashea tamaño, mtime y el primer/último MB: detecta
+    re-descargas y reemplazos sin leer varios GB en cada arranque.
+    Cualquier otra fuente (ej: repo id) se hashea como texto.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    if not os.path.isfile(source):
+        h.update(source.encode('utf-8'))
+        return h.hexdigest()
+
+    stat = os.stat(source)
+    h.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode('utf-8'))
+    with open(source, 'rb') as f:
+        h.update(f.read(_SAMPLE_BYTES))
+        if stat.st_size > _SAMPLE_BYTES:
+            f.seek(max(_SAMPLE_BYTES, stat.st_size - _SAMPLE_BYTES))
+            h.update(f.read(_SAMPLE_BYTES))
+    return h.hexdigest()
+
+def source_checksums(sources: Dict[str, str]) -> Dict[str, str]:
+    return {name: source_checksum(path) for name, path in sources.items()}
+
+def snapshot_name(target: str) -> str:
+    """Nombre de directorio estable para el snapshot de un checkpoint."""
+    return hashlib.blake2b(target.encode('utf-8'), digest_size=6).hexdigest()
+
+def read_manifest(snapshot_dir: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(snapshot_dir, MANIFEST_FILE), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def snapshot_is_valid(manifest: Optional[Dict[str, Any]], sources: Dict[str, str]) -> bool:
+    """El snapshot es válido si es de esta versión y sus fuentes no cambiaron."""
+    if not manifest or manifest.get('version') != SNAPSHOT_VERSION:
+        return False
+    return manifest.get('sources') == source_checksums(sources)
+
+def _component_spec(component: Any) -> Dict[str, Any]:
+    """Describe cómo reconstruir un componente del pipeline."""
+    if component is None:
+        return {'kind': 'none'}
+
+    cls = type(component)
+    spec = {'library': cls.__module__.split('.')[0], 'class': cls.__name__}
+    if hasattr(component, 'state_dict') and hasattr(component, 'parameters'):
+        config = component.config
+        spec['kind'] = 'module'
+        spec['config'] = config.to_dict() if hasattr(config, 'to_dict') else dict(config)
+    elif hasattr(component, 'save_pretrained') and hasattr(component, 'tokenize'):
+        spec['kind'] = 'tokenizer'
+    elif hasattr(component, 'config') and hasattr(component, 'set_timesteps'):
+        spec['kind'] = 'scheduler'
+        spec['config'] = dict(component.config)
+    else:
+        spec['kind'] = 'unsupported'
+    return spec
+
+_DTYPES = {
+    'float16': 'F16', 'float32': 'F32', 'int64': 'I64', 'int32': 'I32', 'bool': 'BOOL', 'uint8': 'U8'
+}
+
+def _write_safetensors(path: str, tensors: Dict[str, Any]):
+    """
+    Escribe un safetensors tensor a tensor, sin reunir todo el state dict en RAM.
+    Los tensores flotantes se guardan en fp16.
+    """
+    import torch
+
+    def prepared(tensor):
+        tensor = tensor.detach()
+        if tensor.is_floating_point():
+            tensor = tensor.to(torch.float16)
+        return tensor
+
+    names = sorted(tensors)
+    header, offset = {}, 0
+    for name in names:
+        tensor = tensors[name]
+        dtype = str(torch.float16 if tensor.is_floating_point() else tensor.dtype).replace('torch.', '')
+        size = tensor.numel() * torch.empty((), dtype=getattr(torch, dtype)).element_size()
+        header[name] = {'dtype': _DTYPES[dtype], 'shape': list(tensor.shape), 'data_offsets': [offset, offset + size]}
+        offset += size
+
+    raw_header = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    raw_header += b' ' * (-len(raw_header) % 8)
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<Q', len(raw_header)))
+        f.write(raw_header)
+        for name in names:
+            f.write(prepared(tensors[name]).to('cpu').contiguous().numpy().tobytes())
+
+def save_snapshot(pipe: Any, snapshot_dir: str, sources: Dict[str, str]) -> bool:
+    """
+    Escribe el pipeline ensamblado como snapshot (weights + manifest).
+
+    Args:
+        pipe: Pipeline SDXL ya cargado
+        snapshot_dir: Directorio destino (se reemplaza atómicamente)
+        sources: {nombre: ruta o id} de las fuentes usadas para construir el pipeline
+
+    Returns:
+        True si el snapshot se escribió
+    """
+    components = {name: _component_spec(value) for name, value in pipe.components.items()}
+    if any(spec['kind'] == 'unsupported' for spec in components.values()):
+        print("[!] Snapshot skipped: pipeline has unsupported components")
+        return False
+
+    tmp_dir = snapshot_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    try:
+        print(f"[*] Writing pipeline snapshot to {snapshot_dir}...")
+        tensors = {}
+        for name, spec in components.items():
+            component = pipe.components[name]
+            if spec['kind'] == 'module':
+                for key, tensor in component.state_dict().items():
+                    tensors[f"{name}.{key}"] = tensor
+            elif spec['kind'] == 'tokenizer':
+                component.save_pretrained(os.path.join(tmp_dir, name))
+        _write_safetensors(os.path.join(tmp_dir, WEIGHTS_FILE), tensors)
+        del tensors
+
+        init_params = inspect.signature(type(pipe).__init__).parameters
+        manifest = {
+            'version': SNAPSHOT_VERSION,
+            'pipeline_class': type(pipe).__name__,
+            'pipeline_config': {k: v for k, v in dict(pipe.config).items()
+                                if k in init_params and k not in components},
+            'components': components,
+            'sources': source_checksums(sources)
+        }
+        with open(os.path.join(tmp_dir, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f, indent=2, default=str)
+
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+        os.replace(tmp_dir, snapshot_dir)
+        print("[✓] Pipeline snapshot saved")
+        return True
+    except Exception as e:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        print(f"[!] Snapshot write failed: {e}")
+        return False
+
+def _build_empty(spec: Dict[str, Any]):
+    from accelerate import init_empty_weights
+
+    cls = getattr(importlib.import_module(spec['library']), spec['class'])
+    with init_empty_weights():
+        if spec['library'] == 'transformers':
+            return cls(cls.config_class.from_dict(spec['config']))
+        return cls.from_config(spec['config'])
+
+def load_snapshot(snapshot_dir: str, sources: Dict[str, str], device: str = "cpu",
+                  timer: Optional[PhaseTimer] = None):
+    """
+    Carga el pipeline desde el snapshot en una sola pasada mmap.
+
+    Args:
+        snapshot_dir: Directorio del snapshot
+        sources: Fuentes actuales; si no coinciden con el manifest el snapshot se descarta
+        device: Device destino de los pesos. Por defecto CPU: el VRAMManager sube el
+            pipeline a GPU dentro de su presupuesto
+        timer: PhaseTimer para medir las fases
+
+    Returns:
+        Pipeline listo, o None si no hay snapshot válido
+    """
+    manifest = read_manifest(snapshot_dir)
+    if manifest is None:
+        return None
+    if not snapshot_is_valid(manifest, sources):
+        print("[*] Pipeline snapshot is stale, discarding")
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+        return None
+
+    import diffusers
+    from accelerate.utils import set_module_tensor_to_device
+    from safetensors import safe_open
+
+    timer = timer or PhaseTimer()
+
+    timer.phase("snapshot_init")
+    components = {}
+    for name, spec in manifest['components'].items():
+        if spec['kind'] == 'none':
+            components[name] = None
+        elif spec['kind'] == 'module':
+            components[name] = _build_empty(spec)
+        elif spec['kind'] == 'tokenizer':
+            cls = getattr(importlib.import_module(spec['library']), spec['class'])
+            components[name] = cls.from_pretrained(os.path.join(snapshot_dir, name))
+        elif spec['kind'] == 'scheduler':
+            components[name] = getattr(diffusers, spec['class']).from_config(spec['config'])
+
+    timer.phase("snapshot_weights")
+    with safe_open(os.path.join(snapshot_dir, WEIGHTS_FILE), framework="pt", device="cpu") as f:
+        for key in f.keys():
+            name, tensor_name = key.split('.', 1)
+            set_module_tensor_to_device(components[name], tensor_name, device, value=f.get_tensor(key))
+
+    for name, spec in manifest['components'].items():
+        if spec['kind'] == 'module':
+            components[name].eval()
+
+    timer.phase("pipeline_assembly")
+    pipeline_cls = getattr(diffusers, manifest['pipeline_class'])
+    pipe = pipeline_cls(**components, **manifest.get('pipeline_config', {}))
+    timer.done()
+    return pipe
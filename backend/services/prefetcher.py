@@ -0,0 +1,87 @@
+"""
+Prefetch de modelos con anticipación.
+Mira la cabeza de la cola GPU y, mientras corre el trabajo actual, transfiere
+a VRAM el modelo del próximo trabajo si cabe en el presupuesto.
+"""
+
+import threading
+from typing import Any, Dict, Optional
+
+class ModelPrefetcher:
+    def __init__(self, vram_manager, scheduler, lookahead: int = 2, poll_interval: float = 0.5):
+        """
+        Args:
+            vram_manager: VRAMManager que realiza las transferencias
+            scheduler: AffinityScheduler del carril GPU (cola a observar)
+            lookahead: Cuántos trabajos de la cabeza de la cola considerar
+            poll_interval: Segundos entre revisiones si la cola no cambia
+        """
+        self.vram_manager = vram_manager
+        self.scheduler = scheduler
+        self.lookahead = max(1, lookahead)
+        self.poll_interval = poll_interval
+
+        self.target: Optional[str] = None
+        self._cancel: Optional[threading.Event] = None
+        self._worker: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="model-prefetcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._cancel is not None:
+            self._cancel.set()
+
+    def next_model(self) -> Optional[str]:
+        """Primer modelo de la cabeza de la cola que todavía no está en VRAM."""
+        for model in self.scheduler.peek_models(self.lookahead):
+            if model is not None and not self.vram_manager.is_resident(model):
+                return model
+        return None
+
+    def _run(self):
+        version = -1
+        while not self._stopped.is_set():
+            version = self.scheduler.wait_for_change(version, timeout=self.poll_interval)
+            try:
+                self._step()
+            except Exception as e:
+                print(f"[!] Prefetcher error: {e}")
+
+    def _step(self):
+        wanted = set(m for m in self.scheduler.peek_models(self.lookahead) if m is not None)
+        in_flight = self._worker is not None and self._worker.is_alive()
+
+        if in_flight:
+            # The queue changed and the model being transferred is no longer coming up
+            if self.target not in wanted:
+                print(f"[*] Cancelling prefetch of {self.target}")
+                self._cancel.set()
+            return
+
+        target = self.next_model()
+        if target is None:
+            return
+
+        self.target = target
+        self._cancel = threading.Event()
+        self._worker = threading.Thread(
+            target=self.vram_manager.prefetch, args=(target, self._cancel),
+            name=f"prefetch-{target}", daemon=True
+        )
+        self._worker.start()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'target': self.target if self._worker is not None and self._worker.is_alive() else None,
+            'prefetches': self.vram_manager.prefetches,
+            'prefetch_hits': self.vram_manager.prefetch_hits,
+            'prefetch_cancels': self.vram_manager.prefetch_cancels
+        }
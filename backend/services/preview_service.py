@@ -0,0 +1,257 @@
+"""
+Previews en vivo de la generación.
+Decodifica los latentes intermedios de forma barata (proyección lineal
+latente->RGB o decoder aproximado TAESD) y entrega una imagen pequeña al
+cliente que hizo la petición, limitando el coste a una fracción del tiempo
+de cada paso.
+"""
+
+import io
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+# Linear approximation of the SDXL VAE decoder (4 latent channels -> RGB in [-1, 1])
+SDXL_LATENT_RGB_FACTORS = np.array([
+    [0.3651, 0.4232, 0.4341],
+    [-0.2533, -0.0042, 0.1068],
+    [0.1076, 0.1111, -0.0362],
+    [-0.3165, -0.2492, -0.2188]
+], dtype=np.float32)
+SDXL_LATENT_RGB_BIAS = np.array([0.1084, -0.0175, -0.0011], dtype=np.float32)
+
+TAESD_DECODER_FILES = ("taesdxl_decoder.pth", "taesdxl_decoder.safetensors")
+
+class PreviewThrottle:
+    """
+    Decide en cada paso si hay presupuesto para un preview.
+    El tiempo gastado en previews se mantiene por debajo de max_cost_fraction
+    del tiempo de los pasos (el coste del preview no cuenta como tiempo de paso).
+    """
+
+    def __init__(self, max_cost_fraction: float = 0.1, every_n_steps: int = 1,
+                 clock: Callable[[], float] = time.perf_counter):
+        self.max_cost_fraction = max_cost_fraction
+        self.every_n_steps = max(1, every_n_steps)
+        self.clock = clock
+        self.step_time = 0.0
+        self.preview_time = 0.0
+        self.last_cost = 0.0
+        self.previews = 0
+        self.skipped = 0
+        self._last_tick = clock()
+
+    def should_preview(self, step: int) -> bool:
+        now = self.clock()
+        self.step_time += now - self._last_tick
+        self._last_tick = now
+
+        if step % self.every_n_steps != 0:
+            return False
+        # The next preview is assumed to cost as much as the last one
+        if self.preview_time + self.last_cost > self.max_cost_fraction * self.step_time:
+            self.skipped += 1
+            return False
+        return True
+
+    def record(self, cost: float):
+        self.previews += 1
+        self.preview_time += cost
+        self.last_cost = cost
+        self._last_tick += cost
+
+def latents_to_rgb_linear(latents: np.ndarray) -> np.ndarray:
+    """
+    Proyección lineal de latentes SDXL a RGB.
+
+    Args:
+        latents: Array (4, H, W)
+
+    Returns:
+        Imagen uint8 (H, W, 3)
+    """
+    rgb = np.einsum('chw,cr->hwr', latents.astype(np.float32), SDXL_LATENT_RGB_FACTORS) + SDXL_LATENT_RGB_BIAS
+    return (np.clip((rgb + 1.0) / 2.0, 0.0, 1.0) * 255).astype(np.uint8)
+
+def _build_taesd_decoder():
+    """Decoder TAESD (madebyollin/taesd); el layout coincide con los pesos *_decoder.pth."""
+    import torch
+    from torch import nn
+
+    def conv(n_in, n_out, **kwargs):
+        return nn.Conv2d(n_in, n_out, 3, padding=1, **kwargs)
+
+    class Clamp(nn.Module):
+        def forward(self, x):
+            return torch.tanh(x / 3) * 3
+
+    class Block(nn.Module):
+        def __init__(self, n_in, n_out):
+            super().__init__()
+            self.conv = nn.Sequential(conv(n_in, n_out), nn.ReLU(), conv(n_out, n_out), nn.ReLU(), conv(n_out, n_out))
+            self.skip = nn.Conv2d(n_in, n_out, 1, bias=False) if n_in != n_out else nn.Identity()
+            self.fuse = nn.ReLU()
+
+        def forward(self, x):
+            return self.fuse(self.conv(x) + self.skip(x))
+
+    return nn.Sequential(
+        Clamp(), conv(4, 64), nn.ReLU(),
+        Block(64, 64), Block(64, 64), Block(64, 64), nn.Upsample(scale_factor=2), conv(64, 64, bias=False),
+        Block(64, 64), Block(64, 64), Block(64, 64), nn.Upsample(scale_factor=2), conv(64, 64, bias=False),
+        Block(64, 64), Block(64, 64), Block(64, 64), nn.Upsample(scale_factor=2), conv(64, 64, bias=False),
+        Block(64, 64), conv(64, 3)
+    )
+
+class LatentPreviewer:
+    def __init__(self, decoder: str = "auto", vae_approx_dir: Optional[str] = None, max_size: int = 256,
+                 image_format: str = "WEBP", quality: int = 60, max_cost_fraction: float = 0.1,
+                 every_n_steps: int = 1):
+        """
+        Args:
+            decoder: 'taesd', 'linear' o 'auto' (TAESD si sus pesos están en vae_approx_dir)
+            vae_approx_dir: Carpeta con taesdxl_decoder.pth
+            max_size: Lado máximo del preview en píxeles
+            image_format: 'WEBP' o 'JPEG'
+            quality: Calidad de compresión del preview
+            max_cost_fraction: Fracción máxima del tiempo de paso dedicada a previews
+            every_n_steps: Intervalo mínimo de pasos entre previews
+        """
+        self.decoder = decoder
+        self.vae_approx_dir = vae_approx_dir
+        self.max_size = max_size
+        self.image_format = image_format.upper()
+        self.quality = quality
+        self.max_cost_fraction = max_cost_fraction
+        self.every_n_steps = every_n_steps
+
+        self.previews = 0
+        self.skipped = 0
+        self.decode_seconds = 0.0
+        self._taesd = None
+        self._taesd_checked = False
+
+    def throttle(self) -> PreviewThrottle:
+        """Nuevo control de presupuesto para una ejecución del pipeline."""
+        return PreviewThrottle(self.max_cost_fraction, self.every_n_steps)
+
+    def _taesd_path(self) -> Optional[str]:
+        if self.decoder == "linear" or not self.vae_approx_dir:
+            return None
+        for name in TAESD_DECODER_FILES:
+            path = os.path.join(self.vae_approx_dir, name)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def _load_taesd(self, device: Any, dtype: Any):
+        if self._taesd_checked:
+            return self._taesd
+        self._taesd_checked = True
+
+        path = self._taesd_path()
+        if path is None:
+            if self.decoder == "taesd":
+                print(f"[!] TAESD decoder not found in {self.vae_approx_dir}, using linear previews")
+            return None
+
+        try:
+            import torch
+            if path.endswith(".safetensors"):
+                from safetensors.torch import load_file
+                state_dict = load_file(path)
+            else:
+                state_dict = torch.load(path, map_location="cpu")
+            model = _build_taesd_decoder()
+            model.load_state_dict(state_dict)
+            self._taesd = model.to(device=device, dtype=dtype).eval().requires_grad_(False)
+            print(f"[✓] TAESD preview decoder loaded from {path}")
+        except Exception as e:
+            print(f"[!] Could not load TAESD decoder ({e}), using linear previews")
+        return self._taesd
+
+    def decode(self, latents: Any) -> List[np.ndarray]:
+        """
+        Decodifica latentes (torch, batch) a imágenes RGB uint8 pequeñas.
+
+        Args:
+            latents: Tensor (B, 4, H, W) del paso actual
+
+        Returns:
+            Lista de arrays (H, W, 3), uno por imagen del batch
+        """
+        import torch
+
+        with torch.no_grad():
+            taesd = self._load_taesd(latents.device, latents.dtype)
+            if taesd is not None:
+                images = taesd(latents).clamp(0, 1).mul(255).round().to(torch.uint8)
+                return list(images.permute(0, 2, 3, 1).cpu().numpy())
+            return [latents_to_rgb_linear(sample) for sample in latents.float().cpu().numpy()]
+
+    def encode(self, rgb: np.ndarray) -> bytes:
+        """Redimensiona y comprime un preview."""
+        image = Image.fromarray(rgb)
+        image.thumbnail((self.max_size, self.max_size), Image.BILINEAR)
+        buffered = io.BytesIO()
+        image.save(buffered, format=self.image_format, quality=self.quality)
+        return buffered.getvalue()
+
+    def preview(self, latents: Any, targets: List[Tuple[int, Any]], step: int, throttle: PreviewThrottle,
+                deliver: Callable[[Any, int, int, np.ndarray], None]):
+        """
+        Decodifica los latentes de las imágenes con destinatario y los entrega.
+
+        Args:
+            latents: Latentes del batch en el paso actual
+            targets: [(índice en el batch, destinatario)]
+            step: Paso actual
+            throttle: PreviewThrottle de esta ejecución
+            deliver: deliver(destinatario, índice, paso, rgb); la compresión y el envío
+                deben ocurrir fuera del thread de inferencia
+        """
+        if not throttle.should_preview(step):
+            self.skipped += 1
+            return
+
+        start = time.perf_counter()
+        indices = [index for index, _ in targets]
+        images = self.decode(latents[indices])
+        cost = time.perf_counter() - start
+        throttle.record(cost)
+        self.previews += 1
+        self.decode_seconds += cost
+
+        for (index, target), rgb in zip(targets, images):
+            deliver(target, index, step, rgb)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'decoder': 'taesd' if self._taesd is not None else ('linear' if self._taesd_checked else self.decoder),
+            'previews': self.previews,
+            'skipped': self.skipped,
+            'avg_decode_ms': round(self.decode_seconds / self.previews * 1000, 2) if self.previews else 0,
+            'max_cost_fraction': self.max_cost_fraction
+        }
+
+# Singleton instance
+_latent_previewer = None
+
+def get_latent_previewer() -> LatentPreviewer:
+    """Obtiene la instancia singleton del servicio de previews."""
+    global _latent_previewer
+    if _latent_previewer is None:
+        from utils.config import get_setting
+        _latent_previewer = LatentPreviewer(
+            decoder=get_setting("previews.decoder", "auto"),
+            vae_approx_dir=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models", "vae_approx"),
+            max_size=get_setting("previews.max_size", 256),
+            image_format=get_setting("previews.format", "WEBP"),
+            quality=get_setting("previews.quality", 60),
+            max_cost_fraction=get_setting("previews.max_cost_fraction", 0.1),
+            every_n_steps=get_setting("previews.every_n_steps", 1)
+        )
+    return _latent_previewer
@@ -0,0 +1,137 @@
+"""
+Scheduler con afinidad de modelo para el carril GPU.
+Reordena la cola para agrupar trabajos que usan el modelo residente en VRAM
+(sdxl, whisper, faceswap) y así evitar swaps CPU<->GPU, con un límite de
+espera que garantiza que ningún trabajo se quede sin ejecutar.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+class AffinityScheduler:
+    """
+    Cola compatible con queue.Queue (put/get/qsize) cuyos elementos pueden
+    declarar un atributo `model`. get() prefiere elementos del modelo residente.
+    """
+
+    def __init__(self, lookahead: int = 8, max_wait_seconds: float = 30.0, max_skips: int = 4):
+        """
+        Args:
+            lookahead: Cuántos elementos mirar más allá de la cabeza de la cola
+            max_wait_seconds: Edad a partir de la cual la cabeza se ejecuta sí o sí
+            max_skips: Veces que la cabeza puede ser adelantada antes de promoverla
+        """
+        self.lookahead = max(1, lookahead)
+        self.max_wait_seconds = max_wait_seconds
+        self.max_skips = max_skips
+
+        self.resident: Optional[str] = None
+        self._residency_check: Optional[Callable[[str], bool]] = None
+        self.swaps = 0
+        self.swaps_avoided = 0
+        self.promotions = 0
+
+        self.version = 0  # Se incrementa con cada cambio de la cola
+        self._entries = deque()  # [enqueued_at, skips, item]
+        self._cond = threading.Condition()
+
+    def put(self, item: Any):
+        with self._cond:
+            self._entries.append([time.monotonic(), 0, item])
+            self.version += 1
+            self._cond.notify_all()
+
+    def get(self) -> Any:
+        """Bloquea hasta que haya un elemento y retorna el mejor según afinidad."""
+        with self._cond:
+            while not self._entries:
+                self._cond.wait()
+            index = self._select()
+            item = self._entries[index][2]
+            del self._entries[index]
+            self._dispatch(item)
+            self.version += 1
+            self._cond.notify_all()
+            return item
+
+    def qsize(self) -> int:
+        with self._cond:
+            return len(self._entries)
+
+    def peek_models(self, limit: int = None) -> list:
+        """Modelos requeridos por los próximos elementos, en el orden de la cola."""
+        with self._cond:
+            entries = list(self._entries)[:limit] if limit else list(self._entries)
+        return [self._model_of(entry[2]) for entry in entries]
+
+    def wait_for_change(self, version: int, timeout: float = None) -> int:
+        """Bloquea hasta que la cola cambie respecto a `version` (o timeout). Retorna la versión actual."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def note_resident(self, model: Optional[str]):
+        """Informa al scheduler qué modelo quedó residente en VRAM."""
+        with self._cond:
+            self.resident = model
+
+    def set_residency_check(self, check: Optional[Callable[[str], bool]]):
+        """
+        Usa una función externa (ej: VRAMManager.is_resident) para saber qué
+        modelos están en VRAM, en lugar de asumir que solo el último lo está.
+        """
+        with self._cond:
+            self._residency_check = check
+
+    def _is_resident(self, model: str) -> bool:
+        if self._residency_check is not None:
+            return self._residency_check(model)
+        return model == self.resident
+
+    def _select(self) -> int:
+        """Retorna el índice del elemento a despachar."""
+        head = self._entries[0]
+        head_model = self._model_of(head[2])
+
+        # The head never needs a swap, or it has waited long enough
+        if head_model is None or self._is_resident(head_model):
+            return 0
+        if head[1] >= self.max_skips or time.monotonic() - head[0] >= self.max_wait_seconds:
+            self.promotions += 1
+            return 0
+
+        for index in range(1, min(len(self._entries), self.lookahead + 1)):
+            model = self._model_of(self._entries[index][2])
+            if model is not None and self._is_resident(model):
+                # Every entry in front of the chosen one is skipped once
+                for skipped in range(index):
+                    self._entries[skipped][1] += 1
+                self.swaps_avoided += 1
+                return index
+
+        return 0
+
+    def _dispatch(self, item: Any):
+        model = self._model_of(item)
+        if model is not None and not self._is_resident(model):
+            self.swaps += 1
+        if model is not None:
+            self.resident = model
+
+    @staticmethod
+    def _model_of(item: Any) -> Optional[str]:
+        return getattr(item, 'model', None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                'resident_model': self.resident,
+                'pending': len(self._entries),
+                'swaps': self.swaps,
+                'swaps_avoided': self.swaps_avoided,
+                'starvation_promotions': self.promotions,
+                'lookahead': self.lookahead,
+                'max_wait_seconds': self.max_wait_seconds
+            }
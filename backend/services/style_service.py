@@ -71,6 +71,10 @@ class StyleService:
         """Returns a list of available style names."""
         return list(self.styles.keys())
 
+    def get_style_negatives(self):
+        """Returns the negative prompt each style produces when the user adds none."""
+        return [self.apply_style(name, "")[1] for name in self.styles]
+
     def apply_style(self, style_name, user_prompt, negative_prompt=""):
         """
         Applies a style to a user prompt.
@@ -104,16 +104,16 @@ class RealESRGANService:
             new_h, new_w = int(h * outscale), int(w * outscale)
             return cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_CUBIC)
     
-    def upscale_from_base64(self, base64_image: str, outscale: float = 4.0) -> str:
+    def upscale_base64_to_image(self, base64_image: str, outscale: float = 4.0) -> Image.Image:
         """
-        Upscale una imagen desde base64 y retorna base64.
+        Upscale una imagen desde base64 sin codificar el resultado.
         
         Args:
             base64_image: Imagen en formato base64 (con o sin prefijo data:image)
             outscale: Factor de escalado
         
         Returns:
-            Imagen upscaled en formato base64
+            Imagen upscaled (PIL, RGB)
         """
         # Remover prefijo si existe
         if 'base64,' in base64_image:
@@ -121,7 +121,7 @@ class RealESRGANService:
         
         # Decodificar base64 a imagen
         image_bytes = base64.b64decode(base64_image)
-        image = Image.open(BytesIO(image_bytes))
+        image = Image.open(BytesIO(image_bytes)).convert('RGB')
         
         # Convertir a numpy array (RGB -> BGR para OpenCV)
         image_np = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
@@ -130,14 +130,27 @@ class RealESRGANService:
         upscaled_np = self.upscale_image(image_np, outscale)
         
         # Convertir de vuelta a PIL Image (BGR -> RGB)
-        upscaled_pil = Image.fromarray(cv2.cvtColor(upscaled_np, cv2.COLOR_BGR2RGB))
+        return Image.fromarray(cv2.cvtColor(upscaled_np, cv2.COLOR_BGR2RGB))
+    
+    def upscale_from_base64(self, base64_image: str, outscale: float = 4.0,
+                            image_format: str = 'png', quality: int = 90) -> str:
+        """
+        Upscale una imagen desde base64 y retorna base64.
+        
+        Args:
+            base64_image: Imagen en formato base64 (con o sin prefijo data:image)
+            outscale: Factor de escalado
+            image_format: Formato de salida ('png', 'webp' o 'jpeg')
+            quality: Calidad para webp/jpeg
         
-        # Convertir a base64
-        buffered = BytesIO()
-        upscaled_pil.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode('utf-8')
+        Returns:
+            Imagen upscaled en formato base64 (data URI)
+        """
+        from .image_output import RenderedImage, encode_image, normalize_format
         
-        return f"data:image/png;base64,{img_str}"
+        image_format = normalize_format(image_format) or 'png'
+        upscaled_pil = self.upscale_base64_to_image(base64_image, outscale)
+        return RenderedImage(encode_image(upscaled_pil, image_format, quality), image_format).data_uri()
     
     def upscale_file(self, input_path: str, output_path: str, outscale: float = 4.0):
         """
@@ -0,0 +1,497 @@
+"""
+Gestor de VRAM con presupuesto para varios modelos residentes.
+Mantiene en GPU todos los modelos que quepan en el presupuesto y mueve a CPU
+los menos usados recientemente (LRU) solo cuando hace falta espacio.
+
+Los modelos en uso se fijan con un lease (acquire) y nunca se desalojan
+mientras una inferencia los está usando. prefetch() adelanta en segundo plano
+la transferencia del próximo modelo cuando cabe sin desalojar a nadie.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+GB = 1024 ** 3
+
+# Huella aproximada cuando no se puede medir (ver ARCHITECTURE.md)
+DEFAULT_ESTIMATES_GB = {
+    'sdxl': 6.5,
+    'whisper': 1.0,
+    'faceswap': 2.0,
+    'esrgan': 1.5,
+    'controlnet_canny': 2.5,
+    'controlnet_depth': 2.5,
+    'controlnet_pose': 2.5,
+}
+
+class ModelEntry:
+    def __init__(self, name: str, model: Any, mover: Optional[Callable[[str], Any]] = None,
+                 size_bytes: int = 0):
+        self.name = name
+        self.model = model
+        self.mover = mover
+        self.size_bytes = size_bytes
+        self.on_gpu = False
+        self.loading = False
+        self.prefetched = False
+        self.pins = 0
+        self.last_used = time.monotonic()
+        self.loads = 0
+        self.evictions = 0
+
+    def move(self, device: str):
+        """Mueve el modelo al dispositivo (usa el mover propio si se registró uno)."""
+        if self.mover is not None:
+            self.mover(device)
+        else:
+            self.model.to(device)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'on_gpu': self.on_gpu,
+            'loading': self.loading,
+            'pins': self.pins,
+            'size_gb': round(self.size_bytes / GB, 2),
+            'idle_seconds': round(time.monotonic() - self.last_used, 1),
+            'loads': self.loads,
+            'evictions': self.evictions
+        }
+
+class VRAMManager:
+    def __init__(self, budget_bytes: Optional[int] = None, max_models: Optional[int] = None,
+                 reserved_bytes: int = 0, idle_ttl_seconds: Optional[float] = 600,
+                 device: str = 'cuda', estimates_gb: Dict[str, float] = None,
+                 free_cache: Optional[Callable[[], None]] = None, pin_wait_timeout: float = 120):
+        """
+        Args:
+            budget_bytes: Bytes de VRAM utilizables (default: memoria total de la GPU)
+            max_models: Máximo de modelos residentes a la vez (None = sin límite)
+            reserved_bytes: Margen que se resta al presupuesto para activaciones
+            idle_ttl_seconds: Segundos sin uso tras los que un modelo se mueve a CPU
+            device: Dispositivo destino de los modelos
+            estimates_gb: Huella estimada por modelo cuando no se puede medir
+            free_cache: Función que libera la caché del allocator (default: torch.cuda.empty_cache)
+            pin_wait_timeout: Segundos máximos esperando a que se libere un modelo fijado
+        """
+        if budget_bytes is None:
+            budget_bytes = self._device_total_bytes()
+        self.budget_bytes = max(0, budget_bytes - reserved_bytes)
+        self.reserved_bytes = reserved_bytes
+        self.max_models = max_models
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.device = device
+        self.estimates_gb = {**DEFAULT_ESTIMATES_GB, **(estimates_gb or {})}
+        self._free_cache = free_cache or self._empty_cuda_cache
+        self.pin_wait_timeout = pin_wait_timeout
+
+        self.entries: Dict[str, ModelEntry] = {}
+        self.loaders: Dict[str, Callable[[], Any]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.pin_waits = 0
+        self.prefetches = 0
+        self.prefetch_hits = 0
+        self.prefetch_cancels = 0
+        self._lock = threading.Condition(threading.RLock())
+        self._loader_locks: Dict[str, threading.Lock] = {}
+        self._sweeper = None
+
+    def register(self, name: str, model: Any, mover: Optional[Callable[[str], Any]] = None,
+                 size_bytes: int = 0) -> ModelEntry:
+        """
+        Registra un modelo (que todavía está en CPU).
+
+        Args:
+            name: Nombre del modelo (sdxl, whisper, faceswap...)
+            model: Objeto con .to(device) o cualquier objeto si se pasa mover
+            mover: Función mover(device) para modelos sin .to()
+            size_bytes: Huella conocida (si no, se mide al moverlo a GPU)
+        """
+        with self._lock:
+            entry = ModelEntry(name, model, mover=mover, size_bytes=size_bytes)
+            self.entries[name] = entry
+            return entry
+
+    def register_loader(self, name: str, loader: Callable[[], Any]):
+        """
+        Registra la función que construye un modelo la primera vez que se pide.
+        El loader debe llamar a register() con el modelo construido.
+        """
+        self.loaders[name] = loader
+        self._loader_locks.setdefault(name, threading.Lock())
+
+    @contextmanager
+    def acquire(self, name: str) -> Iterator[Any]:
+        """
+        Lease de un modelo: lo deja en GPU y lo fija mientras dure el bloque.
+
+        Si el modelo ya está residente no hay ninguna transferencia. Ningún
+        desalojo (por presupuesto, TTL u offload) toca un modelo fijado.
+
+        Usage:
+            with vram_manager.acquire('sdxl') as pipe:
+                image = pipe(prompt=...).images[0]
+        """
+        with self.acquire_many([name]) as (model,):
+            yield model
+
+    @contextmanager
+    def acquire_many(self, names: List[str]) -> Iterator[List[Any]]:
+        """
+        Lease de varios modelos como una sola reserva.
+
+        Hace sitio para la suma de sus huellas de una vez y los fija juntos,
+        así que ninguno espera por el pin de otro modelo del mismo lease (lo
+        que pasaba al anidar acquire() con el presupuesto justo).
+
+        Usage:
+            with vram_manager.acquire_many(['sdxl', 'controlnet_canny']) as (pipe, controlnet):
+                image = ...
+        """
+        for name in names:
+            self._load_if_needed(name)
+        with self._lock:
+            models = self._ensure_resident(names)
+            entries = [self.entries[name] for name in names]
+            for entry in entries:
+                entry.pins += 1
+        try:
+            yield models
+        finally:
+            with self._lock:
+                now = time.monotonic()
+                for entry in entries:
+                    entry.pins -= 1
+                    entry.last_used = now
+                self._lock.notify_all()
+
+    def _load_if_needed(self, name: str):
+        if name in self.entries or name not in self.loaders:
+            return
+        # Build outside the main lock so leases on other models are not blocked
+        with self._loader_locks[name]:
+            if name not in self.entries:
+                self.loaders[name]()
+
+    def is_registered(self, name: str) -> bool:
+        return name in self.entries
+
+    def is_resident(self, name: str) -> bool:
+        entry = self.entries.get(name)
+        return entry is not None and entry.on_gpu
+
+    def resident_models(self) -> List[str]:
+        with self._lock:
+            return [name for name, entry in self.entries.items() if entry.on_gpu]
+
+    def used_bytes(self) -> int:
+        with self._lock:
+            return sum(entry.size_bytes for entry in self.entries.values() if entry.on_gpu)
+
+    def activation_bytes(self, for_model: Optional[str] = None) -> int:
+        """
+        VRAM que queda para activaciones: memoria total menos la huella de los
+        modelos residentes (y la de for_model si todavía no está en GPU).
+        """
+        with self._lock:
+            used = self.used_bytes()
+            entry = self.entries.get(for_model) if for_model else None
+            if for_model and not (entry is not None and entry.on_gpu):
+                used += entry.size_bytes if entry is not None and entry.size_bytes else self._estimate(for_model)
+            return max(0, self.budget_bytes + self.reserved_bytes - used)
+
+    def ensure_resident(self, name: str) -> Any:
+        """
+        Garantiza que el modelo esté en GPU, desalojando modelos LRU si no cabe.
+
+        Returns:
+            El modelo registrado
+        """
+        self._load_if_needed(name)
+        with self._lock:
+            return self._ensure_resident([name])[0]
+
+    def _ensure_resident(self, names: List[str]) -> List[Any]:
+        for name in names:
+            if name not in self.entries:
+                raise KeyError(f"Model not registered in VRAM manager: {name}")
+
+        entries = [self.entries[name] for name in names]
+        # A background prefetch is already moving one of them: wait instead of copying twice
+        self._lock.wait_for(lambda: not any(entry.loading for entry in entries))
+
+        now = time.monotonic()
+        missing = []
+        for entry in entries:
+            entry.last_used = now
+            if not entry.on_gpu:
+                missing.append(entry)
+                continue
+            self.hits += 1
+            if entry.prefetched:
+                self.prefetch_hits += 1
+                entry.prefetched = False
+
+        if missing:
+            self.misses += len(missing)
+            self._make_room(sum(entry.size_bytes or self._estimate(entry.name) for entry in missing), keep=names)
+            for entry in missing:
+                self._move_to_gpu(entry)
+            # The measured footprint may be larger than the estimate
+            self._make_room(0, keep=names, wait=False)
+        return [entry.model for entry in entries]
+
+    def prefetch(self, name: str, cancel: Optional[threading.Event] = None) -> bool:
+        """
+        Transfiere un modelo a GPU en segundo plano si cabe sin desalojar a nadie.
+
+        La transferencia se hace fuera del lock, así que la inferencia en curso
+        no se bloquea. Los pipelines de diffusers se mueven componente a
+        componente y se cancelan entre componentes si `cancel` se activa.
+
+        Returns:
+            True si el modelo quedó residente
+        """
+        self._load_if_needed(name)
+        with self._lock:
+            entry = self.entries.get(name)
+            if entry is None or entry.on_gpu or entry.loading:
+                return False
+            if not self._fits(entry.size_bytes or self._estimate(name), 1):
+                return False
+            entry.loading = True
+
+        moved = False
+        try:
+            print(f"[*] Prefetching {name} to {self.device}...")
+            moved = self._transfer(entry, cancel)
+        except Exception as e:
+            print(f"[!] Prefetch of {name} failed: {e}")
+        finally:
+            with self._lock:
+                entry.loading = False
+                if moved:
+                    measured = self._measure(entry, 0)
+                    entry.size_bytes = measured or entry.size_bytes or self._estimate(name)
+                    entry.on_gpu = True
+                    entry.prefetched = True
+                    entry.loads += 1
+                    self.prefetches += 1
+                else:
+                    self.prefetch_cancels += 1
+                self._lock.notify_all()
+        return moved
+
+    def _transfer(self, entry: ModelEntry, cancel: Optional[threading.Event]) -> bool:
+        if cancel is not None and cancel.is_set():
+            return False
+
+        components = getattr(entry.model, 'components', None)
+        if entry.mover is not None or not isinstance(components, dict):
+            entry.move(self.device)
+            return True
+
+        moved = []
+        for component in components.values():
+            if not hasattr(component, 'to'):
+                continue
+            if cancel is not None and cancel.is_set():
+                for done in moved:
+                    done.to("cpu")
+                return False
+            component.to(self.device)
+            moved.append(component)
+        return True
+
+    def evict(self, name: str):
+        """Mueve un modelo a CPU y libera la caché del allocator (espera si está fijado)."""
+        with self._lock:
+            entry = self.entries.get(name)
+            if entry is None:
+                return
+            if entry.pins and not self._lock.wait_for(lambda: entry.pins == 0, self.pin_wait_timeout):
+                print(f"[!] {name} is still in use, eviction skipped")
+                return
+            if entry.on_gpu:
+                self._evict(entry)
+                self._free_cache()
+
+    def offload_all(self, except_model: str = None):
+        """Mueve todos los modelos a CPU salvo except_model y los que están fijados."""
+        with self._lock:
+            for entry in list(self.entries.values()):
+                if entry.on_gpu and entry.name != except_model and not entry.pins:
+                    self._evict(entry)
+            self._free_cache()
+
+    def sweep_idle(self) -> List[str]:
+        """
+        Mueve a CPU los modelos sin uso durante más de idle_ttl_seconds.
+
+        Returns:
+            Nombres de los modelos desalojados
+        """
+        if not self.idle_ttl_seconds:
+            return []
+
+        now = time.monotonic()
+        evicted = []
+        with self._lock:
+            for entry in list(self.entries.values()):
+                if entry.on_gpu and not entry.pins and now - entry.last_used > self.idle_ttl_seconds:
+                    self._evict(entry)
+                    evicted.append(entry.name)
+            if evicted:
+                self._free_cache()
+                print(f"[*] Idle TTL: offloaded {', '.join(evicted)}")
+        return evicted
+
+    def start_idle_sweeper(self, interval_seconds: float = 60):
+        """Arranca un thread que ejecuta sweep_idle() periódicamente."""
+        if self._sweeper is not None or not self.idle_ttl_seconds:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval_seconds)
+                try:
+                    self.sweep_idle()
+                except Exception as e:
+                    print(f"[!] VRAM idle sweep failed: {e}")
+
+        self._sweeper = threading.Thread(target=run, name="vram-idle-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def _fits(self, extra_bytes: int, extra_models: int) -> bool:
+        resident = [entry for entry in self.entries.values() if entry.on_gpu or entry.loading]
+        if self.max_models is not None and len(resident) + extra_models > self.max_models:
+            return False
+        return sum(entry.size_bytes for entry in resident) + extra_bytes <= self.budget_bytes
+
+    def _make_room(self, needed_bytes: int, keep: List[str], wait: bool = True):
+        extra_models = sum(1 for name in keep if not self.entries[name].on_gpu)
+        deadline = time.monotonic() + self.pin_wait_timeout
+        while not self._fits(needed_bytes, extra_models):
+            resident = [entry for entry in self.entries.values()
+                        if (entry.on_gpu or entry.loading) and entry.name not in keep]
+            candidates = [entry for entry in resident if entry.on_gpu and not entry.pins]
+            if candidates:
+                self._evict(min(candidates, key=lambda entry: entry.last_used))
+                continue
+
+            remaining = deadline - time.monotonic()
+            if not resident or not wait or remaining <= 0:
+                print(f"[!] {', '.join(keep)} does not fit the VRAM budget, loading anyway")
+                break
+            # Every other resident model is pinned or being prefetched: wait for a release
+            self.pin_waits += 1
+            self._lock.wait(remaining)
+        self._free_cache()
+
+    def _move_to_gpu(self, entry: ModelEntry):
+        print(f"[*] Moving {entry.name} to {self.device}...")
+        before = self._allocated_bytes()
+        entry.move(self.device)
+        measured = self._measure(entry, self._allocated_bytes() - before)
+        if measured:
+            entry.size_bytes = measured
+        elif not entry.size_bytes:
+            entry.size_bytes = self._estimate(entry.name)
+        entry.on_gpu = True
+        entry.loads += 1
+
+    def _evict(self, entry: ModelEntry):
+        print(f"[*] Offloading {entry.name} to CPU...")
+        try:
+            entry.move("cpu")
+        except Exception as e:
+            print(f"[!] Could not offload {entry.name}: {e}")
+        entry.on_gpu = False
+        entry.evictions += 1
+
+    def _estimate(self, name: str) -> int:
+        return int(self.estimates_gb.get(name, 2.0) * GB)
+
+    def _measure(self, entry: ModelEntry, allocated_delta: int) -> int:
+        """Huella del modelo: vram_bytes declarado, o el mayor entre delta de memoria asignada y tamaño de tensores."""
+        declared = getattr(entry.model, 'vram_bytes', None)
+        if declared is not None:
+            return int(declared() if callable(declared) else declared)
+        # Components loaded straight onto the GPU don't show up in the delta
+        return max(allocated_delta, self._tensor_bytes(entry.model))
+
+    @staticmethod
+    def _tensor_bytes(model: Any) -> int:
+        modules = []
+        if hasattr(model, 'components'):  # diffusers pipeline
+            modules = [m for m in model.components.values() if hasattr(m, 'parameters')]
+        elif hasattr(model, 'parameters'):
+            modules = [model]
+
+        total = 0
+        for module in modules:
+            for tensor in list(module.parameters()) + list(module.buffers()):
+                total += tensor.numel() * tensor.element_size()
+        return total
+
+    @staticmethod
+    def _allocated_bytes() -> int:
+        try:
+            import torch
+            if torch.cuda.is_available():
+                return torch.cuda.memory_allocated()
+        except ImportError:
+            pass
+        return 0
+
+    @staticmethod
+    def _device_total_bytes() -> int:
+        try:
+            import torch
+            if torch.cuda.is_available():
+                return torch.cuda.get_device_properties(0).total_memory
+        except ImportError:
+            pass
+        return 0
+
+    @staticmethod
+    def _empty_cuda_cache():
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'budget_gb': round(self.budget_bytes / GB, 2),
+                'used_gb': round(self.used_bytes() / GB, 2),
+                'max_models': self.max_models,
+                'hits': self.hits,
+                'misses': self.misses,
+                'pin_waits': self.pin_waits,
+                'prefetches': self.prefetches,
+                'prefetch_hits': self.prefetch_hits,
+                'prefetch_cancels': self.prefetch_cancels,
+                'models': {name: entry.to_dict() for name, entry in self.entries.items()}
+            }
+
+# Singleton instance
+_vram_manager = None
+
+def get_vram_manager() -> VRAMManager:
+    """Obtiene la instancia singleton del gestor de VRAM (configurado desde config.json)."""
+    global _vram_manager
+    if _vram_manager is None:
+        from utils.config import get_setting
+        _vram_manager = VRAMManager(
+            max_models=get_setting("vram.max_models_in_vram"),
+            reserved_bytes=int(get_setting("vram.reserved_buffer_gb", 2.0) * GB),
+            idle_ttl_seconds=get_setting("vram.idle_ttl_seconds", 600),
+            estimates_gb=get_setting("vram.model_estimates_gb", {})
+        )
+    return _vram_manager
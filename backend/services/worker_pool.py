@@ -0,0 +1,216 @@
+"""
+Pool de workers con carriles (lanes) separados para GPU y CPU.
+Cada etapa de un job se encola en su carril, de modo que TTS o ffmpeg
+nunca esperan detrás de una inferencia SDXL.
+"""
+
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+from .scheduler import AffinityScheduler
+
+GPU_LANE = 'gpu'
+CPU_LANE = 'cpu'
+
+class Stage:
+    """Etapa de un job: una función que recibe el contexto del job y corre en un carril."""
+
+    def __init__(self, name: str, lane: str, fn: Callable[[Dict], Any], model: Optional[str] = None):
+        self.name = name
+        self.lane = lane
+        self.fn = fn
+        self.model = model  # Modelo GPU que necesita la etapa (sdxl, whisper, faceswap...)
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, lane={self.lane!r}, model={self.model!r})"
+
+class WorkItem:
+    """Trabajo encolado en un carril."""
+
+    def __init__(self, future: Future, fn: Callable, args: tuple, kwargs: dict, model: Optional[str] = None):
+        self.future = future
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.model = model
+
+class Lane:
+    def __init__(self, name: str, concurrency: int, work_queue=None):
+        self.name = name
+        self.concurrency = max(1, int(concurrency))
+        self.queue = work_queue if work_queue is not None else queue.Queue()
+        self.threads: List[threading.Thread] = []
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Arranca los threads del carril."""
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self._run, name=f"{self.name}-worker-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, fn: Callable, *args, model: Optional[str] = None, **kwargs) -> Future:
+        """Encola una función en el carril y retorna un Future con su resultado."""
+        future = Future()
+        self.queue.put(WorkItem(future, fn, args, kwargs, model=model))
+        return future
+
+    def stop(self):
+        """Envía una señal de parada a cada thread del carril."""
+        for _ in self.threads:
+            self.queue.put(None)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+
+            future = item.future
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            with self._lock:
+                self.active += 1
+            try:
+                result = item.fn(*item.args, **item.kwargs)
+            except BaseException as e:
+                with self._lock:
+                    self.failed += 1
+                future.set_exception(e)
+            else:
+                with self._lock:
+                    self.completed += 1
+                future.set_result(result)
+            finally:
+                with self._lock:
+                    self.active -= 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = {
+            'concurrency': self.concurrency,
+            'active': self.active,
+            'pending': self.queue.qsize(),
+            'completed': self.completed,
+            'failed': self.failed
+        }
+        if hasattr(self.queue, 'get_stats'):
+            stats['scheduler'] = self.queue.get_stats()
+        return stats
+
+class WorkerPool:
+    def __init__(self, gpu_concurrency: int = 1, cpu_concurrency: Optional[int] = None,
+                 scheduler: Optional[AffinityScheduler] = None):
+        """
+        Args:
+            gpu_concurrency: Número de etapas GPU simultáneas (default: 1)
+            cpu_concurrency: Número de etapas CPU simultáneas (default: núcleos disponibles)
+            scheduler: Cola con afinidad de modelo para el carril GPU
+        """
+        if not cpu_concurrency:
+            cpu_concurrency = os.cpu_count() or 1
+
+        self.scheduler = scheduler or AffinityScheduler()
+        self.lanes: Dict[str, Lane] = {
+            GPU_LANE: Lane(GPU_LANE, gpu_concurrency, work_queue=self.scheduler),
+            CPU_LANE: Lane(CPU_LANE, cpu_concurrency),
+        }
+        self._started = False
+
+    def start(self):
+        """Arranca todos los carriles (idempotente)."""
+        if self._started:
+            return
+        for lane in self.lanes.values():
+            lane.start()
+        self._started = True
+
+    def submit(self, lane: str, fn: Callable, *args, model: Optional[str] = None, **kwargs) -> Future:
+        """
+        Encola una función en un carril.
+
+        Args:
+            lane: Carril destino (GPU_LANE o CPU_LANE)
+            fn: Función a ejecutar
+            model: Modelo GPU que necesita (lo usa el scheduler para agrupar trabajos)
+
+        Returns:
+            Future con el resultado de la función
+        """
+        if lane not in self.lanes:
+            raise ValueError(f"Unknown lane: {lane}")
+        return self.lanes[lane].submit(fn, *args, model=model, **kwargs)
+
+    def run_stages(self, stages: List[Stage], context: Dict) -> Future:
+        """
+        Ejecuta una lista de etapas en orden, cada una en su carril.
+
+        Ningún thread queda bloqueado esperando: al terminar una etapa
+        se encola la siguiente en el carril que le corresponde.
+
+        Args:
+            stages: Etapas a ejecutar en orden
+            context: Diccionario compartido entre etapas
+
+        Returns:
+            Future que se resuelve con el contexto final o con la excepción
+            de la primera etapa que falle
+        """
+        done = Future()
+        done.set_running_or_notify_cancel()
+
+        def run_next(index: int):
+            if index >= len(stages):
+                done.set_result(context)
+                return
+
+            stage = stages[index]
+            context['stage'] = stage.name
+            future = self.submit(stage.lane, stage.fn, context, model=stage.model)
+
+            def on_stage_done(f: Future):
+                error = f.exception()
+                if error is not None:
+                    done.set_exception(error)
+                else:
+                    run_next(index + 1)
+
+            future.add_done_callback(on_stage_done)
+
+        run_next(0)
+        return done
+
+    def shutdown(self):
+        """Detiene todos los carriles."""
+        for lane in self.lanes.values():
+            lane.stop()
+        self._started = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtiene estadísticas por carril."""
+        return {name: lane.get_stats() for name, lane in self.lanes.items()}
+
+# Singleton instance
+_worker_pool = None
+
+def get_worker_pool() -> WorkerPool:
+    """Obtiene la instancia singleton del pool (configurada desde config.json / env)."""
+    global _worker_pool
+    if _worker_pool is None:
+        from utils.config import get_setting
+        gpu_workers = int(os.environ.get("GPU_WORKERS", get_setting("workers.gpu_concurrency", 1)))
+        cpu_workers = int(os.environ.get("CPU_WORKERS", get_setting("workers.cpu_concurrency", 0)))
+        scheduler = AffinityScheduler(
+            lookahead=get_setting("workers.scheduler_lookahead", 8),
+            max_wait_seconds=get_setting("workers.scheduler_max_wait_seconds", 30.0)
+        )
+        _worker_pool = WorkerPool(gpu_concurrency=gpu_workers, cpu_concurrency=cpu_workers or None,
+                                  scheduler=scheduler)
+        _worker_pool.start()
+    return _worker_pool
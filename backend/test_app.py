@@ -1,6 +1,6 @@
 import pytest
 import json
-from app import app, job_queue, jobs_status
+from app import app, job_queue, job_store
 
 @pytest.fixture
 def client():
@@ -39,8 +39,9 @@ def test_render_video_queued(client):
     
     # Verify job is in status tracker
     job_id = json_data['job_id']
-    assert job_id in jobs_status
-    assert jobs_status[job_id]['type'] == 'video'
+    job = job_store.get(job_id)
+    assert job is not None
+    assert job['type'] == 'video'
 
 def test_get_invalid_job(client):
     """Test behavior when requesting a non-existent job."""
@@ -0,0 +1,80 @@
+import pytest
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from backend.services.batcher import MicroBatcher
+
+class StubPipeline:
+    """CPU stand-in for the SDXL pipeline that records batch calls"""
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, key, items):
+        with self.lock:
+            self.calls.append((key, len(items)))
+        return [f"{item['prompt']}@{item['seed']}" for item in items]
+
+def test_concurrent_requests_are_batched_and_fanned_out():
+    """Requests with the same key share one call and each gets its own result"""
+    pipe = StubPipeline()
+    batcher = MicroBatcher(pipe, window_ms=100, max_batch_size=8)
+    key = (1024, 1024, 4, 0, True)
+
+    futures = [batcher.submit(key, {"prompt": f"p{i}", "seed": i}) for i in range(4)]
+    results = [f.result(timeout=2) for f in futures]
+
+    assert results == ["p0@0", "p1@1", "p2@2", "p3@3"]
+    assert pipe.calls == [(key, 4)]
+
+def test_groups_by_key():
+    """Different resolutions never share a batch"""
+    pipe = StubPipeline()
+    batcher = MicroBatcher(pipe, window_ms=50, max_batch_size=8)
+    square, wide = (1024, 1024, 4, 0, True), (1344, 768, 4, 0, True)
+
+    futures = [batcher.submit(square, {"prompt": "a", "seed": 1}),
+               batcher.submit(wide, {"prompt": "b", "seed": 2}),
+               batcher.submit(square, {"prompt": "c", "seed": 3})]
+    assert [f.result(timeout=2) for f in futures] == ["a@1", "b@2", "c@3"]
+    assert sorted(pipe.calls) == sorted([(square, 2), (wide, 1)])
+
+def test_batch_size_capped_by_memory_budget():
+    """max_batch_fn splits a group into several calls"""
+    pipe = StubPipeline()
+    batcher = MicroBatcher(pipe, window_ms=100, max_batch_size=8, max_batch_fn=lambda key: 2)
+    key = (1536, 640, 30, 7.0, False)
+
+    futures = [batcher.submit(key, {"prompt": str(i), "seed": i}) for i in range(5)]
+    [f.result(timeout=2) for f in futures]
+    assert [size for _, size in pipe.calls] == [2, 2, 1]
+
+def test_errors_reach_every_request():
+    """A failing batch fails all of its requests"""
+    def broken(key, items):
+        raise RuntimeError("CUDA out of memory")
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    batcher = MicroBatcher(broken, window_ms=20, dispatch=executor.submit)
+    futures = [batcher.submit("k", {}) for _ in range(2)]
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(timeout=2)
+
+def test_streamed_results_resolve_before_batch_finishes():
+    """A generator run_batch hands out each result as soon as it is yielded"""
+    release = threading.Event()
+
+    def streaming(key, items):
+        for index, item in enumerate(items):
+            if index == 1:
+                release.wait(2)
+            yield item["seed"]
+
+    batcher = MicroBatcher(streaming, window_ms=20, max_batch_size=4)
+    first, second = batcher.submit_many("k", [{"seed": 7}, {"seed": 8}])
+
+    assert first.result(timeout=2) == 7
+    assert not second.done()
+    release.set()
+    assert second.result(timeout=2) == 8
+    assert batcher.get_stats()['batches'] == 1
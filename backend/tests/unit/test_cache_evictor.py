@@ -0,0 +1,91 @@
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from backend.services.cache_evictor import CacheEvictor
+from backend.services.cache_service import ImageCacheService
+
+@pytest.fixture
+def cache(tmp_path):
+    return ImageCacheService(cache_dir=str(tmp_path / "cache"))
+
+def fill(cache, keys, size=100):
+    for i, key in enumerate(keys):
+        cache.save_to_cache(key, b"x" * size)
+        cache.index.update(key, last_accessed=1000.0 + i)
+
+def test_lru_evicts_down_to_low_watermark(cache):
+    fill(cache, ["a", "b", "c", "d", "e"])
+    cache.index.touch("a", now=5000.0)  # pending hit must protect "a"
+    evictor = CacheEvictor(cache, max_bytes=500, high_watermark=0.9, low_watermark=0.6)
+
+    assert evictor.run_once()["evicted"] == 2
+    assert sorted(cache.metadata) == ["a", "d", "e"]
+    assert cache.index.total_bytes == 300
+    assert cache.get_cached_image("b") is None
+    assert evictor.get_stats()["evictions"] == 2
+
+    # Below the high watermark nothing else is evicted
+    assert evictor.run_once()["evicted"] == 0
+
+def test_lfu_keeps_most_accessed(cache):
+    fill(cache, ["a", "b", "c"])
+    for _ in range(3):
+        cache.index.touch("a")
+    cache.index.touch("b")
+    evictor = CacheEvictor(cache, max_bytes=300, policy="lfu", high_watermark=0.9, low_watermark=0.5)
+
+    assert evictor.run_once()["evicted"] == 2
+    assert list(cache.metadata) == ["a"]
+
+def test_cold_png_is_recompressed_losslessly(cache):
+    pixels = np.zeros((64, 64, 3), dtype=np.uint8)
+    pixels[16:48, 16:48] = (200, 40, 90)
+    buffered = BytesIO()
+    Image.fromarray(pixels).save(buffered, format="PNG", compress_level=0)
+    cache.save_to_cache("cold", buffered.getvalue())
+    cache.index.update("cold", last_accessed=0.0)
+    evictor = CacheEvictor(cache, max_bytes=10 ** 9, recompress_after_seconds=3600)
+
+    assert evictor.run_once(now=10 ** 6)["reclaimed_bytes"] > 0
+    data, image_format = cache.get_cached_entry("cold")
+    assert image_format == "webp"
+    assert cache.index.total_bytes == len(data)
+    assert np.array_equal(np.asarray(Image.open(BytesIO(data)).convert("RGB")), pixels)
+
+def test_invalid_watermarks_rejected(cache):
+    with pytest.raises(ValueError):
+        CacheEvictor(cache, max_bytes=100, high_watermark=0.5, low_watermark=0.8)
+
+def test_clear_old_cache_tolerates_concurrent_eviction(cache):
+    fill(cache, ["a", "b"])
+    cache.index.update("a", created_at=0.0)
+    cache.index.update("b", created_at=0.0)
+    original = cache.index.entries_created_before
+
+    def evict_in_between(timestamp):
+        entries = original(timestamp)
+        cache.remove_entries([("a", "png")])  # evictor wins the race for "a"
+        return entries
+
+    cache.index.entries_created_before = evict_in_between
+    cache.clear_old_cache(max_age_days=7)
+    assert len(cache.metadata) == 0
+    assert cache.index.total_bytes == 0
+
+def test_evicted_bytes_count_only_removed_entries(cache):
+    fill(cache, ["a", "b", "c", "d", "e"])
+    evictor = CacheEvictor(cache, max_bytes=500, high_watermark=0.9, low_watermark=0.6)
+    original = cache.index.eviction_candidates
+
+    def delete_in_between(policy, limit):
+        candidates = original(policy, limit)
+        cache.index.delete(["a"])  # gone before the evictor removes it
+        return candidates
+
+    cache.index.eviction_candidates = delete_in_between
+    assert evictor.run_once()["evicted"] == 1
+    assert evictor.evicted_bytes == 100
+    assert sorted(cache.metadata) == ["c", "d", "e"]
@@ -0,0 +1,73 @@
+import json
+import threading
+from backend.services.cache_index import CacheIndex
+from backend.services.cache_service import ImageCacheService
+
+def test_touch_is_batched_until_flush(tmp_path):
+    """Accesses stay in memory (but are visible) until a single batched flush"""
+    index = CacheIndex(str(tmp_path / "index.db"))
+    index.put("k", 10, {"prompt": "a cat"}, now=100.0)
+    index.touch("k", now=200.0)
+    index.touch("k", now=300.0)
+
+    raw = index._conn.execute("SELECT access_count, last_accessed FROM entries WHERE key = 'k'").fetchone()
+    assert raw == (1, 100.0)
+    assert index.get("k")["access_count"] == 3
+    assert index.get("k")["last_accessed"] == 300.0
+
+    assert index.flush() == 1
+    assert index.flushes == 1
+    raw = index._conn.execute("SELECT access_count, last_accessed FROM entries WHERE key = 'k'").fetchone()
+    assert raw == (3, 300.0)
+    assert index.get("k")["prompt"] == "a cat"
+
+def test_size_accounting_and_delete(tmp_path):
+    index = CacheIndex(str(tmp_path / "index.db"))
+    index.put("a", 100)
+    index.put("b", 50)
+    index.put("a", 70)  # replace
+    assert (index.entries, index.total_bytes) == (2, 120)
+    assert index.delete(["a", "missing"]) == {"a": 70}
+    assert (index.entries, index.total_bytes) == (1, 50)
+
+    reopened = CacheIndex(str(tmp_path / "index.db"))
+    assert (reopened.entries, reopened.total_bytes) == (1, 50)
+
+def test_concurrent_hits_and_writes(tmp_path):
+    index = CacheIndex(str(tmp_path / "index.db"), max_pending=5)
+    index.start_flusher()
+    for i in range(20):
+        index.put(f"k{i}", 1)
+
+    def worker(n):
+        for i in range(200):
+            index.touch(f"k{(i + n) % 20}")
+            if i % 50 == 0:
+                index.put(f"extra{n}_{i}", 1)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    index.close()
+
+    reopened = CacheIndex(str(tmp_path / "index.db"))
+    # 20 initial puts count one access each, plus 1600 touches
+    assert sum(entry["access_count"] for key, entry in reopened.items() if key.startswith("k")) == 20 + 8 * 200
+    assert reopened.entries == 20 + 8 * 4
+
+def test_legacy_json_metadata_is_migrated(tmp_path):
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+    (cache_dir / "legacy.png").write_bytes(b"png")
+    (cache_dir / "cache_metadata.json").write_text(json.dumps({
+        "legacy": {"created_at": 1.0, "last_accessed": 2.0, "access_count": 4, "size_bytes": 3, "prompt": "old"}
+    }))
+
+    service = ImageCacheService(cache_dir=str(cache_dir))
+    assert service.metadata["legacy"]["prompt"] == "old"
+    assert service.metadata["legacy"]["access_count"] == 4
+    assert service.get_cache_stats()["total_entries"] == 1
+    assert not (cache_dir / "cache_metadata.json").exists()
+    assert (cache_dir / "cache_metadata.json.migrated").exists()
@@ -0,0 +1,101 @@
+import json
+import os
+
+from backend.services.cache_layout import LAYOUT_MARKER, shard_path, write_atomic
+from backend.services.cache_service import ImageCacheService
+
+KEY = "abcdef0123456789abcdef0123456789"
+
+def test_entries_are_sharded_and_checksummed(tmp_path):
+    cache = ImageCacheService(cache_dir=str(tmp_path / "cache"))
+    cache.save_to_cache(KEY, b"png-bytes")
+
+    path = tmp_path / "cache" / "ab" / "cd" / f"{KEY}.png"
+    assert path.read_bytes() == b"png-bytes"
+    assert cache.metadata[KEY]["checksum"] is not None
+    assert shard_path("root", "k") == os.path.join("root", "k_", "__", "k.png")
+    assert not [name for name in os.listdir(path.parent) if name.endswith(".tmp")]
+
+def test_failed_write_leaves_no_partial_file(tmp_path):
+    target = tmp_path / "ab" / "cd" / "entry.png"
+    try:
+        write_atomic(str(target), object())  # not bytes: the write fails midway
+    except TypeError:
+        pass
+    assert not target.exists()
+    assert os.listdir(target.parent) == []
+
+def test_truncated_file_is_a_miss_and_removed(tmp_path):
+    cache = ImageCacheService(cache_dir=str(tmp_path / "cache"))
+    cache.save_to_cache(KEY, b"complete image bytes")
+    with open(shard_path(cache.cache_dir, KEY), "wb") as f:
+        f.write(b"compl")
+
+    assert cache.get_cached_image(KEY) is None
+    assert KEY not in cache.metadata
+
+def test_flat_cache_migration(tmp_path):
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir()
+    (cache_dir / f"{KEY}.png").write_bytes(b"indexed")
+    (cache_dir / "0123orphan.png").write_bytes(b"orphan")
+    (cache_dir / "stale.tmp").write_bytes(b"partial")
+    (cache_dir / "cache_metadata.json").write_text(json.dumps({KEY: {"created_at": 1.0, "size_bytes": 7}}))
+
+    cache = ImageCacheService(cache_dir=str(cache_dir))
+    assert cache.get_cached_image(KEY) == b"indexed"
+    assert cache.get_cached_image("0123orphan") == b"orphan"
+    assert not (cache_dir / "stale.tmp").exists()
+    assert (cache_dir / LAYOUT_MARKER).exists()
+    assert cache.verify()["ok"] == 2
+
+def test_parallel_verify_detects_and_repairs(tmp_path):
+    cache = ImageCacheService(cache_dir=str(tmp_path / "cache"))
+    keys = [f"{i:02x}" + KEY[2:] for i in range(20)]
+    for key in keys:
+        cache.save_to_cache(key, key.encode() * 10)
+    with open(shard_path(cache.cache_dir, keys[0]), "r+b") as f:
+        f.write(b"XX")  # same size, different content
+    os.remove(shard_path(cache.cache_dir, keys[1]))
+
+    report = cache.verify(workers=4)
+    assert (report["ok"], report["checksum_mismatch"], report["missing"]) == (18, 1, 1)
+    assert cache.index.entries == 20
+
+    report = cache.verify(workers=4, repair=True)
+    assert report["repaired"] == 2
+    assert cache.index.entries == 18
+    assert cache.verify()["ok"] == 18
+
+def test_sweep_removes_stale_temp_files_and_adopts_unindexed_images(tmp_path):
+    cache = ImageCacheService(cache_dir=str(tmp_path / "cache"))
+    cache.save_to_cache(KEY, b"indexed")
+    shard = tmp_path / "cache" / "ab" / "cd"
+    stale_tmp = shard / "tmpx1y2z3.tmp"
+    stale_tmp.write_bytes(b"partial")
+    unindexed_key = "abcd" + "9" * 28
+    unindexed = shard / f"{unindexed_key}.png"
+    unindexed.write_bytes(b"written but never indexed")
+    fresh_tmp = shard / "inflight.tmp"
+    fresh_tmp.write_bytes(b"still being written")
+    for path in (stale_tmp, unindexed):
+        os.utime(path, (0, 0))
+
+    stats = cache.sweep()
+    assert stats == {'removed_tmp': 1, 'adopted': 1, 'removed_orphans': 0}
+    assert not stale_tmp.exists()
+    assert fresh_tmp.exists()  # inside the grace period
+    assert cache.metadata[unindexed_key]["size_bytes"] == len(b"written but never indexed")
+    assert cache.index.total_bytes == len(b"indexed") + len(b"written but never indexed")
+    assert cache.get_cached_image(unindexed_key) == b"written but never indexed"
+    assert cache.verify()["ok"] == 2
+
+def test_sweep_removes_image_left_in_a_stale_format(tmp_path):
+    cache = ImageCacheService(cache_dir=str(tmp_path / "cache"))
+    cache.save_to_cache(KEY, b"png")
+    leftover = tmp_path / "cache" / "ab" / "cd" / f"{KEY}.webp"
+    leftover.write_bytes(b"webp")
+
+    assert cache.sweep(grace_seconds=0)["removed_orphans"] == 1
+    assert not leftover.exists()
+    assert cache.get_cached_image(KEY) == b"png"
@@ -59,8 +59,7 @@ def test_clear_old_cache(cache_service):
     # Save old entry
     cache_service.save_to_cache("old_key", b"old_data")
     # Manually modify timestamp to be old
-    cache_service.metadata["old_key"]["created_at"] = time.time() - (8 * 24 * 60 * 60) # 8 days ago
-    cache_service._save_metadata()
+    cache_service.index.update("old_key", created_at=time.time() - (8 * 24 * 60 * 60)) # 8 days ago
     
     # Save new entry
     cache_service.save_to_cache("new_key", b"new_data")
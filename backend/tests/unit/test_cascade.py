@@ -0,0 +1,31 @@
+from backend.services.cascade import SDXL_BUCKETS, draft_bucket, plan_cascade, relative_cost, tradeoff_table
+
+def test_draft_bucket_keeps_ratio_and_snaps_to_64():
+    for width, height in SDXL_BUCKETS.values():
+        draft_w, draft_h = draft_bucket(width, height, 0.6)
+        assert draft_w % 64 == 0 and draft_h % 64 == 0
+        assert draft_w <= width and draft_h <= height
+        assert abs(draft_w / draft_h - width / height) < 0.15
+        assert draft_w * draft_h <= 0.7e6
+
+def test_small_targets_are_not_shrunk():
+    assert draft_bucket(768, 768, 0.6) == (768, 768)
+
+def test_plan_is_cheaper_than_full_generation():
+    plan = plan_cascade(1536, 640, steps=30, draft_megapixels=0.6, draft_steps=20, refine_strength=0.3)
+    assert plan['draft_steps'] == 20 and plan['refine_steps'] == 9
+    assert plan['upscale'] > 1
+
+    cost = relative_cost(plan, steps=30)
+    assert cost['draft'] < 0.5
+    assert cost['cascade'] < 1.0
+
+def test_lightning_refine_runs_at_least_one_step():
+    plan = plan_cascade(1024, 1024, steps=4, refine_strength=0.1)
+    assert plan['refine_steps'] == 1 and plan['draft_steps'] == 4
+
+def test_tradeoff_table_lists_every_row():
+    rows = [{'ratio': '1:1', 'final_size': (1024, 1024), 'draft_size': (768, 768), 'full_seconds': 10.0,
+             'draft_seconds': 4.0, 'cascade_seconds': 7.5, 'detail_ratio': 0.93}]
+    table = tradeoff_table(rows)
+    assert "1024x1024" in table and "1.33x" in table
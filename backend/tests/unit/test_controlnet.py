@@ -0,0 +1,68 @@
+import threading
+import time
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from backend.services import controlnet
+from backend.services.controlnet import ControlMapCache, canny_map
+
+def reference_png(color=(255, 255, 255)):
+    image = Image.new('RGB', (64, 48))
+    image.paste(color, (16, 12, 48, 36))
+    buffer = BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+@pytest.fixture
+def counting_preprocessor(monkeypatch):
+    """Replaces canny with a slow counting fake"""
+    calls = []
+    def fake(image, low=100, high=200):
+        calls.append((low, high))
+        time.sleep(0.05)
+        return np.zeros((image.height, image.width, 3), dtype=np.uint8)
+    monkeypatch.setitem(controlnet.PREPROCESSORS, 'canny', fake)
+    return calls
+
+def test_canny_map_is_rgb_and_finds_edges():
+    """The real preprocessor returns a 3-channel uint8 edge map"""
+    edges = canny_map(Image.open(BytesIO(reference_png())))
+    assert edges.shape == (48, 64, 3) and edges.dtype == np.uint8
+    assert edges.max() == 255 and edges[0, 0, 0] == 0
+
+def test_same_reference_and_params_skip_preprocessing(counting_preprocessor):
+    """Key = content hash + preprocessor + params"""
+    cache = ControlMapCache()
+    _, hit = cache.get(reference_png(), 'canny', {'low': 50})
+    assert not hit
+    _, hit = cache.get(reference_png(), 'canny', {'low': 50})
+    assert hit
+    cache.get(reference_png(), 'canny', {'low': 80})
+    cache.get(reference_png((255, 0, 0)), 'canny', {'low': 50})
+
+    assert len(counting_preprocessor) == 3
+    assert cache.get_stats()['memory_hits'] == 1
+    with pytest.raises(ValueError):
+        cache.get(reference_png(), 'canny', {'threshold': 1})
+
+def test_disk_tier_survives_a_new_instance(tmp_path, counting_preprocessor):
+    """Maps persisted as PNG are reused after a restart"""
+    ControlMapCache(cache_dir=str(tmp_path)).get(reference_png(), 'canny')
+    restarted = ControlMapCache(cache_dir=str(tmp_path))
+    control_map, hit = restarted.get(reference_png(), 'canny')
+
+    assert hit and control_map.shape == (48, 64, 3)
+    assert len(counting_preprocessor) == 1 and restarted.get_stats()['disk_hits'] == 1
+
+def test_concurrent_requests_for_one_reference_are_coalesced(counting_preprocessor):
+    """Only one thread preprocesses; the others wait for its result"""
+    cache = ControlMapCache()
+    threads = [threading.Thread(target=cache.get, args=(reference_png(), 'canny')) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(counting_preprocessor) == 1
@@ -0,0 +1,41 @@
+import sys
+import types
+
+import pytest
+
+from backend.services.cpu_backend import CPUModelHost, resolve_backend
+
+def fake_torch(cuda):
+    return types.SimpleNamespace(cuda=types.SimpleNamespace(is_available=lambda: cuda))
+
+@pytest.mark.parametrize("setting,cuda,expected", [
+    ("auto", True, "cuda"),
+    ("auto", False, "cpu"),
+    ("cuda", False, None),
+    ("cpu", True, "cpu"),
+])
+def test_resolve_backend_falls_back_to_cpu_only_in_auto(monkeypatch, setting, cuda, expected):
+    """auto keeps serving on CPU; an explicit cuda setting without a GPU stays unavailable"""
+    monkeypatch.setitem(sys.modules, "torch", fake_torch(cuda))
+    assert resolve_backend(setting) == expected
+
+def test_host_builds_models_once_and_keeps_them_resident():
+    """The CPU host offers the VRAM manager interface without moving anything"""
+    host = CPUModelHost(threads=4, dtype="int8")
+    builds = []
+
+    def loader():
+        builds.append(1)
+        host.register("sdxl", "pipeline", mover=lambda device: pytest.fail("models never move on CPU"))
+
+    host.register_loader("sdxl", loader)
+    assert not host.is_resident("sdxl")
+    for _ in range(3):
+        with host.acquire("sdxl") as model:
+            assert model == "pipeline"
+
+    assert builds == [1] and host.is_resident("sdxl")
+    assert host.prefetch("sdxl") is False and host.activation_bytes("sdxl") > 0
+    assert host.get_stats()['leases'] == 3 and host.get_stats()['models'] == ["sdxl"]
+    with pytest.raises(ValueError):
+        CPUModelHost(dtype="fp8")
@@ -0,0 +1,45 @@
+from backend.services.embedding_cache import PromptEmbeddingCache
+
+class FakeTensor:
+    """Reports a synthetic size like a torch tensor"""
+    def __init__(self, nbytes):
+        self.nbytes = nbytes
+
+    def numel(self):
+        return self.nbytes // 2
+
+    def element_size(self):
+        return 2
+
+def test_hit_and_miss_counters():
+    """Repeated texts are served from the cache"""
+    cache = PromptEmbeddingCache(max_bytes=10_000)
+    assert cache.get("a cat") is None
+    embeds, pooled = FakeTensor(1000), FakeTensor(100)
+    cache.put("a cat", embeds, pooled)
+
+    assert cache.get("a cat") == (embeds, pooled)
+    stats = cache.get_stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+
+def test_memory_cap_evicts_least_recently_used():
+    """The byte cap evicts the oldest unused entry first"""
+    cache = PromptEmbeddingCache(max_bytes=2500)
+    for text in ("a", "b"):
+        cache.put(text, FakeTensor(1000), FakeTensor(100))
+    cache.get("a")
+    cache.put("c", FakeTensor(1000), FakeTensor(100))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.get_stats()['evictions'] == 1
+
+def test_namespace_change_clears_cache():
+    """Embeddings from another checkpoint are never reused"""
+    cache = PromptEmbeddingCache()
+    cache.set_namespace("lightning.safetensors")
+    cache.put("a cat", FakeTensor(10), FakeTensor(10))
+    cache.set_namespace("juggernaut.safetensors")
+    assert cache.get("a cat") is None
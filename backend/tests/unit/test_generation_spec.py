@@ -0,0 +1,46 @@
+from backend.services.cache_service import ImageCacheService
+from backend.services.generation_spec import GenerationSpec, model_fingerprint, normalize_prompt
+
+def test_normalize_prompt_ignores_case_and_token_neutral_whitespace():
+    assert normalize_prompt("  A  Red\tSneaker , studio ") == "a red sneaker,studio"
+    assert normalize_prompt("a red sneaker,studio") == "a red sneaker,studio"
+    # Adjacent punctuation is one CLIP token, so the space between two marks is kept
+    assert normalize_prompt("a, (b") == "a, (b"
+    assert normalize_prompt("a,(b") == "a,(b"
+    assert normalize_prompt(None) == ""
+
+def test_trivial_prompt_variants_share_a_key():
+    a = GenerationSpec(prompt="Sneaker on  marble", style="Fooocus V2")
+    b = GenerationSpec(prompt="sneaker on marble ", style="Fooocus V2")
+    assert a == b
+    assert a.cache_key() == b.cache_key()
+
+def test_every_output_affecting_field_changes_the_key():
+    base = GenerationSpec(prompt="sneaker", negative_prompt="blurry", style="Fooocus V2", width=1024,
+                          height=1024, steps=4, guidance=0, seed=None, is_lightning=True,
+                          adapters=(("clay", 0.8),), model="abc")
+    variants = [
+        dict(prompt="boot"), dict(negative_prompt="noisy"), dict(style="Cinematic"), dict(width=1344, height=768),
+        dict(steps=8), dict(guidance=1.5), dict(seed=7), dict(is_lightning=False),
+        dict(adapters=(("clay", 0.5),)), dict(model="def"),
+    ]
+    fields = base.describe()
+    keys = {GenerationSpec(**{**fields, 'adapters': base.adapters, **change}).cache_key() for change in variants}
+    assert len(keys) == len(variants)
+    assert base.cache_key() not in keys
+
+def test_cache_service_uses_spec_key(tmp_path):
+    cache = ImageCacheService(cache_dir=str(tmp_path / "cache"))
+    spec = GenerationSpec(prompt="A cat", steps=4)
+    assert cache.get_cache_key(spec) == spec.cache_key()
+    assert cache.get_cache_key("a cat ", steps=4) == spec.cache_key()
+    assert len(spec.cache_key()) == 32
+
+def test_model_fingerprint_tracks_checkpoint_and_backend(tmp_path):
+    checkpoint = tmp_path / "model.safetensors"
+    checkpoint.write_bytes(b"weights")
+    cuda = model_fingerprint(str(checkpoint), 'cuda', 'fp16')
+    assert cuda == model_fingerprint(str(checkpoint), 'cuda', 'fp16')
+    assert cuda != model_fingerprint(str(checkpoint), 'cpu', 'bf16')
+    checkpoint.write_bytes(b"other weights")
+    assert cuda != model_fingerprint(str(checkpoint), 'cuda', 'fp16')
@@ -0,0 +1,74 @@
+import threading
+import time
+
+from backend.services.cache_service import ImageCacheService
+from backend.services.hot_cache import HotImageCache
+from backend.services.image_output import RenderedImage
+
+def rendered(data=b"x" * 30):
+    return RenderedImage(data, "png")
+
+def test_promotion_after_repeated_disk_hits():
+    hot = HotImageCache(max_bytes=10 ** 6, promote_after=2)
+    loads = []
+    loader = lambda: loads.append(1) or rendered()
+
+    assert hot.get("k", "png", loader)[1] == "disk"
+    assert hot.get("k", "png", loader)[1] == "disk"
+    payload, tier = hot.get("k", "png", loader)
+    assert tier == "memory"
+    assert len(loads) == 2
+    assert payload.data_uri().startswith("data:image/png;base64,")
+
+    stats = hot.get_stats()
+    assert (stats["memory_hits"], stats["disk_hits"], stats["promotions"]) == (1, 2, 1)
+    assert stats["memory_hit_ratio"] == round(1 / 3, 3)
+
+def test_lru_demotion_by_bytes():
+    size = len(rendered().data) + len(rendered().data_uri())
+    hot = HotImageCache(max_bytes=2 * size, promote_after=1)
+    for key in ("a", "b"):
+        hot.get(key, "png", rendered)
+    hot.get("a", "png", rendered)  # "a" becomes most recent
+    hot.get("c", "png", rendered)  # demotes "b"
+
+    assert hot.get("a", "png", rendered)[1] == "memory"
+    assert hot.get("b", "png", rendered)[1] == "disk"
+    assert hot.get_stats()["demotions"] >= 1
+
+def test_concurrent_disk_misses_are_coalesced():
+    hot = HotImageCache(max_bytes=10 ** 6)
+    loads = []
+
+    def slow_loader():
+        loads.append(1)
+        time.sleep(0.05)
+        return rendered()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(hot.get("k", "png", slow_loader)))
+               for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(loads) == 1
+    assert all(payload is not None and tier == "disk" for payload, tier in results)
+    assert hot.get_stats()["coalesced"] == 5
+
+def test_service_invalidates_hot_entries(tmp_path):
+    cache = ImageCacheService(cache_dir=str(tmp_path / "cache"), hot_promote_after=1)
+    cache.save_to_cache("k", b"png-bytes")
+    render = lambda data, image_format: RenderedImage(data, image_format)
+
+    assert cache.get_rendered("k", "png", render).data == b"png-bytes"
+    assert cache.hot.get_stats()["entries"] == 1
+
+    cache.save_to_cache("k", b"new-bytes")
+    assert cache.hot.get_stats()["entries"] == 0
+    assert cache.get_rendered("k", "png", render).data == b"new-bytes"
+
+    cache.remove_entries([("k", "png")])
+    assert cache.get_rendered("k", "png", render) is None
+    assert cache.get_cache_stats()["tiers"]["misses"] == 1
@@ -0,0 +1,43 @@
+import os
+
+import pytest
+from PIL import Image
+from werkzeug.datastructures import MIMEAccept
+
+from backend.services.image_output import ImageOutputService, encode_image
+
+@pytest.fixture
+def output(tmp_path):
+    return ImageOutputService(files_dir=str(tmp_path / "images"), quality=80)
+
+def test_negotiate_defaults_to_legacy_base64(output):
+    spec = output.negotiate({}, MIMEAccept([('*/*', 1)]))
+    assert (spec.mode, spec.format) == ('base64', 'png')
+
+def test_negotiate_binary_from_accept_header(output):
+    spec = output.negotiate({}, MIMEAccept([('image/webp', 1), ('application/json', 0.5)]))
+    assert (spec.mode, spec.format, spec.quality) == ('binary', 'webp', 80)
+
+    spec = output.negotiate({'response': 'url', 'format': 'jpg', 'quality': 150}, None)
+    assert (spec.mode, spec.format, spec.quality) == ('url', 'jpeg', 100)
+
+    with pytest.raises(ValueError):
+        output.negotiate({'format': 'bmp'})
+
+def test_url_render_is_content_addressed(output):
+    image = Image.new('RGB', (32, 32), (200, 10, 10))
+    spec = output.negotiate({'response': 'url', 'format': 'webp'})
+
+    first = output.render(spec, image=image)
+    second = output.render(spec, image=image)
+    assert first.url == second.url and first.url.startswith('/files/images/')
+    assert os.listdir(output.files_dir) == [first.url.rsplit('/', 1)[1]]
+
+def test_render_reuses_encoded_bytes_in_same_format(output):
+    png = encode_image(Image.new('RGB', (8, 8)), 'png')
+    spec = output.negotiate({'format': 'png'})
+    assert output.render(spec, encoded=png, encoded_format='png').data is png
+
+    webp = output.render(output.negotiate({'format': 'webp'}), encoded=png)
+    assert webp.data[8:12] == b'WEBP'
+    assert webp.data_uri().startswith('data:image/webp;base64,')
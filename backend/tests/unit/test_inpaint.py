@@ -0,0 +1,44 @@
+import numpy as np
+
+from backend.services.cascade import SDXL_BUCKETS
+from backend.services.inpaint import crop_region, feather_mask, mask_bbox, paste_region
+
+def test_mask_bbox_is_exclusive_and_none_when_empty():
+    """The box covers exactly the active pixels"""
+    mask = np.zeros((768, 1344), dtype=bool)
+    mask[100:150, 1200:1260] = True
+    assert mask_bbox(mask) == (1200, 100, 1260, 150)
+    assert mask_bbox(np.zeros((8, 8), dtype=bool)) is None
+
+def test_small_region_is_cropped_to_a_bucket_aspect_inside_the_image():
+    """A logo-sized mask runs on a bucket-shaped crop much smaller than the full frame"""
+    region, size = crop_region((1200, 100, 1260, 150), (1344, 768), padding=96)
+    x0, y0, x1, y1 = region
+    assert 0 <= x0 < 1200 and x1 <= 1344 and 0 <= y0 < 100 and y1 <= 768
+    assert x0 <= 1200 - 96 or x1 == 1344
+    assert size[0] % 64 == 0 and size[1] % 64 == 0
+    assert size[0] * size[1] < 1344 * 768
+
+    aspects = [w / h for w, h in SDXL_BUCKETS.values()]
+    assert min(abs(size[0] / size[1] - a) for a in aspects) < 0.1
+    assert abs((x1 - x0) / (y1 - y0) - size[0] / size[1]) < 0.1
+
+def test_feather_keeps_mask_opaque_and_fades_outside():
+    """Alpha is 1 on the mask, 0 far away and fractional in the band"""
+    mask = np.zeros((100, 100), dtype=bool)
+    mask[40:60, 40:60] = True
+    grown, alpha = feather_mask(mask, 5)
+    assert grown.sum() > mask.sum()
+    assert np.all(alpha[mask] == 1.0)
+    assert alpha[0, 0] == 0.0
+    assert 0 < alpha[50, 65] < 1
+
+def test_paste_only_changes_the_region():
+    """Pixels outside the crop are untouched; inside they follow the alpha"""
+    image = np.zeros((64, 64, 3), dtype=np.uint8)
+    patch = np.full((16, 16, 3), 200, dtype=np.uint8)
+    alpha = np.full((16, 16), 0.5, dtype=np.float32)
+    result = paste_region(image, patch, alpha, (8, 8, 24, 24))
+    assert result[8:24, 8:24].min() == 100 and result[8:24, 8:24].max() == 100
+    assert result.sum() == 100 * 16 * 16 * 3
+    assert image.sum() == 0
@@ -0,0 +1,59 @@
+import pytest
+import time
+from backend.services.job_store import JobStore
+
+@pytest.fixture
+def store(tmp_path):
+    store = JobStore(db_path=str(tmp_path / "jobs.db"))
+    yield store
+    store.close()
+
+def test_ids_do_not_collide(store):
+    """Jobs created in the same second get distinct IDs"""
+    ids = {store.create("video", {"script": "hola"}, prefix="vid")['id'] for _ in range(50)}
+    assert len(ids) == 50
+    assert all(job_id.startswith("vid_") for job_id in ids)
+
+def test_update_and_get(store):
+    """Status and result fields are persisted and merged"""
+    job = store.create("video", {"script": "hola"}, owner="demo")
+    assert job['status'] == 'queued'
+
+    store.update(job['id'], "processing", progress=30)
+    store.update(job['id'], "completed", url="/files/jobs/x/final_result.mp4")
+
+    job = store.get(job['id'])
+    assert job['status'] == 'completed'
+    assert job['progress'] == 30
+    assert job['url'] == "/files/jobs/x/final_result.mp4"
+    assert store.list_jobs(owner="demo")[0]['id'] == job['id']
+    assert store.get("missing") is None
+
+def test_recover_after_restart(tmp_path):
+    """Queued and interrupted jobs are returned for re-queueing on restart"""
+    path = str(tmp_path / "jobs.db")
+    store1 = JobStore(db_path=path)
+    queued = store1.create("video", {"script": "a"})
+    interrupted = store1.create("video", {"script": "b"})
+    done = store1.create("video", {"script": "c"})
+    store1.update(interrupted['id'], "processing")
+    store1.update(done['id'], "completed")
+    store1.close()
+
+    store2 = JobStore(db_path=path)
+    recovered = store2.recover()
+    assert [job['id'] for job in recovered] == [queued['id'], interrupted['id']]
+    assert recovered[1]['data'] == {"script": "b"}
+    assert store2.get(interrupted['id'])['status'] == 'queued'
+    store2.close()
+
+def test_sweep_removes_only_expired_finished_jobs(store):
+    """TTL sweep keeps active jobs and recent results"""
+    old = store.create("video")
+    active = store.create("video")
+    store.update(old['id'], "completed")
+    store._conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (time.time() - 3600, old['id']))
+
+    assert store.sweep(ttl_seconds=60) == 1
+    assert store.get(old['id']) is None
+    assert store.get(active['id']) is not None
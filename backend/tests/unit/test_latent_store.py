@@ -0,0 +1,38 @@
+from backend.services.latent_store import LatentEntry, LatentStore
+
+class FakeTensor:
+    """Reports a synthetic size like a torch tensor"""
+    def __init__(self, nbytes):
+        self.nbytes = nbytes
+
+    def numel(self):
+        return self.nbytes // 2
+
+    def element_size(self):
+        return 2
+
+def make_entry(nbytes=1000, seed=1):
+    return LatentEntry(FakeTensor(nbytes), seed, "a red car", "blurry", 1024, 1024, 4, 0, True)
+
+def test_stores_latent_with_generation_parameters():
+    """A stored generation keeps everything a follow-up needs"""
+    store = LatentStore(max_bytes=10_000)
+    generation_id = store.new_generation_id()
+    store.put(generation_id, make_entry(seed=42))
+
+    entry = store.get(generation_id)
+    assert entry.seed == 42 and (entry.width, entry.height, entry.steps) == (1024, 1024, 4)
+    assert store.get("gen_missing") is None
+    assert store.get_stats()['hits'] == 1 and store.get_stats()['misses'] == 1
+
+def test_evicts_least_recently_used_by_bytes():
+    """The store never exceeds its byte budget"""
+    store = LatentStore(max_bytes=2500)
+    store.put("gen_a", make_entry())
+    store.put("gen_b", make_entry())
+    store.get("gen_a")
+    store.put("gen_c", make_entry())
+
+    assert store.get("gen_b") is None
+    assert store.get("gen_a") is not None and store.get("gen_c") is not None
+    assert store.get_stats()['evictions'] == 1
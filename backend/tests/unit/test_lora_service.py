@@ -0,0 +1,104 @@
+import pytest
+
+from backend.services.lora_service import LoRAManager, normalize_adapters
+
+class FakeTensor:
+    """Reports a synthetic size like a torch tensor"""
+    def __init__(self, nbytes):
+        self.nbytes = nbytes
+
+    def numel(self):
+        return self.nbytes // 2
+
+    def element_size(self):
+        return 2
+
+class FakeManager(LoRAManager):
+    """Reads adapters from a dict instead of safetensors files"""
+    def __init__(self, files, **kwargs):
+        super().__init__(lora_dir="unused", **kwargs)
+        self.files = files
+        self.reads = []
+
+    def available(self):
+        return sorted(self.files)
+
+    def path(self, name):
+        if name not in self.files:
+            raise ValueError(f"Unknown LoRA: {name}")
+        return name
+
+    def _read(self, path):
+        self.reads.append(path)
+        return dict(self.files[path])
+
+class FakePipe:
+    """Records the diffusers LoRA calls it receives"""
+    def __init__(self):
+        self.calls = []
+
+    def __getattr__(self, name):
+        if name.startswith(('load_', 'set_', 'fuse', 'unfuse', 'enable', 'disable', 'delete')):
+            return lambda *args, **kwargs: self.calls.append((name, args, kwargs))
+        raise AttributeError(name)
+
+    def names(self):
+        return [call[0] for call in self.calls]
+
+FILES = {
+    "anime": {"lora_unet_down.weight": FakeTensor(1000)},
+    "pixel": {"lora_unet_up.weight": FakeTensor(1000)},
+    "clay": {"lora_unet_mid.weight": FakeTensor(1000), "lora_te1_text.weight": FakeTensor(500)},
+}
+
+def test_normalizes_request_formats_to_a_canonical_set():
+    """Dicts and lists give the same sorted, hashable adapter set"""
+    assert normalize_adapters({"pixel": 0.5, "anime": 1}) == (("anime", 1.0), ("pixel", 0.5))
+    assert normalize_adapters([{"name": "pixel", "weight": 0.5}, "anime"]) == (("anime", 1.0), ("pixel", 0.5))
+    assert normalize_adapters(None) == () and normalize_adapters({"anime": 0}) == ()
+    with pytest.raises(ValueError):
+        normalize_adapters({"a": 1, "b": 1, "c": 1, "d": 1}, max_adapters=3)
+    with pytest.raises(ValueError):
+        normalize_adapters({"anime": 5})
+
+def test_cpu_cache_evicts_least_recently_used_by_bytes():
+    """Adapter tensors are read once and kept within the byte budget"""
+    manager = FakeManager(FILES, max_cache_bytes=2000)
+    manager.state_dict("anime")
+    manager.state_dict("pixel")
+    manager.state_dict("anime")
+    manager.state_dict("clay")
+
+    assert manager.reads == ["anime", "pixel", "clay"]
+    assert manager.get_stats()['cached'] == ["clay"]
+    assert manager.get_stats()['hits'] == 1 and manager.get_stats()['evictions'] == 2
+
+def test_switches_adapters_on_the_resident_pipeline():
+    """Activation fuses the set, is a no-op when unchanged and unfuses before switching"""
+    manager = FakeManager(FILES)
+    pipe = FakePipe()
+
+    assert manager.activate(pipe, (("anime", 0.8),))
+    assert pipe.names() == ["load_lora_weights", "enable_lora", "set_adapters", "fuse_lora"]
+    assert pipe.calls[2][2]['adapter_weights'] == [0.8]
+
+    pipe.calls.clear()
+    assert not manager.activate(pipe, (("anime", 0.8),))
+    assert pipe.calls == []
+
+    assert manager.activate(pipe, (("anime", 0.8), ("pixel", 1.0)))
+    assert pipe.names()[0] == "unfuse_lora"
+    assert pipe.names().count("load_lora_weights") == 1  # anime is still injected
+
+    pipe.calls.clear()
+    assert manager.activate(pipe, ())
+    assert pipe.names() == ["unfuse_lora", "disable_lora"]
+    assert manager.get_stats()['switches'] == 3
+
+def test_text_encoder_variant_only_for_text_encoder_loras():
+    """Cached prompt embeddings stay valid for UNet-only adapters"""
+    manager = FakeManager(FILES)
+    assert manager.text_encoder_variant((("anime", 1.0),)) == ""
+    assert manager.text_encoder_variant((("clay", 0.7),)) == "clay:0.7"
+    with pytest.raises(ValueError):
+        manager.validate((("missing", 1.0),))
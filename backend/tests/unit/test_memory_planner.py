@@ -0,0 +1,65 @@
+from backend.services.memory_planner import (
+    GB, apply_plan, max_batch_size, plan_execution, unet_activation_bytes, vae_decode_bytes
+)
+
+class FakeVAE:
+    tile_sample_min_size = 1024
+    tile_latent_min_size = 128
+
+class FakePipeline:
+    """Records the memory toggles the planner applies"""
+    def __init__(self):
+        self.vae = FakeVAE()
+        self.xformers_enabled = True
+        self.calls = []
+
+    def __getattr__(self, name):
+        if name.startswith(('enable_', 'disable_')):
+            return lambda *args: self.calls.append((name,) + args)
+        raise AttributeError(name)
+
+def test_estimates_grow_with_resolution_batch_and_guidance():
+    base = unet_activation_bytes(1024, 1024)
+    assert unet_activation_bytes(1024, 1024, batch=2) == 2 * base
+    assert unet_activation_bytes(1024, 1024, cfg=True) == 2 * base
+    assert unet_activation_bytes(1024, 1024, efficient_attention=False) > base
+    assert vae_decode_bytes(1536, 640, tile=512) < vae_decode_bytes(1536, 640)
+
+def test_no_slicing_when_everything_fits():
+    plan = plan_execution(1024, 1024, 1, free_bytes=8 * GB)
+    assert plan.fits and plan.key == (None, False, None)
+
+def test_vae_tiling_chosen_for_wide_bucket_on_tight_budget():
+    plan = plan_execution(1536, 640, 1, free_bytes=1 * GB, efficient_attention=True)
+    assert plan.vae_tile in (1024, 768, 512)
+    assert plan.vae_bytes <= plan.free_bytes
+    assert "VAE tiling" in plan.describe()
+
+def test_attention_slicing_only_without_efficient_attention():
+    tight = 1.2 * GB
+    assert plan_execution(1024, 1024, 1, tight, cfg=True, efficient_attention=True).attention_slicing is None
+    assert plan_execution(1024, 1024, 1, tight, cfg=True, efficient_attention=False).attention_slicing is not None
+
+def test_vae_slicing_before_tiling_for_batched_decode():
+    plan = plan_execution(1024, 1024, 4, free_bytes=4 * GB, vae_batch=4)
+    assert plan.vae_slicing and plan.vae_tile is None
+
+def test_max_batch_size_shrinks_with_free_memory():
+    roomy = max_batch_size(1024, 1024, 10 * GB, limit=8)
+    tight = max_batch_size(1024, 1024, 3 * GB, limit=8)
+    assert roomy > tight >= 1
+    assert max_batch_size(1024, 1024, 100 * GB, limit=4) == 4
+
+def test_apply_plan_only_toggles_changes_and_restores_xformers():
+    pipe = FakePipeline()
+    tiled = plan_execution(1536, 640, 1, free_bytes=1 * GB, efficient_attention=False)
+    assert apply_plan(pipe, tiled)
+    assert ('enable_vae_tiling',) in pipe.calls
+    assert pipe.vae.tile_latent_min_size == tiled.vae_tile // 8
+    assert not apply_plan(pipe, tiled)
+
+    pipe.calls.clear()
+    assert apply_plan(pipe, plan_execution(1024, 1024, 1, free_bytes=20 * GB))
+    assert ('disable_vae_tiling',) in pipe.calls
+    if tiled.attention_slicing:
+        assert ('enable_xformers_memory_efficient_attention',) in pipe.calls
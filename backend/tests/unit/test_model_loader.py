@@ -0,0 +1,21 @@
+import time
+
+from backend.services.model_loader import PhaseTimer, peak_rss_mb
+
+def test_phase_timer_records_each_phase():
+    timer = PhaseTimer()
+    timer.phase("unet_init")
+    time.sleep(0.01)
+    timer.phase("unet_weights")
+    phases = timer.done()
+
+    assert [p['phase'] for p in phases] == ["unet_init", "unet_weights"]
+    assert phases[0]['seconds'] >= 0.01
+    assert all(p['peak_rss_mb'] > 0 for p in phases)
+    assert "total" in timer.report()
+
+def test_peak_rss_is_monotonic():
+    before = peak_rss_mb()
+    blob = bytearray(32 * 1024 * 1024)
+    assert peak_rss_mb() >= before
+    del blob
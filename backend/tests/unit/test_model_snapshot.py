@@ -0,0 +1,37 @@
+import json
+import os
+
+from backend.services.model_snapshot import (
+    MANIFEST_FILE, SNAPSHOT_VERSION, read_manifest, snapshot_is_valid, source_checksums
+)
+
+def write_manifest(snapshot_dir, sources, version=SNAPSHOT_VERSION):
+    os.makedirs(snapshot_dir, exist_ok=True)
+    with open(os.path.join(snapshot_dir, MANIFEST_FILE), 'w') as f:
+        json.dump({'version': version, 'sources': source_checksums(sources)}, f)
+
+def test_snapshot_valid_while_sources_unchanged(tmp_path):
+    ckpt = tmp_path / "unet.safetensors"
+    ckpt.write_bytes(b"weights" * 1000)
+    sources = {'checkpoint': str(ckpt), 'base': "stabilityai/stable-diffusion-xl-base-1.0"}
+    write_manifest(str(tmp_path / "snap"), sources)
+
+    assert snapshot_is_valid(read_manifest(str(tmp_path / "snap")), sources)
+
+def test_snapshot_invalidated_when_source_changes(tmp_path):
+    ckpt = tmp_path / "unet.safetensors"
+    ckpt.write_bytes(b"weights" * 1000)
+    sources = {'checkpoint': str(ckpt)}
+    write_manifest(str(tmp_path / "snap"), sources)
+
+    ckpt.write_bytes(b"retrained" * 1000)
+    assert not snapshot_is_valid(read_manifest(str(tmp_path / "snap")), sources)
+    assert not snapshot_is_valid(read_manifest(str(tmp_path / "snap")), {'checkpoint': str(ckpt), 'base': "other"})
+
+def test_missing_or_old_manifest_is_invalid(tmp_path):
+    sources = {'base': "repo"}
+    assert read_manifest(str(tmp_path / "none")) is None
+    assert not snapshot_is_valid(None, sources)
+
+    write_manifest(str(tmp_path / "snap"), sources, version=SNAPSHOT_VERSION - 1)
+    assert not snapshot_is_valid(read_manifest(str(tmp_path / "snap")), sources)
@@ -0,0 +1,79 @@
+import pytest
+import threading
+import time
+from backend.services.vram_manager import VRAMManager, GB
+from backend.services.scheduler import AffinityScheduler
+from backend.services.prefetcher import ModelPrefetcher
+
+class SlowModel:
+    """Instrumented fake model whose host-to-device copy takes `delay` seconds"""
+    def __init__(self, size_gb, delay):
+        self.vram_bytes = int(size_gb * GB)
+        self.delay = delay
+        self.device = "cpu"
+
+    def to(self, device):
+        time.sleep(self.delay)
+        self.device = device
+        return self
+
+class SlowPipeline:
+    """Fake diffusers pipeline moved component by component"""
+    def __init__(self, delay):
+        self.components = {"unet": SlowModel(5, delay), "vae": SlowModel(0.2, delay), "text_encoder": SlowModel(1, delay)}
+        self.vram_bytes = 6 * GB
+
+class Job:
+    def __init__(self, model):
+        self.model = model
+
+@pytest.fixture
+def manager():
+    return VRAMManager(budget_bytes=15 * GB, free_cache=lambda: None)
+
+def test_prefetch_overlaps_transfer_with_current_job(manager):
+    """The next job's model is already resident when its lease starts"""
+    whisper = SlowModel(1, delay=0.3)
+    manager.register("whisper", whisper)
+    scheduler = AffinityScheduler()
+    prefetcher = ModelPrefetcher(manager, scheduler, poll_interval=0.01)
+    prefetcher.start()
+
+    scheduler.put(Job("whisper"))
+    time.sleep(0.5)  # the current job keeps running meanwhile
+
+    start = time.monotonic()
+    with manager.acquire("whisper"):
+        elapsed = time.monotonic() - start
+    prefetcher.stop()
+
+    assert elapsed < 0.1
+    assert manager.prefetches == 1
+    assert manager.prefetch_hits == 1
+
+def test_prefetch_never_evicts(manager):
+    """Prefetch only uses free budget"""
+    manager.register("sdxl", SlowModel(12, delay=0))
+    manager.register("faceswap", SlowModel(2, delay=0), size_bytes=2 * GB)
+    manager.ensure_resident("sdxl")
+    manager.budget_bytes = 13 * GB
+
+    assert manager.prefetch("faceswap") is False
+    assert manager.is_resident("sdxl")
+    assert not manager.is_resident("faceswap")
+
+def test_prefetch_cancelled_when_queue_changes(manager):
+    """Cancelling mid-transfer moves already-copied components back to CPU"""
+    pipe = SlowPipeline(delay=0.1)
+    manager.register("sdxl", pipe)
+    cancel = threading.Event()
+
+    worker = threading.Thread(target=manager.prefetch, args=("sdxl", cancel))
+    worker.start()
+    time.sleep(0.05)
+    cancel.set()
+    worker.join(2)
+
+    assert not manager.is_resident("sdxl")
+    assert all(c.device == "cpu" for c in pipe.components.values())
+    assert manager.prefetch_cancels == 1
@@ -0,0 +1,48 @@
+import numpy as np
+
+from backend.services.preview_service import LatentPreviewer, PreviewThrottle, latents_to_rgb_linear
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_throttle_caps_preview_cost_to_fraction_of_step_time():
+    clock = FakeClock()
+    throttle = PreviewThrottle(max_cost_fraction=0.1, clock=clock)
+
+    shown = 0
+    for step in range(30):
+        clock.now += 1.0  # one second per denoising step
+        if throttle.should_preview(step):
+            throttle.record(0.5)  # each preview costs half a step
+            clock.now += 0.5
+            shown += 1
+
+    assert 0 < shown <= 6
+    assert throttle.preview_time <= 0.1 * throttle.step_time + 0.5
+    assert throttle.step_time == 30.0
+
+def test_throttle_previews_every_step_when_cheap():
+    clock = FakeClock()
+    throttle = PreviewThrottle(max_cost_fraction=0.1, every_n_steps=2, clock=clock)
+
+    shown = []
+    for step in range(6):
+        clock.now += 1.0
+        if throttle.should_preview(step):
+            throttle.record(0.01)
+            shown.append(step)
+
+    assert shown == [0, 2, 4]
+
+def test_linear_preview_decodes_and_encodes_small_image():
+    latents = np.random.RandomState(0).randn(4, 128, 96).astype(np.float32)
+    rgb = latents_to_rgb_linear(latents)
+    assert rgb.shape == (128, 96, 3) and rgb.dtype == np.uint8
+
+    previewer = LatentPreviewer(decoder="linear", max_size=64, image_format="JPEG")
+    frame = previewer.encode(rgb)
+    assert frame[:2] == b"\xff\xd8"
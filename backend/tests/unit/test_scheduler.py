@@ -0,0 +1,50 @@
+from backend.services.scheduler import AffinityScheduler
+
+class Job:
+    def __init__(self, name, model):
+        self.name = name
+        self.model = model
+
+def drain(scheduler):
+    order = []
+    while scheduler.qsize():
+        order.append(scheduler.get().name)
+    return order
+
+def test_groups_jobs_for_resident_model():
+    """Jobs for the resident model jump ahead of jobs that would force a swap"""
+    scheduler = AffinityScheduler(lookahead=8, max_wait_seconds=60, max_skips=10)
+    for name, model in [("a", "sdxl"), ("b", "whisper"), ("c", "sdxl"), ("d", "whisper"), ("e", "sdxl")]:
+        scheduler.put(Job(name, model))
+
+    assert drain(scheduler) == ["a", "c", "e", "b", "d"]
+    stats = scheduler.get_stats()
+    assert stats['swaps'] == 2
+    assert stats['swaps_avoided'] == 2
+
+def test_fifo_without_affinity():
+    """Jobs without a model keep FIFO order"""
+    scheduler = AffinityScheduler()
+    for name in "abc":
+        scheduler.put(Job(name, None))
+    assert drain(scheduler) == ["a", "b", "c"]
+
+def test_starvation_bound_by_skips():
+    """A job skipped max_skips times is promoted even if it forces a swap"""
+    scheduler = AffinityScheduler(lookahead=8, max_wait_seconds=60, max_skips=2)
+    scheduler.note_resident("sdxl")
+    scheduler.put(Job("whisper", "whisper"))
+    for i in range(5):
+        scheduler.put(Job(f"sdxl{i}", "sdxl"))
+
+    order = drain(scheduler)
+    assert order.index("whisper") == 2
+    assert scheduler.get_stats()['starvation_promotions'] == 1
+
+def test_starvation_bound_by_age():
+    """A job older than max_wait_seconds is dispatched next"""
+    scheduler = AffinityScheduler(lookahead=8, max_wait_seconds=0, max_skips=100)
+    scheduler.note_resident("sdxl")
+    scheduler.put(Job("faceswap", "faceswap"))
+    scheduler.put(Job("sdxl", "sdxl"))
+    assert scheduler.get().name == "faceswap"
@@ -0,0 +1,24 @@
+import pytest
+
+from backend.utils.seeds import MAX_SEED, resolve_seeds
+
+def test_default_is_one_random_seed():
+    seeds = resolve_seeds()
+    assert len(seeds) == 1 and 0 <= seeds[0] <= MAX_SEED
+
+def test_base_seed_and_explicit_seeds():
+    assert resolve_seeds(num_images=3, seed=10) == [10, 11, 12]
+    assert resolve_seeds(num_images=2, seed=MAX_SEED) == [MAX_SEED, 0]
+    assert resolve_seeds(seeds=[5, "9"]) == [5, 9]
+
+@pytest.mark.parametrize("kwargs", [
+    {"num_images": 0},
+    {"num_images": 5},
+    {"num_images": 2, "seeds": [1]},
+    {"seed": -1},
+    {"seeds": ["abc"]},
+    {"seeds": []},
+])
+def test_invalid_requests_raise(kwargs):
+    with pytest.raises(ValueError):
+        resolve_seeds(max_images=4, **kwargs)
@@ -0,0 +1,171 @@
+import pytest
+import time
+from backend.services.vram_manager import VRAMManager, GB
+
+class FakeModel:
+    """CPU stand-in that reports a synthetic VRAM footprint"""
+    def __init__(self, size_gb):
+        self.vram_bytes = int(size_gb * GB)
+        self.device = "cpu"
+        self.moves = []
+
+    def to(self, device):
+        self.device = device
+        self.moves.append(device)
+        return self
+
+@pytest.fixture
+def manager():
+    return VRAMManager(budget_bytes=15 * GB, reserved_bytes=2 * GB, idle_ttl_seconds=600,
+                       free_cache=lambda: None)
+
+def test_models_that_fit_stay_resident(manager):
+    """SDXL, whisper and InsightFace fit together in a 13 GB budget"""
+    models = {"sdxl": FakeModel(6), "whisper": FakeModel(1), "faceswap": FakeModel(2)}
+    for name, model in models.items():
+        manager.register(name, model)
+        manager.ensure_resident(name)
+
+    assert sorted(manager.resident_models()) == ["faceswap", "sdxl", "whisper"]
+    assert all(model.moves == ["cuda"] for model in models.values())
+    assert manager.entries["sdxl"].size_bytes == 6 * GB
+
+    manager.ensure_resident("sdxl")
+    assert models["sdxl"].moves == ["cuda"]
+    assert manager.hits == 1
+
+def test_lru_eviction_when_budget_exceeded(manager):
+    """Only the least recently used model is offloaded to make room"""
+    a, b, c = FakeModel(6), FakeModel(4), FakeModel(5)
+    manager.register("a", a)
+    manager.register("b", b)
+    manager.register("c", c)
+    manager.ensure_resident("a")
+    manager.ensure_resident("b")
+    manager.ensure_resident("a")  # b is now the LRU entry
+
+    manager.ensure_resident("c")
+    assert sorted(manager.resident_models()) == ["a", "c"]
+    assert b.device == "cpu"
+    assert a.moves == ["cuda"]
+
+def test_max_models_limit():
+    """max_models_in_vram caps residency regardless of free budget"""
+    manager = VRAMManager(budget_bytes=100 * GB, max_models=1, free_cache=lambda: None)
+    manager.register("sdxl", FakeModel(6))
+    manager.register("whisper", FakeModel(1))
+    manager.ensure_resident("sdxl")
+    manager.ensure_resident("whisper")
+    assert manager.resident_models() == ["whisper"]
+
+def test_idle_ttl_frees_memory(manager):
+    """Models idle for longer than the TTL are moved to CPU"""
+    model = FakeModel(1)
+    manager.register("whisper", model)
+    manager.ensure_resident("whisper")
+    manager.idle_ttl_seconds = 0.01
+    time.sleep(0.02)
+
+    assert manager.sweep_idle() == ["whisper"]
+    assert model.device == "cpu"
+    assert manager.used_bytes() == 0
+
+def test_acquire_resident_model_is_noop(manager):
+    """A lease on a resident model does not move it again"""
+    model = FakeModel(6)
+    manager.register("sdxl", model)
+    with manager.acquire("sdxl") as pipe:
+        assert pipe is model
+    with manager.acquire("sdxl"):
+        pass
+    assert model.moves == ["cuda"]
+
+def test_acquire_uses_registered_loader(manager):
+    """The loader builds and registers the model on its first lease"""
+    calls = []
+    def loader():
+        calls.append(1)
+        manager.register("whisper", FakeModel(1))
+
+    manager.register_loader("whisper", loader)
+    with manager.acquire("whisper"):
+        pass
+    with manager.acquire("whisper"):
+        pass
+    assert calls == [1]
+
+def test_pinned_model_is_not_evicted(manager):
+    """Eviction waits for the lease to be released instead of offloading mid-run"""
+    import threading
+    sdxl, faceswap = FakeModel(11), FakeModel(3)
+    manager.register("sdxl", sdxl)
+    manager.register("faceswap", faceswap, size_bytes=faceswap.vram_bytes)
+
+    inside = threading.Event()
+    release = threading.Event()
+
+    def run_inference():
+        with manager.acquire("sdxl"):
+            inside.set()
+            release.wait(5)
+            assert sdxl.device == "cuda"
+
+    worker = threading.Thread(target=run_inference)
+    worker.start()
+    inside.wait(5)
+
+    loader = threading.Thread(target=manager.ensure_resident, args=("faceswap",))
+    loader.start()
+    time.sleep(0.1)
+    assert sdxl.device == "cuda"
+    assert faceswap.device == "cpu"
+
+    release.set()
+    worker.join(5)
+    loader.join(5)
+    assert sdxl.device == "cpu"
+    assert faceswap.device == "cuda"
+    assert manager.pin_waits >= 1
+
+def test_idle_sweep_skips_pinned_models(manager):
+    """The idle TTL never offloads a model under lease"""
+    manager.register("sdxl", FakeModel(6))
+    manager.idle_ttl_seconds = 0.01
+    with manager.acquire("sdxl"):
+        time.sleep(0.02)
+        assert manager.sweep_idle() == []
+
+def test_activation_bytes_leaves_room_for_target_model(manager):
+    """Free activation memory counts resident models and the model about to run"""
+    manager.register("whisper", FakeModel(1))
+    manager.ensure_resident("whisper")
+
+    assert manager.activation_bytes() == 14 * GB
+    assert manager.activation_bytes("sdxl") == int(14 * GB - 6.5 * GB)
+
+def test_acquire_many_makes_room_for_both_models(manager):
+    """SDXL and its ControlNet are reserved together, evicting the LRU model once"""
+    sdxl, controlnet, faceswap = FakeModel(6), FakeModel(3), FakeModel(5)
+    manager.register("sdxl", sdxl)
+    manager.register("controlnet_canny", controlnet)
+    manager.register("faceswap", faceswap)
+    manager.ensure_resident("faceswap")
+
+    with manager.acquire_many(["sdxl", "controlnet_canny"]) as (pipe, net):
+        assert (pipe, net) == (sdxl, controlnet)
+        assert sorted(manager.resident_models()) == ["controlnet_canny", "sdxl"]
+        assert manager.entries["sdxl"].pins == manager.entries["controlnet_canny"].pins == 1
+    assert faceswap.device == "cpu"
+    assert manager.entries["sdxl"].pins == 0
+
+def test_acquire_many_does_not_wait_on_its_own_pins():
+    """Over budget, a joint lease loads anyway instead of waiting for a pin it holds itself"""
+    manager = VRAMManager(budget_bytes=13 * GB, free_cache=lambda: None, pin_wait_timeout=5)
+    manager.register("sdxl", FakeModel(11))
+    manager.register("controlnet_canny", FakeModel(3))
+
+    start = time.monotonic()
+    with manager.acquire_many(["sdxl", "controlnet_canny"]):
+        assert sorted(manager.resident_models()) == ["controlnet_canny", "sdxl"]
+    assert time.monotonic() - start < 1
+    assert manager.pin_waits == 0
@@ -0,0 +1,50 @@
+import pytest
+import threading
+import time
+from backend.services.worker_pool import WorkerPool, Stage, GPU_LANE, CPU_LANE
+
+@pytest.fixture
+def pool():
+    pool = WorkerPool(gpu_concurrency=1, cpu_concurrency=2)
+    pool.start()
+    yield pool
+    pool.shutdown()
+
+def test_stages_run_on_their_lanes(pool):
+    """Each stage runs on a thread of the lane it was routed to"""
+    def record(ctx):
+        ctx.setdefault('threads', []).append(threading.current_thread().name)
+
+    stages = [Stage('tts', CPU_LANE, record), Stage('infer', GPU_LANE, record), Stage('encode', CPU_LANE, record)]
+    ctx = pool.run_stages(stages, {}).result(timeout=5)
+
+    assert ctx['threads'][0].startswith('cpu-')
+    assert ctx['threads'][1].startswith('gpu-')
+    assert ctx['threads'][2].startswith('cpu-')
+
+def test_cpu_stage_not_blocked_by_gpu_stage(pool):
+    """A CPU stage completes while the GPU lane is busy"""
+    release = threading.Event()
+    gpu_future = pool.submit(GPU_LANE, release.wait, 5)
+    cpu_future = pool.submit(CPU_LANE, lambda: 'encoded')
+
+    assert cpu_future.result(timeout=2) == 'encoded'
+    assert not gpu_future.done()
+    release.set()
+    assert gpu_future.result(timeout=2) is True
+
+def test_failing_stage_stops_pipeline(pool):
+    """A failing stage propagates its error and skips later stages"""
+    def fail(ctx):
+        raise RuntimeError("ffmpeg failed")
+
+    def never(ctx):
+        ctx['ran'] = True
+
+    ctx = {}
+    future = pool.run_stages([Stage('encode', CPU_LANE, fail), Stage('finalize', CPU_LANE, never)], ctx)
+
+    with pytest.raises(RuntimeError):
+        future.result(timeout=5)
+    time.sleep(0.05)
+    assert 'ran' not in ctx
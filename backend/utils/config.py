@@ -0,0 +1,50 @@
+"""
+Carga de configuración del backend.
+Lee config.json (o config.example.json como fallback) y expone acceso por ruta con puntos.
+"""
+
+import os
+import json
+from typing import Any, Dict
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG_FILE = os.environ.get("FOADS_CONFIG", os.path.join(BASE_DIR, "config.json"))
+EXAMPLE_CONFIG_FILE = os.path.join(BASE_DIR, "config.example.json")
+
+_config = None
+
+def load_config() -> Dict:
+    """Carga la configuración desde disco (config.json o config.example.json)."""
+    for path in (CONFIG_FILE, EXAMPLE_CONFIG_FILE):
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"[!] Could not read config {path}: {e}")
+    return {}
+
+def get_config() -> Dict:
+    """Obtiene la configuración (cargada una sola vez)."""
+    global _config
+    if _config is None:
+        _config = load_config()
+    return _config
+
+def get_setting(path: str, default: Any = None) -> Any:
+    """
+    Obtiene un valor de configuración por ruta con puntos.
+
+    Args:
+        path: Ruta del valor (ej: 'vram.max_models_in_vram')
+        default: Valor si la ruta no existe o es null
+
+    Returns:
+        Valor configurado o default
+    """
+    node = get_config()
+    for part in path.split('.'):
+        if not isinstance(node, dict) or part not in node:
+            return default
+        node = node[part]
+    return default if node is None else node
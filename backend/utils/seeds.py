@@ -0,0 +1,49 @@
+"""
+Resolución de semillas para generaciones reproducibles.
+"""
+
+import random
+from typing import Any, List, Optional
+
+MAX_SEED = 2**32 - 1
+
+def _as_seed(value: Any) -> int:
+    try:
+        seed = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid seed: {value!r}")
+    if not 0 <= seed <= MAX_SEED:
+        raise ValueError(f"Seed out of range [0, {MAX_SEED}]: {seed}")
+    return seed
+
+def resolve_seeds(num_images: Any = None, seed: Any = None, seeds: Optional[List[Any]] = None,
+                  max_images: int = 4) -> List[int]:
+    """
+    Calcula la semilla de cada imagen de una petición.
+
+    Args:
+        num_images: Cantidad de imágenes (default: len(seeds) o 1)
+        seed: Semilla base; la imagen i usa seed + i
+        seeds: Semillas explícitas, una por imagen
+        max_images: Máximo de imágenes por petición
+
+    Returns:
+        Lista de semillas (aleatorias si no se indicó ninguna)
+    """
+    if seeds is not None:
+        if not isinstance(seeds, list) or not seeds:
+            raise ValueError("seeds must be a non-empty list")
+        seeds = [_as_seed(value) for value in seeds]
+
+    count = int(num_images) if num_images is not None else (len(seeds) if seeds else 1)
+    if not 1 <= count <= max_images:
+        raise ValueError(f"num_images must be between 1 and {max_images}")
+
+    if seeds is not None:
+        if len(seeds) != count:
+            raise ValueError(f"Expected {count} seeds, got {len(seeds)}")
+        return seeds
+    if seed is not None:
+        base = _as_seed(seed)
+        return [(base + index) % (MAX_SEED + 1) for index in range(count)]
+    return [random.randint(0, MAX_SEED) for _ in range(count)]